@@ -1,17 +1,23 @@
-import numpy as np
+from traffic_sources import InMemoryTrafficSource
 
 
 class AirTrafficData:
-    def __init__(self, traffic_data):
-        """ Traffic data expected in shape of (channels, traffic_length) """
-        self.number_of_channels = len(traffic_data)
-        self.number_of_timesteps = len(traffic_data[0])
-        self.traffic_data = np.array(traffic_data).T
+    def __init__(self, traffic_data=None, traffic_source=None):
+        """ Traffic data expected in shape of (channels, traffic_length), either nested lists or an array
+        such as the int8 arrays from traffic_generator, stored time major so each step is a contiguous row.
+        Alternatively pass a TrafficSource, e.g memory mapped or chunked, so the whole trace is never in memory """
+        assert((traffic_data is None) != (traffic_source is None))
+        if traffic_source is None:
+            traffic_source = InMemoryTrafficSource(traffic_data)
+            self.traffic_data = traffic_source.traffic_data
+        self.traffic_source = traffic_source
+        self.number_of_channels = traffic_source.number_of_channels
+        self.number_of_timesteps = traffic_source.number_of_timesteps
         self.time_step = 0
 
     def get_current_traffic(self):
         """ Has side effect of incrementing time by 1"""
-        current_traffic = self.traffic_data[self.time_step]
+        current_traffic = self.traffic_source.get_traffic_at(self.time_step)
         if self.time_step < self.number_of_timesteps:
             self.time_step += 1
         return current_traffic
@@ -0,0 +1,155 @@
+import numpy as np
+import random
+import unittest
+from coop_controller import CoopController
+
+'''Channel Occupancy Constants'''
+EMPTY = 0
+OCCUPIED = 1
+UNKNOWN = 2
+
+
+class BatchedCoopController:
+    def __init__(self, number_of_cells, number_of_radio_units, number_of_channels, max_channel_cache_size, min_channel_cache_size, random_switch_step=10, random_seeds=None):
+        """ Steps number_of_cells independent CoopControllers at once, state is held as arrays:
+        radio_unit_channels (cells, radio units), channel_caches (cells, max_channel_cache_size, channels) int8
+        and per cell cache_sizes and number_of_smart_switches.
+        Caches flush when full, like ChannelCaches. random_seeds gives each cell its own random.Random,
+        otherwise random smart switches draw from the global random module in cell order """
+        assert(number_of_radio_units <= number_of_channels)
+        assert(max_channel_cache_size % number_of_channels == 0)
+        assert(max_channel_cache_size % min_channel_cache_size == 0)
+        self.number_of_cells = number_of_cells
+        self.number_of_radio_units = number_of_radio_units
+        self.number_of_channels = number_of_channels
+        self.max_channel_cache_size = max_channel_cache_size
+        self.min_channel_cache_size = min_channel_cache_size
+        self.random_switch_step = random_switch_step
+        self.monitored_radio_unit = 0
+
+        self.cells = np.arange(number_of_cells)
+        self.radio_unit_channels = np.tile(np.arange(number_of_radio_units), (number_of_cells, 1))
+        self.channel_caches = np.full(
+            (number_of_cells, max_channel_cache_size, number_of_channels), UNKNOWN, dtype=np.int8)
+        self.cache_sizes = np.zeros(number_of_cells, dtype=np.int64)
+        self.number_of_smart_switches = np.zeros(number_of_cells, dtype=np.int64)
+        if random_seeds is None:
+            self.random_generators = [random] * number_of_cells
+        else:
+            self.random_generators = [random.Random(random_seed) for random_seed in random_seeds]
+
+    def step(self, current_traffic):
+        """ Expects current_traffic as (cells, channels). Senses, appends to every cache and switches,
+        returns (joint channel values (cells, channels), smart_switched (cells,)) """
+        joint_channel_values = self.get_joint_channel_values(current_traffic)
+        self.add_joint_channel_values_to_caches(joint_channel_values)
+        smart_switched = self.trigger_radio_unit_switching(joint_channel_values)
+        return joint_channel_values, smart_switched
+
+    def get_joint_channel_values(self, current_traffic):
+        """ Sensed values on every radio unit channel, UNKNOWN elsewhere """
+        joint_channel_values = np.full((self.number_of_cells, self.number_of_channels), UNKNOWN, dtype=np.int8)
+        cell_index = self.cells[:, None]
+        joint_channel_values[cell_index, self.radio_unit_channels] = np.asarray(
+            current_traffic)[cell_index, self.radio_unit_channels]
+        return joint_channel_values
+
+    def add_joint_channel_values_to_caches(self, joint_channel_values):
+        self.cache_sizes[self.cache_sizes == self.max_channel_cache_size] = 0
+        self.channel_caches[self.cells, self.cache_sizes] = joint_channel_values
+        self.cache_sizes += 1
+
+    def trigger_radio_unit_switching(self, joint_channel_values):
+        """ Per cell, the same decision as CoopController.trigger_radio_unit_switching """
+        smart_switch_period = self.cache_sizes >= self.min_channel_cache_size
+        self.number_of_smart_switches[smart_switch_period] += 1
+        self.number_of_smart_switches[~smart_switch_period] = 0
+        self.radio_unit_channels[~smart_switch_period] = (
+            self.radio_unit_channels[~smart_switch_period] + 1) % self.number_of_channels
+
+        active_channels = self.radio_unit_channels[:, self.monitored_radio_unit]
+        active_channel_states = joint_channel_values[self.cells, active_channels]
+        smart_switching_cells = np.flatnonzero(smart_switch_period & (active_channel_states == OCCUPIED))
+        random_switch = self.number_of_smart_switches[smart_switching_cells] % self.random_switch_step == 0
+
+        best_channels = np.empty(len(smart_switching_cells), dtype=np.int64)
+        for i in np.flatnonzero(random_switch):
+            best_channels[i] = self.random_generators[smart_switching_cells[i]].randint(0, self.number_of_channels - 1)
+        best_channels[~random_switch] = self.find_best_channels_to_switch_to(
+            smart_switching_cells[~random_switch], joint_channel_values)
+        self.__swap_radio_unit_channels(smart_switching_cells, best_channels)
+        return smart_switch_period
+
+    def find_best_channels_to_switch_to(self, cells, joint_channel_values):
+        """ Vectorized SwitchController.find_best_channel_to_switch_to for the given cells """
+        channel_caches = self.channel_caches[cells]
+        cell_joint_channel_values = joint_channel_values[cells]
+        valid_rows = np.arange(self.max_channel_cache_size) < self.cache_sizes[cells][:, None]
+        matching_rows = np.all(channel_caches == cell_joint_channel_values[:, None, :], axis=2) & valid_rows
+        denominators = np.count_nonzero(matching_rows, axis=1)
+        numerators = np.einsum("ks,ksc->kc", (matching_rows[:, :-1] & valid_rows[:, 1:]).astype(np.int64),
+                               (channel_caches[:, 1:] == EMPTY).astype(np.int64))
+        conditional_probabilities = np.divide(numerators, denominators[:, None], out=np.zeros(numerators.shape),
+                                              where=denominators[:, None] != 0)
+
+        unknown_channel_probabilities = np.where(
+            cell_joint_channel_values == UNKNOWN, conditional_probabilities, 0)
+        best_channels = np.argmax(unknown_channel_probabilities, axis=1)
+        has_probable_channel = unknown_channel_probabilities[np.arange(len(cells)), best_channels] > 0
+        best_channels = np.where(has_probable_channel, best_channels,
+                                 self.radio_unit_channels[cells, self.monitored_radio_unit])
+
+        empty_channels = cell_joint_channel_values == EMPTY
+        has_empty_channel = empty_channels.any(axis=1)
+        return np.where(has_empty_channel, np.argmax(empty_channels, axis=1), best_channels)
+
+    def __swap_radio_unit_channels(self, cells, best_channels):
+        """ The radio unit owning best channel, if any, takes the active radio unit's channel """
+        current_channels = self.radio_unit_channels[cells, self.monitored_radio_unit]
+        owners = self.radio_unit_channels[cells] == best_channels[:, None]
+        has_owner = owners.any(axis=1)
+        owner_units = np.argmax(owners, axis=1)
+        self.radio_unit_channels[cells[has_owner], owner_units[has_owner]] = current_channels[has_owner]
+        self.radio_unit_channels[cells, self.monitored_radio_unit] = best_channels
+
+
+class TestBatchedCoopController(unittest.TestCase):
+    def setUp(self):
+        self.number_of_cells = 6
+        self.number_of_radio_units = 2
+        self.number_of_channels = 6
+        self.max_channel_cache_size = 42
+        self.min_channel_cache_size = 7
+
+    def test_step_matches_individual_coop_controllers(self):
+        batched_coop_controller = BatchedCoopController(
+            self.number_of_cells, self.number_of_radio_units, self.number_of_channels,
+            self.max_channel_cache_size, self.min_channel_cache_size, random_seeds=range(self.number_of_cells))
+        coop_controllers = [CoopController(self.number_of_radio_units, self.number_of_channels,
+                                           self.max_channel_cache_size, self.min_channel_cache_size,
+                                           switch_options={"random_seed": cell})
+                            for cell in range(self.number_of_cells)]
+        traffic_generator = np.random.default_rng(11)
+
+        for _ in range(150):
+            current_traffic = traffic_generator.integers(0, 2, (self.number_of_cells, self.number_of_channels))
+            _, smart_switched = batched_coop_controller.step(current_traffic)
+            for cell, coop_controller in enumerate(coop_controllers):
+                sensed_channel_values = coop_controller.get_current_sensed_channel_values_from_radio_units(
+                    current_traffic[cell])
+                coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+                self.assertEqual(coop_controller.trigger_radio_unit_switching(sensed_channel_values),
+                                 smart_switched[cell])
+                self.assertEqual([radio_unit.sensing_channel for radio_unit in coop_controller.radio_units],
+                                 list(batched_coop_controller.radio_unit_channels[cell]))
+                self.assertEqual(coop_controller.channel_caches.size, batched_coop_controller.cache_sizes[cell])
+
+    def test_immediate_switch_all_radio_unit_channels(self):
+        batched_coop_controller = BatchedCoopController(
+            self.number_of_cells, self.number_of_radio_units, self.number_of_channels,
+            self.max_channel_cache_size, self.min_channel_cache_size)
+        current_traffic = np.ones((self.number_of_cells, self.number_of_channels), dtype=np.int8)
+        for _ in range(self.number_of_channels - 1):
+            batched_coop_controller.step(current_traffic)
+        np.testing.assert_array_equal(batched_coop_controller.radio_unit_channels[:, 0], self.number_of_channels - 1)
+        np.testing.assert_array_equal(batched_coop_controller.radio_unit_channels[:, 1], 0)
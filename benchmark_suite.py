@@ -0,0 +1,241 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+from channel_caches import UNKNOWN, ChannelCaches
+from coop_controller import CoopController
+from switch_controller import SwitchController
+
+DEFAULT_CHANNEL_COUNTS = [8, 64, 1024]
+DEFAULT_CACHE_SIZES = [32, 1024, 65536]
+DEFAULT_CACHE_OPTIONS = {"ring_buffer": True, "evict_oldest": True}
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+def latency_summary(latencies_ns):
+    """ Ticks (calls) per second and latency percentiles in microseconds for a list of per call timings """
+    latencies_us = np.asarray(latencies_ns, dtype=np.float64) / 1000
+    summary = {"calls": len(latencies_us), "ticks_per_second": 1e6 / latencies_us.mean()}
+    for percentile in LATENCY_PERCENTILES:
+        summary["latency_p%d_us" % percentile] = float(np.percentile(latencies_us, percentile))
+    summary["latency_max_us"] = float(latencies_us.max())
+    return summary
+
+
+def time_calls(call, max_calls, max_seconds):
+    """ Times call() until max_calls calls or max_seconds have been spent, at least once """
+    latencies_ns = []
+    deadline = time.perf_counter() + max_seconds
+    while len(latencies_ns) < max_calls and (not latencies_ns or time.perf_counter() < deadline):
+        start = time.perf_counter_ns()
+        call()
+        latencies_ns.append(time.perf_counter_ns() - start)
+    return latencies_ns
+
+
+def random_sensed_channel_values(random_generator, number_of_channels, number_of_radio_units):
+    sensed_channels = random_generator.choice(number_of_channels, number_of_radio_units, replace=False)
+    return {int(channel): int(random_generator.integers(0, 2)) for channel in sensed_channels}
+
+
+def filled_channel_caches(random_generator, number_of_channels, cache_size, number_of_radio_units, cache_options):
+    channel_caches = ChannelCaches(number_of_channels, cache_size, **cache_options)
+    for _ in range(cache_size):
+        channel_caches.add_all_current_channel_values_to_cache(
+            random_sensed_channel_values(random_generator, number_of_channels, number_of_radio_units))
+    return channel_caches
+
+
+def latest_joint_channel_value_map(channel_caches):
+    return {channel: int(value) for channel, value in enumerate(channel_caches.channel_caches[-1])}
+
+
+def benchmark_cache_append(random_generator, number_of_channels, cache_size, arguments):
+    channel_caches = filled_channel_caches(
+        random_generator, number_of_channels, cache_size, arguments.radio_units, arguments.cache_options)
+    sensed_channel_values = [random_sensed_channel_values(random_generator, number_of_channels, arguments.radio_units)
+                             for _ in range(64)]
+    calls = iter(range(sys.maxsize))
+    return time_calls(lambda: channel_caches.add_all_current_channel_values_to_cache(
+        sensed_channel_values[next(calls) % 64]), arguments.max_calls, arguments.max_seconds)
+
+
+def benchmark_conditional_probability(random_generator, number_of_channels, cache_size, arguments):
+    channel_caches = filled_channel_caches(
+        random_generator, number_of_channels, cache_size, arguments.radio_units, arguments.cache_options)
+    switch_controller = SwitchController(**arguments.switch_options)
+    joint_channel_value_map = latest_joint_channel_value_map(channel_caches)
+    channel_to_check = int(np.flatnonzero(channel_caches.channel_caches[-1] == UNKNOWN)[0])
+    return time_calls(lambda: switch_controller.calculate_conditional_probability(
+        channel_to_check, joint_channel_value_map, channel_caches.channel_caches, channel_caches),
+        arguments.max_calls, arguments.max_seconds)
+
+
+def benchmark_find_best_channel(random_generator, number_of_channels, cache_size, arguments):
+    channel_caches = filled_channel_caches(
+        random_generator, number_of_channels, cache_size, arguments.radio_units, arguments.cache_options)
+    switch_controller = SwitchController(**arguments.switch_options)
+    # all sensed channels OCCUPIED so no EMPTY passive channel short circuits the search
+    channel_caches.add_all_current_channel_values_to_cache(
+        {channel: 1 for channel in random_sensed_channel_values(random_generator, number_of_channels, arguments.radio_units)})
+    joint_channel_value_map = latest_joint_channel_value_map(channel_caches)
+    return time_calls(lambda: switch_controller.find_best_channel_to_switch_to(
+        0, joint_channel_value_map, channel_caches.channel_caches, number_of_channels, channel_caches),
+        arguments.max_calls, arguments.max_seconds)
+
+
+def benchmark_find_best_channel_anytime(random_generator, number_of_channels, cache_size, arguments):
+    """ Times the sampled anytime search under --anytime-row-budget / --anytime-time-budget over joint maps taken from
+    the cache, and reports how often it picks the same channel as the exact scan and the mean rows it examined """
+    channel_caches = filled_channel_caches(
+        random_generator, number_of_channels, cache_size, arguments.radio_units, arguments.cache_options)
+    exact_switch_controller = SwitchController(vectorized=True)
+    anytime_switch_controller = SwitchController(random_seed=arguments.seed)
+    cache_rows = channel_caches.channel_caches
+    # sensed EMPTY values read as OCCUPIED so no EMPTY channel short circuits either search
+    joint_channel_values = [np.where(cache_row == 0, 1, cache_row).astype(np.int8)
+                            for cache_row in cache_rows[random_generator.integers(0, len(cache_rows), 64)]]
+    rows_examined = []
+    agreements = []
+
+    def find_best_channel(joint_channel_value_map):
+        best_channel, examined = anytime_switch_controller.find_best_channel_to_switch_to_anytime(
+            0, joint_channel_value_map, cache_rows, number_of_channels,
+            row_budget=arguments.anytime_row_budget, time_budget=arguments.anytime_time_budget)
+        rows_examined.append(examined)
+        return best_channel
+
+    for joint_channel_value_map in joint_channel_values:
+        agreements.append(find_best_channel(joint_channel_value_map) == exact_switch_controller.find_best_channel_to_switch_to(
+            0, joint_channel_value_map, cache_rows, number_of_channels))
+    calls = iter(range(sys.maxsize))
+    latencies_ns = time_calls(lambda: find_best_channel(joint_channel_values[next(calls) % 64]),
+                              arguments.max_calls, arguments.max_seconds)
+    return latencies_ns, {"agreement_with_exact": float(np.mean(agreements)),
+                          "mean_rows_examined": float(np.mean(rows_examined))}
+
+
+def benchmark_coop_controller_tick(random_generator, number_of_channels, cache_size, arguments):
+    coop_controller = CoopController(arguments.radio_units, number_of_channels, cache_size, min(32, cache_size),
+                                     cache_options=arguments.cache_options, switch_options=arguments.switch_options)
+    traffic = random_generator.integers(0, 2, (256, number_of_channels), dtype=np.int8)
+    calls = iter(range(sys.maxsize))
+
+    def tick():
+        current_traffic = traffic[next(calls) % len(traffic)]
+        sensed_channel_values = coop_controller.get_current_sensed_channel_values_from_radio_units(current_traffic)
+        coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+        coop_controller.trigger_radio_unit_switching(sensed_channel_values)
+
+    for _ in range(cache_size):
+        coop_controller.add_all_current_channel_values_to_cache_including_unknowns(
+            random_sensed_channel_values(random_generator, number_of_channels, arguments.radio_units))
+    return time_calls(tick, arguments.max_calls, arguments.max_seconds)
+
+
+def benchmark_coop_controller_step(random_generator, number_of_channels, cache_size, arguments):
+    """ The same tick as coop_controller_tick through the fused CoopController.step """
+    coop_controller = CoopController(arguments.radio_units, number_of_channels, cache_size, min(32, cache_size),
+                                     cache_options=arguments.cache_options, switch_options=arguments.switch_options)
+    traffic = random_generator.integers(0, 2, (256, number_of_channels), dtype=np.int8)
+    calls = iter(range(sys.maxsize))
+    for _ in range(cache_size):
+        coop_controller.add_all_current_channel_values_to_cache_including_unknowns(
+            random_sensed_channel_values(random_generator, number_of_channels, arguments.radio_units))
+    return time_calls(lambda: coop_controller.step(traffic[next(calls) % len(traffic)]),
+                      arguments.max_calls, arguments.max_seconds)
+
+
+BENCHMARKS = {
+    "cache_append": benchmark_cache_append,
+    "conditional_probability": benchmark_conditional_probability,
+    "find_best_channel": benchmark_find_best_channel,
+    "find_best_channel_anytime": benchmark_find_best_channel_anytime,
+    "coop_controller_tick": benchmark_coop_controller_tick,
+    "coop_controller_step": benchmark_coop_controller_step,
+}
+
+
+def run_benchmark_suite(arguments):
+    """ Runs every benchmark over the channel count and cache size grid.
+    A benchmark returns its per call latencies, or (latencies, extra result fields).
+    Once a call takes longer than max_seconds, larger caches for that benchmark and channel count are skipped """
+    results = []
+    for benchmark_name in arguments.benchmarks:
+        for number_of_channels in arguments.channels:
+            too_slow = False
+            for cache_size in arguments.cache_sizes:
+                result = {"benchmark": benchmark_name, "number_of_channels": number_of_channels, "cache_size": cache_size}
+                if too_slow or cache_size % number_of_channels != 0 or arguments.radio_units > number_of_channels:
+                    result["skipped"] = True
+                else:
+                    random_generator = np.random.default_rng(arguments.seed)
+                    latencies_ns = BENCHMARKS[benchmark_name](random_generator, number_of_channels, cache_size, arguments)
+                    if isinstance(latencies_ns, tuple):
+                        latencies_ns, extra_results = latencies_ns
+                        result.update(extra_results)
+                    result.update(latency_summary(latencies_ns))
+                    too_slow = max(latencies_ns) > arguments.max_seconds * 1e9
+                results.append(result)
+                print(json.dumps(result), flush=True)
+    return {"metadata": benchmark_metadata(arguments), "results": results}
+
+
+def benchmark_metadata(arguments):
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "radio_units": arguments.radio_units, "cache_options": arguments.cache_options,
+            "switch_options": arguments.switch_options, "seed": arguments.seed,
+            "anytime_row_budget": arguments.anytime_row_budget, "anytime_time_budget": arguments.anytime_time_budget}
+
+
+def compare_to_baseline(benchmark_results, baseline_results, tolerance):
+    """ Returns the results whose ticks per second fell more than tolerance below the stored baseline """
+    baseline_by_key = {(result["benchmark"], result["number_of_channels"], result["cache_size"]): result
+                       for result in baseline_results["results"] if not result.get("skipped")}
+    regressions = []
+    for result in benchmark_results["results"]:
+        baseline = baseline_by_key.get((result["benchmark"], result["number_of_channels"], result["cache_size"]))
+        if result.get("skipped") or baseline is None:
+            continue
+        speedup = result["ticks_per_second"] / baseline["ticks_per_second"]
+        print("%s channels=%d cache=%d speedup vs baseline: %.2fx" % (
+            result["benchmark"], result["number_of_channels"], result["cache_size"], speedup))
+        if speedup < 1 - tolerance:
+            regressions.append(dict(result, baseline_ticks_per_second=baseline["ticks_per_second"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the channel cache, predictor and full CoopController tick")
+    parser.add_argument("--benchmarks", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument("--channels", nargs="+", type=int, default=DEFAULT_CHANNEL_COUNTS)
+    parser.add_argument("--cache-sizes", nargs="+", type=int, default=DEFAULT_CACHE_SIZES)
+    parser.add_argument("--radio-units", type=int, default=2)
+    parser.add_argument("--cache-options", type=json.loads, default=DEFAULT_CACHE_OPTIONS)
+    parser.add_argument("--switch-options", type=json.loads, default={})
+    parser.add_argument("--anytime-row-budget", type=int, help="cache rows find_best_channel_anytime may examine")
+    parser.add_argument("--anytime-time-budget", type=float, help="seconds find_best_channel_anytime may spend")
+    parser.add_argument("--max-calls", type=int, default=1000)
+    parser.add_argument("--max-seconds", type=float, default=2.0, help="time budget per grid point")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="stored benchmark results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    arguments = parser.parse_args()
+
+    benchmark_results = run_benchmark_suite(arguments)
+    with open(arguments.output, "w") as output_file:
+        json.dump(benchmark_results, output_file, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            regressions = compare_to_baseline(benchmark_results, json.load(baseline_file), arguments.tolerance)
+        print("REGRESSIONS: ", len(regressions))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
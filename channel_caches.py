@@ -1,5 +1,8 @@
 import numpy as np
 import unittest
+from decayed_transition_statistics import DEFAULT_MAX_DECAYED_STATES, DecayedTransitionStatistics
+from history_index import VariableOrderHistoryIndex
+from transition_index import JointStateTransitionIndex, StateChangeTracker
 
 '''Channel Occupancy Constants'''
 EMPTY = 0
@@ -7,38 +10,215 @@ OCCUPIED = 1
 UNKNOWN = 2
 
 
+def joint_channel_values_from_map(joint_channel_value_map, number_of_channels):
+    """ int8 (channels,) joint state vector of a {channel : value} map, UNKNOWN for channels missing from it """
+    joint_channel_values = np.full(number_of_channels, UNKNOWN, dtype=np.int8)
+    for channel, value in joint_channel_value_map.items():
+        joint_channel_values[channel] = value
+    return joint_channel_values
+
+
 class ChannelCaches:
-    def __init__(self, number_of_channels, max_size):
+    def __init__(self, number_of_channels, max_size, ring_buffer=False, evict_oldest=False, transition_index=False, decay_half_life=None, max_decayed_states=DEFAULT_MAX_DECAYED_STATES, history_order=None, history_min_support=1):
+        """ ring_buffer stores rows in a preallocated (max_size, channels) int8 array instead of growing with np.vstack.
+        evict_oldest (ring_buffer only) overwrites the oldest row once full instead of flushing the whole cache.
+        transition_index keeps a JointStateTransitionIndex up to date so next step EMPTY counts are a lookup.
+        decay_half_life (ring_buffer only) answers next step EMPTY counts from DecayedTransitionStatistics instead,
+        with max_decayed_states tracked at most, and evicts the oldest row once full so the cache never drops below min size.
+        history_order keeps a VariableOrderHistoryIndex so next step EMPTY counts condition on up to that many ticks,
+        backing off to shorter histories seen fewer than history_min_support times.
+        generation is bumped on every append and flush, flush_generation remembers the last flush,
+        state_generation gives the generation a joint state's answer last changed once track_state_changes is called """
+        assert(ring_buffer or not (evict_oldest or decay_half_life))
         self.number_of_channels = number_of_channels
-        self.channel_caches = self.__init_channel_caches()
-        self.size = 0
         self.max_size = max_size
+        self.ring_buffer = ring_buffer
+        self.evict_oldest = evict_oldest or decay_half_life is not None
+        self.head = 0
+        self.size = 0
+        self.generation = 0
+        self.flush_generation = 0
+        self.state_change_tracker = None
+        self.__channel_caches = self.__init_channel_caches()
+        self.transition_index = JointStateTransitionIndex(
+            number_of_channels) if transition_index else None
+        self.decayed_statistics = DecayedTransitionStatistics(
+            number_of_channels, decay_half_life, max_decayed_states) if decay_half_life is not None else None
+        self.history_index = VariableOrderHistoryIndex(
+            number_of_channels, history_order, history_min_support) if history_order is not None else None
 
     def __init_channel_caches(self):
+        if self.ring_buffer:
+            return np.full((self.max_size, self.number_of_channels), UNKNOWN, dtype=np.int8)
         return np.empty(shape=(0, self.number_of_channels))
 
+    @property
+    def channel_caches(self):
+        """ Cache rows in chronological order, oldest first """
+        if self.ring_buffer:
+            return self.get_chronological_view()
+        return self.__channel_caches
+
+    def get_chronological_view(self):
+        """ Ring buffer rows ordered oldest to newest,
+        a view when the stored rows are contiguous, otherwise a copy """
+        end = self.head + self.size
+        if end <= self.max_size:
+            return self.__channel_caches[self.head:end]
+        return np.concatenate((self.__channel_caches[self.head:], self.__channel_caches[:end - self.max_size]))
+
     def flush_cache(self):
-        self.channel_caches = self.__init_channel_caches()
+        if self.ring_buffer:
+            self.head = 0
+        else:
+            self.__channel_caches = self.__init_channel_caches()
         self.size = 0
+        if self.transition_index is not None:
+            self.transition_index.clear()
+        if self.decayed_statistics is not None:
+            self.decayed_statistics.clear()
+        if self.history_index is not None:
+            self.history_index.clear()
+        self.generation += 1
+        self.flush_generation = self.generation
+        if self.state_change_tracker is not None:
+            self.state_change_tracker = StateChangeTracker(self.generation)
+
+    def track_state_changes(self):
+        """ Starts keeping per joint state change generations, see StateChangeTracker. Not available when decayed
+        statistics or a history index answer, their answers also move with the decay or the preceding rows """
+        if self.state_change_tracker is None and self.decayed_statistics is None and self.history_index is None:
+            self.state_change_tracker = StateChangeTracker(self.generation)
+
+    def state_generation(self, joint_state_key):
+        """ Generation at which the answer for the int8 joint state bytes joint_state_key last changed, None if not tracked """
+        if self.state_change_tracker is None:
+            return None
+        return self.state_change_tracker.state_generation(joint_state_key)
+
+    def restore_rows(self, cache_rows, decayed_statistics_state=None):
+        """ Replaces the cache contents with (rows, channels) cache_rows, oldest first, e.g from a checkpoint.
+        The transition index is rebuilt from the restored rows in bulk and the history index by replaying them.
+        Decayed statistics remember rows older than any window, so they are restored from decayed_statistics_state,
+        as returned by DecayedTransitionStatistics.state_arrays, and only rebuilt from the rows without one """
+        assert(len(cache_rows) <= self.max_size)
+        self.flush_cache()
+        if self.ring_buffer:
+            self.__channel_caches[:len(cache_rows)] = cache_rows
+        else:
+            self.__channel_caches = np.array(cache_rows, dtype=np.float64).reshape(-1, self.number_of_channels)
+        self.size = len(cache_rows)
+        if self.transition_index is not None:
+            self.transition_index.add_rows(self.channel_caches)
+        if self.decayed_statistics is not None and decayed_statistics_state is not None:
+            self.decayed_statistics.restore_state_arrays(*decayed_statistics_state)
+        for index in (self.decayed_statistics if decayed_statistics_state is None else None, self.history_index):
+            if index is not None:
+                for cache_row in self.channel_caches:
+                    index.add_row(cache_row)
+        self.generation += 1
+
+    def evict_oldest_row(self):
+        """ Drops only the oldest ring buffer row, as part of an append """
+        if self.state_change_tracker is not None and self.size > 1:
+            self.state_change_tracker.mark_transition(
+                self.__channel_caches[self.head], self.__channel_caches[(self.head + 1) % self.max_size], self.generation + 1)
+        if self.transition_index is not None:
+            next_cache_row = self.__channel_caches[(self.head + 1) % self.max_size] if self.size > 1 else None
+            self.transition_index.remove_oldest_row(self.__channel_caches[self.head], next_cache_row)
+        if self.history_index is not None:
+            self.history_index.remove_oldest_row()
+        self.head = (self.head + 1) % self.max_size
+        self.size -= 1
 
     def cache_shape(self):
-        return self.channel_caches.shape
+        if self.ring_buffer:
+            return (self.size, self.number_of_channels)
+        return self.__channel_caches.shape
 
     def add_all_current_channel_values_to_cache(self, sensed_channel_values):
         """ Expects sensed_channel_values as dict {channel : sensed_value}.
-        Flushes Cache when it reaches max_size.
+        Flushes Cache when it reaches max_size, or evicts the oldest row when evict_oldest is set.
         Appends all the current channel values to the end of channel_caches, includes unknown values and sensed values """
+        self.add_joint_channel_values_to_cache(joint_channel_values_from_map(sensed_channel_values, self.number_of_channels))
+
+    def add_joint_channel_values_to_cache(self, joint_channel_values):
+        """ Same as add_all_current_channel_values_to_cache for an int8 (channels,) joint state vector,
+        UNKNOWN for unsensed channels. Ring buffer rows are copied in place without allocating """
+        self.__make_room_for_row()
+        if self.ring_buffer:
+            new_cache_row = self.__channel_caches[(self.head + self.size) % self.max_size]
+            np.copyto(new_cache_row, joint_channel_values)
+        else:
+            self.__channel_caches = np.vstack([self.__channel_caches, joint_channel_values])
+            new_cache_row = self.__channel_caches[-1]
+        self.__row_added(new_cache_row)
+
+    def add_sensed_values_to_cache(self, sensing_channels, sensed_values):
+        """ Same as add_joint_channel_values_to_cache for the joint state vector of sensed_values on sensing_channels,
+        which a ring buffer writes straight into its new row. Returns that int8 joint state vector,
+        for a ring buffer the new row itself, so it is only valid until the next append """
+        if not self.ring_buffer:
+            joint_channel_values = np.full(self.number_of_channels, UNKNOWN, dtype=np.int8)
+            joint_channel_values[sensing_channels] = sensed_values
+            self.add_joint_channel_values_to_cache(joint_channel_values)
+            return joint_channel_values
+        self.__make_room_for_row()
+        new_cache_row = self.__channel_caches[(self.head + self.size) % self.max_size]
+        new_cache_row.fill(UNKNOWN)
+        new_cache_row[sensing_channels] = sensed_values
+        self.__row_added(new_cache_row)
+        return new_cache_row
+
+    def __make_room_for_row(self):
         if self.size == self.max_size:
-            self.flush_cache()
-
-        new_cache_row = np.zeros((1, self.number_of_channels))
-        for channel, sensed_value in sensed_channel_values.items():
-            new_cache_row[0][channel] = sensed_value
-        for channel in range(self.number_of_channels):
-            if channel not in sensed_channel_values.keys():
-                new_cache_row[0][channel] = UNKNOWN
-        self.channel_caches = np.vstack([self.channel_caches, new_cache_row])
+            if self.evict_oldest:
+                self.evict_oldest_row()
+            else:
+                self.flush_cache()
+
+    def __row_added(self, new_cache_row):
+        if self.state_change_tracker is not None and self.size > 0:
+            latest_cache_row = self.__channel_caches[(self.head + self.size - 1) % self.max_size] \
+                if self.ring_buffer else self.__channel_caches[self.size - 1]
+            self.state_change_tracker.mark_transition(latest_cache_row, new_cache_row, self.generation + 1)
+        if self.transition_index is not None:
+            self.transition_index.add_row(new_cache_row)
+        if self.decayed_statistics is not None:
+            self.decayed_statistics.add_row(new_cache_row)
+        if self.history_index is not None:
+            self.history_index.add_row(new_cache_row)
         self.size += 1
+        self.generation += 1
+
+    def next_step_empty_counts(self, joint_channel_value_map):
+        """ Returns (matching rows, per channel next step EMPTY counts) for the joint map, decayed weights in decay mode,
+        or None when there is no index to answer from and the rows must be scanned """
+        if self.decayed_statistics is not None:
+            return self.decayed_statistics.next_step_empty_counts(joint_channel_value_map)
+        if self.history_index is not None:
+            return self.history_index.next_step_empty_counts(joint_channel_value_map)
+        if self.transition_index is None:
+            return None
+        return self.transition_index.next_step_empty_counts(joint_channel_value_map)
+
+    def scan_next_step_empty_counts(self, joint_channel_values):
+        """ Same counts as SwitchController.count_next_step_empty_values from a scan over the stored rows,
+        for an int8 joint state vector. Rows are matched whole through a void view of their bytes,
+        and ring buffer rows where they lie, without putting them in chronological order """
+        stored_rows = self.__channel_caches
+        row_key_dtype = np.dtype((np.void, stored_rows.dtype.itemsize * self.number_of_channels))
+        row_keys = stored_rows.view(row_key_dtype).ravel()
+        joint_key = np.asarray(joint_channel_values, dtype=stored_rows.dtype).view(row_key_dtype)[0]
+        end = self.head + self.size
+        if end <= len(stored_rows):
+            matching_ages = np.flatnonzero(row_keys[self.head:end] == joint_key)
+        else:
+            # a wrapped ring buffer, a row's age is its distance from the oldest row at head
+            matching_ages = (np.flatnonzero(row_keys == joint_key) - self.head) % self.max_size
+            matching_ages = matching_ages[matching_ages < self.size]
+        next_rows = stored_rows[(matching_ages[matching_ages < self.size - 1] + self.head + 1) % self.max_size]
+        return len(matching_ages), np.add.reduce(next_rows == EMPTY, axis=0, dtype=np.int64)
 
 
 class TestChannelCaches(unittest.TestCase):
@@ -85,3 +265,112 @@ class TestChannelCaches(unittest.TestCase):
                         self.channel_caches.max_size)
         self.assertTrue(len(self.channel_caches.channel_caches)
                         < self.channel_caches.max_size)
+
+
+class TestRingBufferChannelCaches(unittest.TestCase):
+    def setUp(self):
+        self.number_of_channels = 4
+        self.max_size = 5
+        self.channel_caches = ChannelCaches(
+            self.number_of_channels, self.max_size, ring_buffer=True)
+
+    def test_ring_buffer_init(self):
+        self.assertEqual(self.channel_caches.cache_shape(), (0, self.number_of_channels))
+        self.assertEqual(len(self.channel_caches.channel_caches), 0)
+
+    def test_add_all_current_channel_values_to_ring_buffer(self):
+        self.channel_caches.add_all_current_channel_values_to_cache({0: 1, 2: 0})
+        self.assertEqual(self.channel_caches.size, 1)
+        self.assertEqual(self.channel_caches.channel_caches.dtype, np.int8)
+        self.assertEqual(list(self.channel_caches.channel_caches[-1]), [1, UNKNOWN, 0, UNKNOWN])
+
+    def test_ring_buffer_flushes_when_full(self):
+        for i in range(self.max_size + 2):
+            self.channel_caches.add_all_current_channel_values_to_cache({0: i % 2})
+        self.assertEqual(self.channel_caches.size, 2)
+        self.assertEqual(len(self.channel_caches.channel_caches), 2)
+
+    def test_ring_buffer_evicts_oldest_row_in_chronological_order(self):
+        channel_caches = ChannelCaches(
+            self.number_of_channels, self.max_size, ring_buffer=True, evict_oldest=True)
+        legacy_channel_caches = ChannelCaches(self.number_of_channels, self.max_size + 3)
+        for i in range(self.max_size + 3):
+            sensed_channel_value_map = {i % self.number_of_channels: i % 2}
+            channel_caches.add_all_current_channel_values_to_cache(sensed_channel_value_map)
+            legacy_channel_caches.add_all_current_channel_values_to_cache(sensed_channel_value_map)
+
+        self.assertEqual(channel_caches.size, self.max_size)
+        np.testing.assert_array_equal(
+            channel_caches.channel_caches, legacy_channel_caches.channel_caches[-self.max_size:])
+
+    def test_transition_index_follows_evictions(self):
+        channel_caches = ChannelCaches(
+            self.number_of_channels, self.max_size, ring_buffer=True, evict_oldest=True, transition_index=True)
+        rebuilt_transition_index = JointStateTransitionIndex(self.number_of_channels)
+        for i in range(self.max_size * 3):
+            channel_caches.add_all_current_channel_values_to_cache({i % self.number_of_channels: (i // 3) % 2})
+        for cache_row in channel_caches.channel_caches:
+            rebuilt_transition_index.add_row(cache_row)
+
+        joint_channel_value_map = dict(enumerate(channel_caches.channel_caches[-1]))
+        matching_rows, next_step_empty_counts = channel_caches.next_step_empty_counts(joint_channel_value_map)
+        expected_matching_rows, expected_next_step_empty_counts = rebuilt_transition_index.next_step_empty_counts(
+            joint_channel_value_map)
+        self.assertEqual(matching_rows, expected_matching_rows)
+        np.testing.assert_array_equal(next_step_empty_counts, expected_next_step_empty_counts)
+
+    def test_transition_index_one_row_cache(self):
+        channel_caches = ChannelCaches(1, 1, ring_buffer=True, evict_oldest=True, transition_index=True)
+        for value in [1, 0, 0]:
+            channel_caches.add_all_current_channel_values_to_cache({0: value})
+        self.assertEqual(channel_caches.size, 1)
+        self.assertEqual(channel_caches.next_step_empty_counts({0: 0})[0], 1)
+        self.assertEqual(channel_caches.next_step_empty_counts({0: 1})[0], 0)
+
+    def test_decayed_statistics_keep_cache_full(self):
+        channel_caches = ChannelCaches(
+            self.number_of_channels, self.max_size, ring_buffer=True, decay_half_life=1e9)
+        transition_index = JointStateTransitionIndex(self.number_of_channels)
+        for i in range(self.max_size * 3):
+            cache_row = {i % self.number_of_channels: (i // 3) % 2}
+            channel_caches.add_all_current_channel_values_to_cache(cache_row)
+            transition_index.add_row(channel_caches.channel_caches[-1])
+        self.assertEqual(channel_caches.size, self.max_size)
+        joint_channel_value_map = {channel: int(value) for channel, value in enumerate(channel_caches.channel_caches[-1])}
+        matching_weight, next_step_empty_weights = channel_caches.next_step_empty_counts(joint_channel_value_map)
+        matching_rows, next_step_empty_counts = transition_index.next_step_empty_counts(joint_channel_value_map)
+        self.assertAlmostEqual(matching_weight, matching_rows)
+        np.testing.assert_allclose(next_step_empty_weights, next_step_empty_counts)
+        self.assertEqual(channel_caches.decayed_statistics.max_states, DEFAULT_MAX_DECAYED_STATES)
+
+    def test_first_order_history_index_matches_transition_index(self):
+        history_channel_caches = ChannelCaches(
+            self.number_of_channels, self.max_size, ring_buffer=True, evict_oldest=True, history_order=1)
+        indexed_channel_caches = ChannelCaches(
+            self.number_of_channels, self.max_size, ring_buffer=True, evict_oldest=True, transition_index=True)
+        for i in range(self.max_size * 3):
+            for channel_caches in (history_channel_caches, indexed_channel_caches):
+                channel_caches.add_all_current_channel_values_to_cache({i % self.number_of_channels: (i // 3) % 2})
+            joint_channel_value_map = dict(enumerate(indexed_channel_caches.channel_caches[-1]))
+            matching_rows, next_step_empty_counts = history_channel_caches.next_step_empty_counts(joint_channel_value_map)
+            expected_matching_rows, expected_next_step_empty_counts = indexed_channel_caches.next_step_empty_counts(
+                joint_channel_value_map)
+            self.assertEqual(matching_rows, expected_matching_rows)
+            self.assertEqual(list(next_step_empty_counts), list(expected_next_step_empty_counts))
+
+    def test_sensed_values_and_row_scan_match_transition_index(self):
+        random_generator = np.random.default_rng(0)
+        for cache_options in [{}, {"ring_buffer": True}, {"ring_buffer": True, "evict_oldest": True}]:
+            channel_caches = ChannelCaches(self.number_of_channels, self.max_size, **cache_options)
+            indexed_channel_caches = ChannelCaches(self.number_of_channels, self.max_size, transition_index=True, **cache_options)
+            for _ in range(self.max_size * 3):
+                sensing_channels = random_generator.permutation(self.number_of_channels)[:2]
+                sensed_values = random_generator.integers(0, 2, 2, dtype=np.int8)
+                joint_channel_values = channel_caches.add_sensed_values_to_cache(sensing_channels, sensed_values)
+                indexed_channel_caches.add_joint_channel_values_to_cache(joint_channel_values)
+                np.testing.assert_array_equal(channel_caches.channel_caches, indexed_channel_caches.channel_caches)
+                matching_rows, next_step_empty_counts = channel_caches.scan_next_step_empty_counts(joint_channel_values)
+                expected_matching_rows, expected_next_step_empty_counts = indexed_channel_caches.next_step_empty_counts(
+                    joint_channel_values)
+                self.assertEqual(matching_rows, expected_matching_rows)
+                self.assertEqual(list(next_step_empty_counts), list(expected_next_step_empty_counts))
@@ -0,0 +1,194 @@
+import numpy as np
+import os
+import struct
+import tempfile
+import time
+import unittest
+from coop_controller import CoopController
+
+'''Checkpoint Layout: header, radio unit channels as int32, then the cache rows oldest first as (rows, channels) int8,
+then for decayed statistics the DecayedTransitionStatistics.state_arrays: state rows as (states, channels) int8,
+row weights as float64, next step EMPTY weights as (states, channels) float64 and decayed to ticks as int64'''
+CHECKPOINT_MAGIC = b"COOPCKPT"
+CHECKPOINT_VERSION = 2
+# magic, version, radio units, channels, max cache size, min cache size, monitored radio unit, cache rows, smart switches,
+# decayed states or -1 without decayed statistics, decayed statistics tick, latest decayed state index
+CHECKPOINT_HEADER = struct.Struct("<8sIIIIIIqqqqq")
+
+
+def save_checkpoint(coop_controller, path):
+    """ Writes the radio unit channels, cache rows, any decayed statistics and SwitchController smart switch counter
+    of coop_controller to path. Random generator state and any decision memo are not saved,
+    transition and history indexes are rebuilt from the cache rows on restore """
+    cache_rows = np.ascontiguousarray(coop_controller.channel_caches.channel_caches, dtype=np.int8)
+    radio_unit_channels = coop_controller.radio_units.sensing_channels.astype(np.int32)
+    decayed_statistics = getattr(coop_controller.channel_caches, "decayed_statistics", None)
+    if decayed_statistics is None:
+        decayed_statistics_state = None
+        number_of_decayed_states, decayed_tick, latest_decayed_state_index = -1, 0, -1
+    else:
+        decayed_statistics_state = decayed_statistics.state_arrays()
+        number_of_decayed_states = len(decayed_statistics_state[0])
+        decayed_tick, latest_decayed_state_index = decayed_statistics_state[4:]
+    header = CHECKPOINT_HEADER.pack(
+        CHECKPOINT_MAGIC, CHECKPOINT_VERSION, coop_controller.number_of_radio_units, coop_controller.number_of_channels,
+        coop_controller.channel_caches.max_size, int(coop_controller.min_channel_cache_size),
+        coop_controller.monitored_radio_unit, len(cache_rows), coop_controller.switch_controller.number_of_smart_switches,
+        number_of_decayed_states, decayed_tick, latest_decayed_state_index)
+    with open(path, "wb") as checkpoint_file:
+        checkpoint_file.write(header)
+        checkpoint_file.write(radio_unit_channels.tobytes())
+        checkpoint_file.write(cache_rows.tobytes())
+        if decayed_statistics_state is not None:
+            for state_array in decayed_statistics_state[:4]:
+                checkpoint_file.write(state_array.tobytes())
+
+
+def read_checkpoint(path):
+    """ Returns (header dict, radio unit channels, cache rows), the cache rows are a read only memory map of the file.
+    header["decayed_statistics_state"] holds the saved DecayedTransitionStatistics.state_arrays, or None """
+    with open(path, "rb") as checkpoint_file:
+        (magic, version, number_of_radio_units, number_of_channels, max_channel_cache_size, min_channel_cache_size,
+         monitored_radio_unit, number_of_cache_rows, number_of_smart_switches, number_of_decayed_states, decayed_tick,
+         latest_decayed_state_index) = CHECKPOINT_HEADER.unpack(checkpoint_file.read(CHECKPOINT_HEADER.size))
+        if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+            raise ValueError("%s is not a version %d controller checkpoint" % (path, CHECKPOINT_VERSION))
+        radio_unit_channels = np.frombuffer(checkpoint_file.read(4 * number_of_radio_units), dtype=np.int32)
+        decayed_statistics_state = None
+        if number_of_decayed_states >= 0:
+            checkpoint_file.seek(number_of_cache_rows * number_of_channels, os.SEEK_CUR)
+            decayed_shape = (number_of_decayed_states, number_of_channels)
+            decayed_statistics_state = (
+                np.frombuffer(checkpoint_file.read(number_of_decayed_states * number_of_channels), dtype=np.int8).reshape(
+                    decayed_shape),
+                np.frombuffer(checkpoint_file.read(8 * number_of_decayed_states), dtype=np.float64),
+                np.frombuffer(checkpoint_file.read(8 * number_of_decayed_states * number_of_channels),
+                              dtype=np.float64).reshape(decayed_shape),
+                np.frombuffer(checkpoint_file.read(8 * number_of_decayed_states), dtype=np.int64),
+                decayed_tick, latest_decayed_state_index)
+    header = {"number_of_radio_units": number_of_radio_units, "number_of_channels": number_of_channels,
+              "max_channel_cache_size": max_channel_cache_size, "min_channel_cache_size": min_channel_cache_size,
+              "monitored_radio_unit": monitored_radio_unit, "number_of_smart_switches": number_of_smart_switches,
+              "decayed_statistics_state": decayed_statistics_state}
+    if number_of_cache_rows == 0:
+        return header, radio_unit_channels, np.empty((0, number_of_channels), dtype=np.int8)
+    cache_rows = np.memmap(path, dtype=np.int8, mode="r", offset=CHECKPOINT_HEADER.size + 4 * number_of_radio_units,
+                           shape=(number_of_cache_rows, number_of_channels))
+    return header, radio_unit_channels, cache_rows
+
+
+def restore_checkpoint(coop_controller, path):
+    """ Loads a checkpoint into a CoopController built with the same radio unit, channel and cache sizes.
+    Saved decayed statistics are restored only into a controller with decayed statistics,
+    one without a saved state rebuilds them from the cache rows """
+    header, radio_unit_channels, cache_rows = read_checkpoint(path)
+    if (header["number_of_radio_units"], header["number_of_channels"], header["max_channel_cache_size"]) != (
+            coop_controller.number_of_radio_units, coop_controller.number_of_channels,
+            coop_controller.channel_caches.max_size):
+        raise ValueError("Checkpoint %s does not fit this CoopController" % path)
+    coop_controller.radio_units.set_sensing_channels(radio_unit_channels)
+    coop_controller.monitored_radio_unit = header["monitored_radio_unit"]
+    if header["decayed_statistics_state"] is not None and getattr(
+            coop_controller.channel_caches, "decayed_statistics", None) is not None:
+        coop_controller.channel_caches.restore_rows(cache_rows, header["decayed_statistics_state"])
+    else:
+        coop_controller.channel_caches.restore_rows(cache_rows)
+    coop_controller.switch_controller.number_of_smart_switches = header["number_of_smart_switches"]
+
+
+def load_checkpoint(path, cache_options=None, switch_options=None, trace_recorder=None, instrumentation=None):
+    """ Creates a CoopController sized from the checkpoint and restores it, the options are as for CoopController """
+    header, _, _ = read_checkpoint(path)
+    coop_controller = CoopController(header["number_of_radio_units"], header["number_of_channels"],
+                                     header["max_channel_cache_size"], header["min_channel_cache_size"],
+                                     cache_options=cache_options, switch_options=switch_options,
+                                     trace_recorder=trace_recorder, instrumentation=instrumentation)
+    restore_checkpoint(coop_controller, path)
+    return coop_controller
+
+
+class TestControllerCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temporary_directory.name, "controller.ckpt")
+        self.traffic = np.random.default_rng(8).integers(0, 2, (120, 6), dtype=np.int8)
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def run_ticks(self, coop_controller, traffic):
+        for current_traffic in traffic:
+            sensed_channel_values = coop_controller.get_current_sensed_channel_values_from_radio_units(current_traffic)
+            coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+            coop_controller.trigger_radio_unit_switching(sensed_channel_values)
+
+    def assert_resumes_like_original(self, cache_options):
+        switch_options = {"random_switch_step": 10**9}
+        coop_controller = CoopController(2, 6, 42, 7, cache_options=cache_options, switch_options=switch_options)
+        self.run_ticks(coop_controller, self.traffic[:60])
+        save_checkpoint(coop_controller, self.path)
+        restored_coop_controller = load_checkpoint(self.path, cache_options=cache_options, switch_options=switch_options)
+        self.assertTrue(restored_coop_controller.channel_caches.size >= restored_coop_controller.min_channel_cache_size)
+
+        self.run_ticks(coop_controller, self.traffic[60:])
+        self.run_ticks(restored_coop_controller, self.traffic[60:])
+        self.assertEqual([radio_unit.sensing_channel for radio_unit in restored_coop_controller.radio_units],
+                         [radio_unit.sensing_channel for radio_unit in coop_controller.radio_units])
+        np.testing.assert_array_equal(restored_coop_controller.channel_caches.channel_caches,
+                                      coop_controller.channel_caches.channel_caches)
+        self.assertEqual(restored_coop_controller.switch_controller.number_of_smart_switches,
+                         coop_controller.switch_controller.number_of_smart_switches)
+
+    def test_checkpoint_resumes_like_original(self):
+        self.assert_resumes_like_original({})
+
+    def test_checkpoint_resumes_like_original_ring_buffer(self):
+        self.assert_resumes_like_original({"ring_buffer": True, "evict_oldest": True, "transition_index": True})
+
+    def test_checkpoint_resumes_like_original_packed(self):
+        self.assert_resumes_like_original({"packed": True})
+
+    def test_checkpoint_resumes_like_original_decayed_statistics(self):
+        # 60 ticks overrun the 42 row cache, the decayed statistics still weigh the evicted rows
+        self.assert_resumes_like_original({"ring_buffer": True, "decay_half_life": 100})
+
+    def test_checkpoint_resumes_like_original_history_index(self):
+        self.assert_resumes_like_original({"ring_buffer": True, "evict_oldest": True, "history_order": 2})
+
+    def test_checkpoint_keeps_decayed_statistics(self):
+        cache_options = {"ring_buffer": True, "decay_half_life": 100}
+        coop_controller = CoopController(2, 6, 42, 7, cache_options=cache_options)
+        self.run_ticks(coop_controller, self.traffic[:60])
+        save_checkpoint(coop_controller, self.path)
+        restored_statistics = load_checkpoint(self.path, cache_options=cache_options).channel_caches.decayed_statistics
+        decayed_statistics = coop_controller.channel_caches.decayed_statistics
+        self.assertEqual(list(restored_statistics.states), list(decayed_statistics.states))
+        for state_key, (row_weight, next_step_empty_weights, decayed_tick) in decayed_statistics.states.items():
+            restored_state = restored_statistics.states[state_key]
+            self.assertEqual(restored_state[0], row_weight)
+            np.testing.assert_array_equal(restored_state[1], next_step_empty_weights)
+            self.assertEqual(restored_state[2], decayed_tick)
+        self.assertEqual(restored_statistics.tick, decayed_statistics.tick)
+        self.assertEqual(restored_statistics.latest_state_key, decayed_statistics.latest_state_key)
+        # a controller without decayed statistics ignores them
+        self.assertIsNone(load_checkpoint(self.path, cache_options={"ring_buffer": True}).channel_caches.decayed_statistics)
+
+    def test_restore_transition_index_under_a_millisecond(self):
+        cache_options = {"ring_buffer": True, "evict_oldest": True, "transition_index": True}
+        coop_controller = CoopController(2, 64, 1024, 8, cache_options=cache_options)
+        coop_controller.channel_caches.restore_rows(np.random.default_rng(8).integers(0, 3, (1024, 64), dtype=np.int8))
+        save_checkpoint(coop_controller, self.path)
+        restored_coop_controller = CoopController(2, 64, 1024, 8, cache_options=cache_options)
+        restore_times = []
+        for _ in range(5):
+            start_time = time.perf_counter()
+            restore_checkpoint(restored_coop_controller, self.path)
+            restore_times.append(time.perf_counter() - start_time)
+        self.assertLess(min(restore_times), 1e-3)
+        self.assertEqual(restored_coop_controller.channel_caches.transition_index.state_counts,
+                         coop_controller.channel_caches.transition_index.state_counts)
+
+    def test_restore_checkpoint_size_mismatch(self):
+        save_checkpoint(CoopController(2, 6, 42, 7), self.path)
+        with self.assertRaises(ValueError):
+            restore_checkpoint(CoopController(2, 6, 48, 8), self.path)
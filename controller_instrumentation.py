@@ -0,0 +1,97 @@
+import time
+import unittest
+
+'''Instrumented Phases'''
+SENSING = 0
+JOINT_MAP = 1
+CACHE_APPEND = 2
+SMART_SWITCH_SEARCH = 3
+PHASE_NAMES = ["sensing", "joint_map", "cache_append", "smart_switch_search"]
+
+'''Counters'''
+IMMEDIATE_SWITCHES = "immediate_switches"
+SMART_SWITCHES = "smart_switches"
+RANDOM_SWITCHES = "random_switches"
+SMART_STAYS = "smart_stays"
+CACHE_FLUSHES = "cache_flushes"
+ZERO_MATCH_LOOKUPS = "zero_match_lookups"
+COUNTER_NAMES = [IMMEDIATE_SWITCHES, SMART_SWITCHES, RANDOM_SWITCHES, SMART_STAYS, CACHE_FLUSHES, ZERO_MATCH_LOOKUPS]
+
+'''Histogram bucket i holds timings in [2^(i-1), 2^i) ns, the last bucket holds everything slower'''
+HISTOGRAM_BUCKETS = 40
+
+
+def monotonic_ns():
+    return time.perf_counter_ns()
+
+
+class ControllerInstrumentation:
+    def __init__(self):
+        """ Per phase fixed size log2 histograms of monotonic clock timings, plus switching counters.
+        CoopController and SwitchController only touch it when one is given to them """
+        self.reset()
+
+    def reset(self):
+        self.phase_histograms = [[0] * HISTOGRAM_BUCKETS for _ in PHASE_NAMES]
+        self.phase_total_ns = [0] * len(PHASE_NAMES)
+        self.counters = dict.fromkeys(COUNTER_NAMES, 0)
+
+    def record_phase(self, phase, start_ns):
+        """ Records the time since start_ns, taken with monotonic_ns, against phase """
+        elapsed_ns = monotonic_ns() - start_ns
+        self.phase_histograms[phase][min(elapsed_ns.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+        self.phase_total_ns[phase] += elapsed_ns
+
+    def count(self, counter):
+        self.counters[counter] += 1
+
+    def snapshot(self):
+        """ Returns a plain dict copy of the counters and, per phase, call count, total and mean time,
+        p50/p99 upper bounds from the histogram and the histogram itself """
+        phases = {}
+        for phase, phase_name in enumerate(PHASE_NAMES):
+            histogram = list(self.phase_histograms[phase])
+            calls = sum(histogram)
+            phases[phase_name] = {
+                "calls": calls,
+                "total_ns": self.phase_total_ns[phase],
+                "mean_ns": self.phase_total_ns[phase] / calls if calls != 0 else 0,
+                "p50_ns_upper_bound": self.__percentile_upper_bound(histogram, 0.5),
+                "p99_ns_upper_bound": self.__percentile_upper_bound(histogram, 0.99),
+                "histogram": histogram,
+            }
+        return {"phases": phases, "counters": dict(self.counters)}
+
+    def __percentile_upper_bound(self, histogram, fraction):
+        calls = sum(histogram)
+        if calls == 0:
+            return 0
+        cumulative_calls = 0
+        for bucket, bucket_calls in enumerate(histogram):
+            cumulative_calls += bucket_calls
+            if cumulative_calls >= fraction * calls:
+                return 1 << bucket
+        return 1 << (HISTOGRAM_BUCKETS - 1)
+
+
+class TestControllerInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.instrumentation = ControllerInstrumentation()
+
+    def test_record_phase(self):
+        self.instrumentation.record_phase(CACHE_APPEND, monotonic_ns())
+        self.instrumentation.record_phase(CACHE_APPEND, monotonic_ns() - 10**6)
+        snapshot = self.instrumentation.snapshot()
+        cache_append = snapshot["phases"]["cache_append"]
+        self.assertEqual(cache_append["calls"], 2)
+        self.assertTrue(cache_append["total_ns"] >= 10**6)
+        self.assertTrue(cache_append["p99_ns_upper_bound"] >= 10**6)
+        self.assertEqual(snapshot["phases"]["sensing"]["calls"], 0)
+
+    def test_snapshot_is_a_copy(self):
+        self.instrumentation.count(CACHE_FLUSHES)
+        snapshot = self.instrumentation.snapshot()
+        self.instrumentation.count(CACHE_FLUSHES)
+        self.assertEqual(snapshot["counters"][CACHE_FLUSHES], 1)
+        self.instrumentation.reset()
+        self.assertEqual(self.instrumentation.snapshot()["counters"][CACHE_FLUSHES], 0)
@@ -1,57 +1,116 @@
+import numpy as np
+import os
+import random
+import tempfile
 import unittest
 from channel_caches import EMPTY, OCCUPIED, UNKNOWN, ChannelCaches
-from radio_unit import RadioUnit
+from controller_instrumentation import CACHE_APPEND, CACHE_FLUSHES, IMMEDIATE_SWITCHES, JOINT_MAP, SENSING, SMART_STAYS, SMART_SWITCH_SEARCH, ControllerInstrumentation, monotonic_ns
+from packed_channel_caches import PackedChannelCaches
+from radio_pool import RadioPool
 from switch_controller import SwitchController
+from trace_recorder import IMMEDIATE_SWITCH, SMART_STAY, SMART_SWITCH, TraceRecorder, read_binary_trace
 
 
 class CoopController:
-    def __init__(self, number_of_radio_units, number_of_channels, max_channel_cache_size, min_channel_cache_size):
+    def __init__(self, number_of_radio_units, number_of_channels, max_channel_cache_size, min_channel_cache_size, cache_options=None, switch_options=None, trace_recorder=None, instrumentation=None):
         """ Constraints: number_of_radio_units <= number_of_channels
         and max_channel_cache_size must be a multiple of number_of_channels
-        and min_channel_cache_size must divide evenly into max_channel_cache_size"""
+        and min_channel_cache_size must divide evenly into max_channel_cache_size
+        cache_options are forwarded to ChannelCaches, e.g {"ring_buffer": True, "evict_oldest": True},
+        {"packed": True} uses PackedChannelCaches instead
+        and switch_options to SwitchController, e.g {"vectorized": True}
+        trace_recorder, if given, gets a record of every tick's switching decision
+        instrumentation, a ControllerInstrumentation, if given, times each phase of a tick and counts switching outcomes"""
         self.number_of_channels = number_of_channels
         self.number_of_radio_units = number_of_radio_units
         assert(number_of_radio_units <= number_of_channels)
         assert(max_channel_cache_size % number_of_channels == 0)
 
-        self.radio_units = self.__init_radio_units()
-        self.channel_caches = ChannelCaches(
-            number_of_channels=number_of_channels, max_size=max_channel_cache_size)
-        self.switch_controller = SwitchController()
+        self.radio_units = RadioPool(number_of_radio_units, number_of_channels)
+        cache_options = dict(cache_options or {})
+        cache_class = PackedChannelCaches if cache_options.pop("packed", False) else ChannelCaches
+        self.channel_caches = cache_class(
+            number_of_channels=number_of_channels, max_size=max_channel_cache_size, **cache_options)
+        self.switch_controller = SwitchController(
+            trace_recorder=trace_recorder, instrumentation=instrumentation, **(switch_options or {}))
+        self.trace_recorder = trace_recorder
+        self.instrumentation = instrumentation
 
         self.monitored_radio_unit = 0
         assert(max_channel_cache_size % min_channel_cache_size == 0)
         self.min_channel_cache_size = min_channel_cache_size
 
-    def __init_radio_units(self):
-        radio_units = []
-        for i in range(self.number_of_radio_units):
-            radio_units.append(RadioUnit(i))
-        return radio_units
+        # reused every tick by the array API, see sense_joint_channel_values
+        self.joint_channel_values = np.full(number_of_channels, UNKNOWN, dtype=np.int8)
+        self.sensed_values = np.empty(number_of_radio_units, dtype=np.int8)
+        self.last_decision_type = None
+        # fixed layout step record, the tick's sensed values, its decision and the radio unit channels after switching
+        self.step_record_dtype = np.dtype([("sensed_values", np.int8, (number_of_radio_units,)),
+                                           ("decision_type", np.int8),
+                                           ("sensing_channels", np.int64, (number_of_radio_units,))])
+        self.step_records = np.zeros(1, dtype=self.step_record_dtype)
 
     def get_current_sensed_channel_values_from_radio_units(self, full_current_traffic):
         """ Expects full current traffic row, returns {channel : sensed_value} dict"""
+        if self.instrumentation is not None:
+            start_ns = monotonic_ns()
         sensed_channel_values = {}
-        for radio_unit in self.radio_units:
-            sensed_channel_values[radio_unit.sensing_channel] = full_current_traffic[radio_unit.sensing_channel]
+        for sensing_channel in self.radio_units.sensing_channels.tolist():
+            sensed_channel_values[sensing_channel] = full_current_traffic[sensing_channel]
+        if self.instrumentation is not None:
+            self.instrumentation.record_phase(SENSING, start_ns)
         return sensed_channel_values
 
+    def sense_joint_channel_values(self, full_current_traffic):
+        """ Array API counterpart of get_current_sensed_channel_values_from_radio_units and the joint channel map.
+        Expects the full current traffic row as an array, fills and returns the preallocated int8 joint_channel_values,
+        sensed values on radio unit channels and UNKNOWN elsewhere, and sensed_values in radio unit order.
+        Both buffers are overwritten next tick, copy them to keep them """
+        if self.instrumentation is not None:
+            start_ns = monotonic_ns()
+        sensing_channels = self.radio_units.sensing_channels
+        np.take(full_current_traffic, sensing_channels, out=self.sensed_values)
+        self.joint_channel_values.fill(UNKNOWN)
+        self.joint_channel_values[sensing_channels] = self.sensed_values
+        if self.instrumentation is not None:
+            self.instrumentation.record_phase(SENSING, start_ns)
+        return self.joint_channel_values
+
     def immediate_switch_channel_for_all_radio_units(self):
         """Increments all radio unit sensing channel numbers by 1 """
         self.switch_controller.immediate_switch_channel_for_all_radio_units(
             self.radio_units, self.number_of_channels)
 
     def add_all_current_channel_values_to_cache_including_unknowns(self, sensed_channel_values):
-        self.channel_caches.add_all_current_channel_values_to_cache(
-            sensed_channel_values=sensed_channel_values)
+        """ sensed_channel_values is a {channel : sensed_value} dict or the joint state vector from sense_joint_channel_values """
+        if self.instrumentation is not None:
+            start_ns = monotonic_ns()
+            if self.channel_caches.size == self.channel_caches.max_size and not self.channel_caches.evict_oldest:
+                self.instrumentation.count(CACHE_FLUSHES)
+        if isinstance(sensed_channel_values, np.ndarray):
+            self.channel_caches.add_joint_channel_values_to_cache(sensed_channel_values)
+        else:
+            self.channel_caches.add_all_current_channel_values_to_cache(
+                sensed_channel_values=sensed_channel_values)
+        if self.instrumentation is not None:
+            self.instrumentation.record_phase(CACHE_APPEND, start_ns)
 
     def trigger_radio_unit_switching(self, current_sensed_values):
         """Triggers logic to switch radio unit channels,
         If currently in a smart switch period and active radio channel is occupied, i.e cache > min cache size then use smart switch logic
         If in smart switch period and channel is empty then continue on this channel
-        Else immediate switch all radio unit channels"""
+        Else immediate switch all radio unit channels.
+        current_sensed_values is a {channel : sensed_value} dict or the joint state vector from sense_joint_channel_values.
+        The cache object is handed to SwitchController, its rows are only read when its statistics can't answer"""
         active_radio_unit = self.radio_units[self.monitored_radio_unit]
-        joint_channel_value_map = self.__create_joint_channel_value_map(current_sensed_values)
+        if self.instrumentation is not None:
+            start_ns = monotonic_ns()
+        if isinstance(current_sensed_values, np.ndarray):
+            joint_channel_value_map = current_sensed_values
+        else:
+            joint_channel_value_map = self.__create_joint_channel_value_map(current_sensed_values)
+        if self.instrumentation is not None:
+            self.instrumentation.record_phase(JOINT_MAP, start_ns)
 
         smart_switched = False
         active_radio_sensed_channel_state = joint_channel_value_map[active_radio_unit.sensing_channel]
@@ -61,21 +120,112 @@ class CoopController:
             smart_switched = True
             self.switch_controller.number_of_smart_switches += 1 
             if active_radio_sensed_channel_state == OCCUPIED:
-                self.switch_controller.smart_switch_channel_for_radio_unit(
-                    all_radio_units=self.radio_units,
-                    active_radio_index=self.monitored_radio_unit,
-                    joint_channel_value_map=joint_channel_value_map,
-                    channel_caches=self.channel_caches.channel_caches,
-                    number_of_channels=self.number_of_channels)
+                if self.instrumentation is not None:
+                    start_ns = monotonic_ns()
+                if self.switch_controller.cooperative_assignment:
+                    self.switch_controller.cooperative_assign_channels(
+                        all_radio_units=self.radio_units,
+                        active_radio_index=self.monitored_radio_unit,
+                        joint_channel_value_map=joint_channel_value_map,
+                        channel_caches=self.channel_caches,
+                        number_of_channels=self.number_of_channels,
+                        cache_statistics=self.channel_caches)
+                else:
+                    self.switch_controller.smart_switch_channel_for_radio_unit(
+                        all_radio_units=self.radio_units,
+                        active_radio_index=self.monitored_radio_unit,
+                        joint_channel_value_map=joint_channel_value_map,
+                        channel_caches=self.channel_caches,
+                        number_of_channels=self.number_of_channels,
+                        cache_statistics=self.channel_caches)
+                if self.instrumentation is not None:
+                    self.instrumentation.record_phase(SMART_SWITCH_SEARCH, start_ns)
             elif active_radio_sensed_channel_state == EMPTY: 
-                pass
+                if self.instrumentation is not None:
+                    self.instrumentation.count(SMART_STAYS)
+                if self.switch_controller.cooperative_assignment:
+                    # the active radio unit stays, passive radio units still move to the most informative channels
+                    self.switch_controller.cooperative_assign_channels(
+                        all_radio_units=self.radio_units,
+                        active_radio_index=self.monitored_radio_unit,
+                        joint_channel_value_map=joint_channel_value_map,
+                        channel_caches=self.channel_caches,
+                        number_of_channels=self.number_of_channels,
+                        cache_statistics=self.channel_caches,
+                        active_channel=active_radio_unit.sensing_channel)
         
         if not smart_switched:
             self.switch_controller.number_of_smart_switches = 0
             self.immediate_switch_channel_for_all_radio_units()
+            if self.instrumentation is not None:
+                self.instrumentation.count(IMMEDIATE_SWITCHES)
+
+        if not smart_switched:
+            self.last_decision_type = IMMEDIATE_SWITCH
+        elif active_radio_sensed_channel_state == OCCUPIED:
+            self.last_decision_type = SMART_SWITCH
+        else:
+            self.last_decision_type = SMART_STAY
+        if self.trace_recorder is not None:
+            self.trace_recorder.record_tick(
+                self.last_decision_type, self.radio_units, self.monitored_radio_unit, self.channel_caches.size)
 
         return smart_switched
 
+    def step(self, traffic_row):
+        """ One tick: senses traffic_row, appends the joint state vector to the cache and switches.
+        Returns a step_record_dtype record with the sensed values, the decision type
+        (IMMEDIATE_SWITCH, SMART_STAY or SMART_SWITCH) and the radio unit channels after switching.
+        The record is reused next tick, copy it to keep it """
+        self.__sense_cache_and_switch(traffic_row)
+        step_record = self.step_records[0]
+        step_record["sensed_values"] = self.sensed_values
+        step_record["decision_type"] = self.last_decision_type
+        step_record["sensing_channels"] = self.radio_units.sensing_channels
+        return step_record
+
+    def run(self, traffic_matrix):
+        """ Steps through a time major (ticks, channels) traffic matrix, returns a (ticks,) array of step records """
+        step_records = np.zeros(len(traffic_matrix), dtype=self.step_record_dtype)
+        sensed_values = step_records["sensed_values"]
+        decision_types = step_records["decision_type"]
+        sensing_channels = step_records["sensing_channels"]
+        for tick, traffic_row in enumerate(traffic_matrix):
+            self.__sense_cache_and_switch(traffic_row)
+            sensed_values[tick] = self.sensed_values
+            decision_types[tick] = self.last_decision_type
+            sensing_channels[tick] = self.radio_units.sensing_channels
+        return step_records
+
+    def __sense_cache_and_switch(self, traffic_row):
+        """ sense_joint_channel_values, add_all_current_channel_values_to_cache_including_unknowns and
+        trigger_radio_unit_switching in one, fused for a ChannelCaches without instrumentation:
+        the sensed values are written straight into the new cache row, which serves as the joint state vector,
+        and a smart switch that is a plain lookup goes directly to find_best_channel_for_joint_state """
+        if self.instrumentation is not None or not isinstance(self.channel_caches, ChannelCaches):
+            joint_channel_values = self.sense_joint_channel_values(traffic_row)
+            self.add_all_current_channel_values_to_cache_including_unknowns(joint_channel_values)
+            self.trigger_radio_unit_switching(joint_channel_values)
+            return
+        sensing_channels = self.radio_units.sensing_channels
+        np.take(traffic_row, sensing_channels, out=self.sensed_values)
+        joint_channel_values = self.channel_caches.add_sensed_values_to_cache(sensing_channels, self.sensed_values)
+        switch_controller = self.switch_controller
+        active_channel = int(sensing_channels[self.monitored_radio_unit])
+        if (joint_channel_values[active_channel] != OCCUPIED or self.channel_caches.size < self.min_channel_cache_size
+                or (switch_controller.number_of_smart_switches + 1) % switch_controller.random_switch_step == 0
+                or not switch_controller.searches_joint_states_directly()):
+            self.trigger_radio_unit_switching(joint_channel_values)
+            return
+        switch_controller.number_of_smart_switches += 1
+        best_channel = switch_controller.find_best_channel_for_joint_state(
+            active_channel, joint_channel_values, self.channel_caches)
+        self.radio_units.swap_to_channel(self.monitored_radio_unit, best_channel)
+        self.last_decision_type = SMART_SWITCH
+        if self.trace_recorder is not None:
+            self.trace_recorder.record_tick(
+                self.last_decision_type, self.radio_units, self.monitored_radio_unit, self.channel_caches.size)
+
     def __create_joint_channel_value_map(self, current_sensed_values):
         joint_channel_value_map = current_sensed_values.copy()
         for channel in range(self.number_of_channels):
@@ -125,13 +275,14 @@ class TestCoopController(unittest.TestCase):
             self.assertEqual(
                 new_sensing_channels[i], original_sensing_channels[i] + 1)
 
-        # set all RUs to last channel to check incrementing to 0
-        for radio_unit in self.coop_controller.radio_units:
-            radio_unit.sensing_channel = self.number_of_channels - 1
+        # radio units never share a channel, so set them to the last channels to check incrementing to 0
+        last_channels = list(range(self.number_of_channels - len(self.coop_controller.radio_units), self.number_of_channels))
+        for radio_unit, channel in zip(self.coop_controller.radio_units, last_channels):
+            radio_unit.sensing_channel = channel
         self.coop_controller.immediate_switch_channel_for_all_radio_units()
 
-        for radio_unit in self.coop_controller.radio_units:
-            self.assertEqual(radio_unit.sensing_channel, 0)
+        self.assertEqual([radio_unit.sensing_channel for radio_unit in self.coop_controller.radio_units],
+                         last_channels[1:] + [0])
 
     def test_add_all_current_channel_values_to_cache_including_unknowns(self):
         original_cache_size = self.coop_controller.channel_caches.size
@@ -206,4 +357,175 @@ class TestCoopController(unittest.TestCase):
             self.coop_controller.monitored_radio_unit].sensing_channel
         self.assertTrue(original_monitored_radio_unit_channel != new_monitored_radio_unit_channel)
         self.assertTrue(new_monitored_radio_unit_channel != original_monitored_radio_unit_channel + 1)
-        self.assertEqual(new_monitored_radio_unit_channel, 0)
\ No newline at end of file
+        self.assertEqual(new_monitored_radio_unit_channel, 0)
+    def test_trigger_radio_unit_smart_switch_with_ring_buffer_cache(self):
+        coop_controller = CoopController(
+            self.number_of_radio_units, self.number_of_channels, self.channel_cache_size, self.channel_cache_size / 6,
+            cache_options={"ring_buffer": True, "evict_oldest": True})
+        traffic = [[1, 0, 0, 1, 0, 1],
+        [0, 1, 0, 0, 1, 1],
+        [1, 0, 0, 1, 1, 1],
+        [1, 0, 0, 1, 0, 1],
+        [1, 0, 0, 1, 1, 1],
+        [0, 1, 0, 1, 0, 1],
+        [1, 0, 1, 1, 1, 1],
+        [0, 0, 1, 0, 0, 1],
+        [1, 1, 0, 1, 1, 1],
+        [0, 0, 0, 1, 0, 1]]
+
+        for current_traffic in traffic:
+            sensed_channel_values = coop_controller.get_current_sensed_channel_values_from_radio_units(
+            current_traffic)
+            coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+            coop_controller.immediate_switch_channel_for_all_radio_units()
+
+        sensed_channel_values = coop_controller.get_current_sensed_channel_values_from_radio_units([1, 0, 1, 1, 1, 1])
+        coop_controller.trigger_radio_unit_switching(sensed_channel_values)
+
+        self.assertEqual(coop_controller.radio_units[coop_controller.monitored_radio_unit].sensing_channel, 0)
+
+    def test_joint_channel_values_api_matches_dict_api(self):
+        traffic_random = np.random.default_rng(5)
+        for cache_options, switch_options in [({}, {}), ({"ring_buffer": True, "transition_index": True}, {}),
+                                              ({"packed": True}, {"vectorized": True})]:
+            dict_coop_controller = CoopController(
+                2, 6, 42, 7, cache_options=cache_options, switch_options=dict(switch_options, random_seed=1))
+            array_coop_controller = CoopController(
+                2, 6, 42, 7, cache_options=cache_options, switch_options=dict(switch_options, random_seed=1))
+            for current_traffic in traffic_random.integers(0, 2, (150, 6), dtype=np.int8):
+                sensed_channel_values = dict_coop_controller.get_current_sensed_channel_values_from_radio_units(
+                    current_traffic)
+                dict_coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+                dict_smart_switched = dict_coop_controller.trigger_radio_unit_switching(sensed_channel_values)
+                joint_channel_values = array_coop_controller.sense_joint_channel_values(current_traffic)
+                array_coop_controller.add_all_current_channel_values_to_cache_including_unknowns(joint_channel_values)
+                self.assertEqual(array_coop_controller.trigger_radio_unit_switching(joint_channel_values),
+                                 dict_smart_switched)
+                self.assertEqual(list(array_coop_controller.radio_units.sensing_channels),
+                                 list(dict_coop_controller.radio_units.sensing_channels))
+            np.testing.assert_array_equal(array_coop_controller.channel_caches.channel_caches,
+                                          dict_coop_controller.channel_caches.channel_caches)
+
+    def test_step_and_run_match_separate_calls(self):
+        traffic = np.random.default_rng(6).integers(0, 2, (150, 6), dtype=np.int8)
+        for cache_options in [{}, {"ring_buffer": True}, {"ring_buffer": True, "evict_oldest": True, "transition_index": True},
+                              {"ring_buffer": True, "decay_half_life": 20}, {"packed": True}]:
+            self.assert_step_and_run_match_separate_calls(traffic, cache_options)
+
+    def assert_step_and_run_match_separate_calls(self, traffic, cache_options):
+        coop_controller = CoopController(2, 6, 42, 7, cache_options=cache_options, switch_options={"random_seed": 1})
+        step_coop_controller = CoopController(2, 6, 42, 7, cache_options=cache_options, switch_options={"random_seed": 1})
+        step_records = CoopController(2, 6, 42, 7, cache_options=cache_options, switch_options={"random_seed": 1}).run(traffic)
+        for current_traffic, step_record in zip(traffic, step_records):
+            sensed_channel_values = coop_controller.get_current_sensed_channel_values_from_radio_units(current_traffic)
+            coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+            smart_switched = coop_controller.trigger_radio_unit_switching(sensed_channel_values)
+            self.assertEqual(list(step_record["sensed_values"]), list(sensed_channel_values.values()))
+            self.assertEqual(step_record["decision_type"] == IMMEDIATE_SWITCH, not smart_switched)
+            self.assertEqual(list(step_record["sensing_channels"]),
+                             [radio_unit.sensing_channel for radio_unit in coop_controller.radio_units])
+            self.assertEqual(step_coop_controller.step(current_traffic), step_record)
+        self.assertEqual(set(step_records["decision_type"]), {IMMEDIATE_SWITCH, SMART_STAY, SMART_SWITCH})
+
+    def test_cache_backends_match_cache_scan(self):
+        traffic_random = random.Random(7)
+        scanning_coop_controller = CoopController(2, 6, 42, 7)
+        indexed_coop_controller = CoopController(
+            2, 6, 42, 7, cache_options={"ring_buffer": True, "transition_index": True})
+        vectorized_coop_controller = CoopController(
+            2, 6, 42, 7, cache_options={"ring_buffer": True}, switch_options={"vectorized": True})
+        packed_coop_controller = CoopController(
+            2, 6, 42, 7, cache_options={"packed": True}, switch_options={"vectorized": True})
+        coop_controllers = (scanning_coop_controller, indexed_coop_controller,
+                            vectorized_coop_controller, packed_coop_controller)
+        for coop_controller in coop_controllers:
+            coop_controller.switch_controller.random_switch_step = 10**9
+
+        for _ in range(200):
+            current_traffic = [traffic_random.randint(0, 1) for _ in range(6)]
+            for coop_controller in coop_controllers:
+                sensed_channel_values = coop_controller.get_current_sensed_channel_values_from_radio_units(
+                    current_traffic)
+                coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+                coop_controller.trigger_radio_unit_switching(sensed_channel_values)
+            for coop_controller in coop_controllers[1:]:
+                self.assertEqual([radio_unit.sensing_channel for radio_unit in scanning_coop_controller.radio_units],
+                                 [radio_unit.sensing_channel for radio_unit in coop_controller.radio_units])
+
+    def test_indexed_caches_rows_not_read_when_statistics_answer(self):
+        traffic = np.random.default_rng(9).integers(0, 2, (200, 6), dtype=np.int8)
+        for cache_options in [{"packed": True}, {"ring_buffer": True, "evict_oldest": True, "transition_index": True}]:
+            coop_controller = CoopController(2, 6, 42, 7, cache_options=cache_options, switch_options={"random_seed": 1})
+            cache_class = type(coop_controller.channel_caches)
+            rows_read = []
+            channel_caches_property = cache_class.channel_caches
+            try:
+                cache_class.channel_caches = property(
+                    lambda channel_caches: rows_read.append(1) or channel_caches_property.fget(channel_caches))
+                coop_controller.run(traffic)
+            finally:
+                cache_class.channel_caches = channel_caches_property
+            self.assertEqual(rows_read, [])
+
+    def test_decision_memo_hits_and_matches_uncached_decisions(self):
+        traffic = np.random.default_rng(10).integers(0, 2, (600, 6), dtype=np.int8)
+        for cache_options in [{}, {"ring_buffer": True, "evict_oldest": True}, {"packed": True}]:
+            memo_coop_controller = CoopController(2, 6, 42, 7, cache_options=cache_options,
+                                                  switch_options={"random_seed": 1, "decision_memo_size": 64})
+            coop_controller = CoopController(2, 6, 42, 7, cache_options=cache_options, switch_options={"random_seed": 1})
+            np.testing.assert_array_equal(memo_coop_controller.run(traffic), coop_controller.run(traffic))
+            self.assertTrue(memo_coop_controller.switch_controller.decision_memo_statistics()["hits"] > 0)
+
+    def test_trace_recorder_records_every_tick(self):
+        with tempfile.TemporaryDirectory() as temporary_directory:
+            path = os.path.join(temporary_directory, "trace.bin")
+            with TraceRecorder(path, self.number_of_radio_units, binary=True) as trace_recorder:
+                coop_controller = CoopController(
+                    self.number_of_radio_units, self.number_of_channels, 42, 7, trace_recorder=trace_recorder)
+                for current_traffic in [[1, 0, 0, 1, 0, 1]] * 10:
+                    sensed_channel_values = coop_controller.get_current_sensed_channel_values_from_radio_units(
+                        current_traffic)
+                    coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+                    coop_controller.trigger_radio_unit_switching(sensed_channel_values)
+            trace = read_binary_trace(path, self.number_of_radio_units)
+
+        self.assertEqual(list(trace["tick"]), list(range(10)))
+        self.assertEqual(list(trace["decision_type"][:6]), [IMMEDIATE_SWITCH] * 6)
+        self.assertTrue(set(trace["decision_type"][6:]) <= {SMART_STAY, SMART_SWITCH})
+        self.assertEqual(list(trace["cache_size"]), list(range(1, 11)))
+
+    def test_instrumentation_counts_every_tick(self):
+        instrumentation = ControllerInstrumentation()
+        coop_controller = CoopController(self.number_of_radio_units, self.number_of_channels, 12, 6,
+                                         switch_options={"random_seed": 1}, instrumentation=instrumentation)
+        traffic_random = random.Random(2)
+        for _ in range(30):
+            current_traffic = [traffic_random.randint(0, 1) for _ in range(self.number_of_channels)]
+            sensed_channel_values = coop_controller.get_current_sensed_channel_values_from_radio_units(current_traffic)
+            coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+            coop_controller.trigger_radio_unit_switching(sensed_channel_values)
+
+        snapshot = instrumentation.snapshot()
+        counters = snapshot["counters"]
+        self.assertEqual(counters["immediate_switches"] + counters["smart_switches"] +
+                         counters["random_switches"] + counters["smart_stays"], 30)
+        self.assertEqual(counters["cache_flushes"], 2)
+        self.assertTrue(counters["zero_match_lookups"] <= counters["smart_switches"])
+        self.assertEqual(snapshot["phases"]["sensing"]["calls"], 30)
+        self.assertEqual(snapshot["phases"]["smart_switch_search"]["calls"],
+                         counters["smart_switches"] + counters["random_switches"])
+
+    def test_cooperative_assignment_keeps_radio_units_on_distinct_channels(self):
+        coop_controller = CoopController(16, 64, 1024, 32, cache_options={"ring_buffer": True},
+                                         switch_options={"cooperative_assignment": True, "random_seed": 0})
+        traffic_random = random.Random(4)
+        for _ in range(200):
+            current_traffic = [traffic_random.randint(0, 1) for _ in range(64)]
+            sensed_channel_values = coop_controller.get_current_sensed_channel_values_from_radio_units(current_traffic)
+            coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+            monitored_channel = coop_controller.radio_units[coop_controller.monitored_radio_unit].sensing_channel
+            smart_switched = coop_controller.trigger_radio_unit_switching(sensed_channel_values)
+            sensing_channels = [radio_unit.sensing_channel for radio_unit in coop_controller.radio_units]
+            self.assertEqual(len(set(sensing_channels)), 16)
+            if smart_switched and current_traffic[monitored_channel] == EMPTY:
+                self.assertEqual(sensing_channels[coop_controller.monitored_radio_unit], monitored_channel)
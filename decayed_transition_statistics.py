@@ -0,0 +1,168 @@
+import numpy as np
+import unittest
+from collections import OrderedDict
+
+'''Channel Occupancy Constants'''
+EMPTY = 0
+OCCUPIED = 1
+UNKNOWN = 2
+
+'''Joint states tracked by default, every joint state costs its key and a float64 weight per channel'''
+DEFAULT_MAX_DECAYED_STATES = 4096
+
+
+class DecayedTransitionStatistics:
+    def __init__(self, number_of_channels, half_life, max_states=DEFAULT_MAX_DECAYED_STATES):
+        """ Like JointStateTransitionIndex, but every row's weight halves each half_life appends instead of
+        the row being dropped by a flush or eviction, so memory and per append cost don't depend on any window length.
+        Per joint state it keeps the decayed row weight and, per channel, the decayed weight of an EMPTY next row.
+        Decay is applied lazily when a state is touched. Beyond max_states the least recently seen states are forgotten,
+        their weights have decayed the most, so memory stays bounded however many joint states the traffic visits.
+        max_states None keeps every state """
+        self.number_of_channels = number_of_channels
+        self.half_life = half_life
+        self.decay = 0.5 ** (1 / half_life)
+        self.max_states = max_states
+        self.clear()
+
+    def clear(self):
+        # state key : [row weight, next step EMPTY weights, tick the weights were last decayed to]
+        self.states = OrderedDict()
+        self.tick = 0
+        self.latest_state_key = None
+
+    def state_key(self, cache_row):
+        return np.asarray(cache_row, dtype=np.int8).tobytes()
+
+    def joint_state_key(self, joint_channel_value_map):
+        """ Returns None if the map does not cover every channel, such partial maps can't be looked up.
+        A joint state vector, int8 with UNKNOWN for unsensed channels, is used as is """
+        if isinstance(joint_channel_value_map, np.ndarray):
+            return joint_channel_value_map.astype(np.int8, copy=False).tobytes()
+        if len(joint_channel_value_map) != self.number_of_channels:
+            return None
+        cache_row = np.empty(self.number_of_channels, dtype=np.int8)
+        for channel, value in joint_channel_value_map.items():
+            if not 0 <= channel < self.number_of_channels:
+                return None
+            cache_row[channel] = value
+        return cache_row.tobytes()
+
+    def add_row(self, cache_row):
+        """ Records cache_row as the newest row, and the transition from the previous newest row into it.
+        The transition is weighted as of the previous row's tick so a state's EMPTY weights never exceed its row weight """
+        self.tick += 1
+        if self.latest_state_key is not None and self.latest_state_key in self.states:
+            latest_state = self.__decayed_state(self.latest_state_key)
+            latest_state[1] += self.decay * (np.asarray(cache_row) == EMPTY)
+
+        new_state_key = self.state_key(cache_row)
+        new_state = self.__decayed_state(new_state_key)
+        if new_state is None:
+            new_state = [0.0, np.zeros(self.number_of_channels), self.tick]
+            self.states[new_state_key] = new_state
+            if self.max_states is not None and len(self.states) > self.max_states:
+                self.states.popitem(last=False)
+        new_state[0] += 1
+        self.states.move_to_end(new_state_key)
+        self.latest_state_key = new_state_key
+
+    def __decayed_state(self, state_key):
+        state = self.states.get(state_key)
+        if state is not None and state[2] != self.tick:
+            decay = self.decay ** (self.tick - state[2])
+            state[0] *= decay
+            state[1] *= decay
+            state[2] = self.tick
+        return state
+
+    def state_arrays(self):
+        """ Returns (state rows (states, channels) int8, row weights, next step EMPTY weights (states, channels),
+        ticks the weights were last decayed to, tick, index of the latest state or -1), least recently seen state first """
+        state_keys = list(self.states)
+        state_rows = np.frombuffer(b"".join(state_keys), dtype=np.int8).reshape(len(state_keys), self.number_of_channels)
+        states = list(self.states.values())
+        row_weights = np.array([state[0] for state in states], dtype=np.float64)
+        next_step_empty_weights = np.array([state[1] for state in states], dtype=np.float64).reshape(
+            len(states), self.number_of_channels)
+        decayed_ticks = np.array([state[2] for state in states], dtype=np.int64)
+        latest_state_index = state_keys.index(self.latest_state_key) if self.latest_state_key in self.states else -1
+        return state_rows, row_weights, next_step_empty_weights, decayed_ticks, self.tick, latest_state_index
+
+    def restore_state_arrays(self, state_rows, row_weights, next_step_empty_weights, decayed_ticks, tick, latest_state_index):
+        """ Replaces the statistics with those returned by state_arrays """
+        self.clear()
+        for state_row, row_weight, state_next_step_empty_weights, decayed_tick in zip(
+                state_rows, row_weights.tolist(), next_step_empty_weights, decayed_ticks.tolist()):
+            self.states[self.state_key(state_row)] = [row_weight, np.array(state_next_step_empty_weights, dtype=np.float64),
+                                                      decayed_tick]
+        self.tick = int(tick)
+        if latest_state_index >= 0:
+            self.latest_state_key = self.state_key(state_rows[latest_state_index])
+
+    def next_step_empty_counts(self, joint_channel_value_map):
+        """ Returns (decayed weight of rows matching the joint map, per channel decayed weight of an EMPTY next row)
+        or None if the joint map is partial """
+        state_key = self.joint_state_key(joint_channel_value_map)
+        if state_key is None:
+            return None
+        state = self.__decayed_state(state_key)
+        if state is None:
+            return 0, np.zeros(self.number_of_channels)
+        return state[0], state[1].copy()
+
+
+class TestDecayedTransitionStatistics(unittest.TestCase):
+    def setUp(self):
+        self.decayed_statistics = DecayedTransitionStatistics(3, half_life=2)
+
+    def test_matches_transition_counts_with_long_half_life(self):
+        decayed_statistics = DecayedTransitionStatistics(3, half_life=1e9)
+        for cache_row in [[1, 0, 1], [0, 0, 1], [0, 1, 0], [1, 0, 1]]:
+            decayed_statistics.add_row(cache_row)
+        matching_weight, next_step_empty_weights = decayed_statistics.next_step_empty_counts({0: 1, 1: 0, 2: 1})
+        self.assertAlmostEqual(matching_weight, 2)
+        np.testing.assert_allclose(next_step_empty_weights, [1, 1, 0])
+
+    def test_old_rows_decay(self):
+        self.decayed_statistics.add_row([1, 2, 2])
+        self.decayed_statistics.add_row([2, 0, 2])
+        for _ in range(3):
+            self.decayed_statistics.add_row([2, 2, 1])
+        matching_weight, next_step_empty_weights = self.decayed_statistics.next_step_empty_counts({0: 1, 1: 2, 2: 2})
+        self.assertAlmostEqual(matching_weight, 0.5 ** 2)
+        self.assertAlmostEqual(next_step_empty_weights[1] / matching_weight, 1)
+        self.assertIsNone(self.decayed_statistics.next_step_empty_counts({0: 1}))
+
+    def test_max_states(self):
+        decayed_statistics = DecayedTransitionStatistics(3, half_life=2, max_states=2)
+        for cache_row in [[1, 2, 2], [2, 0, 2], [2, 2, 1]]:
+            decayed_statistics.add_row(cache_row)
+        self.assertEqual(decayed_statistics.next_step_empty_counts({0: 1, 1: 2, 2: 2})[0], 0)
+        self.assertEqual(len(decayed_statistics.states), 2)
+
+    def test_restore_state_arrays(self):
+        for cache_row in [[1, 2, 2], [2, 0, 2], [2, 2, 1], [1, 2, 2]]:
+            self.decayed_statistics.add_row(cache_row)
+        restored_statistics = DecayedTransitionStatistics(3, half_life=2)
+        restored_statistics.restore_state_arrays(*self.decayed_statistics.state_arrays())
+        for decayed_statistics in (self.decayed_statistics, restored_statistics):
+            decayed_statistics.add_row([2, 0, 2])
+        self.assertEqual(list(restored_statistics.states), list(self.decayed_statistics.states))
+        for joint_channel_value_map in ({0: 1, 1: 2, 2: 2}, {0: 2, 1: 0, 2: 2}, {0: 2, 1: 2, 2: 1}):
+            matching_weight, next_step_empty_weights = restored_statistics.next_step_empty_counts(joint_channel_value_map)
+            expected_weight, expected_empty_weights = self.decayed_statistics.next_step_empty_counts(joint_channel_value_map)
+            self.assertAlmostEqual(matching_weight, expected_weight)
+            np.testing.assert_allclose(next_step_empty_weights, expected_empty_weights)
+        restored_statistics.restore_state_arrays(*DecayedTransitionStatistics(3, half_life=2).state_arrays())
+        self.assertEqual(len(restored_statistics.states), 0)
+        self.assertIsNone(restored_statistics.latest_state_key)
+
+    def test_default_max_states_bounds_memory(self):
+        decayed_statistics = DecayedTransitionStatistics(13, half_life=2)
+        cache_rows = np.random.default_rng(0).integers(0, 3, (DEFAULT_MAX_DECAYED_STATES + 100, 13), dtype=np.int8)
+        for cache_row in cache_rows:
+            decayed_statistics.add_row(cache_row)
+        self.assertEqual(len(decayed_statistics.states), DEFAULT_MAX_DECAYED_STATES)
+        self.assertNotIn(decayed_statistics.state_key(cache_rows[0]), decayed_statistics.states)
+        self.assertIn(decayed_statistics.state_key(cache_rows[-1]), decayed_statistics.states)
@@ -0,0 +1,156 @@
+import numpy as np
+import unittest
+from collections import deque
+
+'''Channel Occupancy Constants'''
+EMPTY = 0
+OCCUPIED = 1
+UNKNOWN = 2
+
+
+class _HistoryTrieNode:
+    __slots__ = ("count", "next_step_empty_counts", "children")
+
+    def __init__(self, number_of_channels):
+        self.count = 0
+        self.next_step_empty_counts = np.zeros(number_of_channels, dtype=np.int64)
+        self.children = {}
+
+
+class VariableOrderHistoryIndex:
+    def __init__(self, number_of_channels, history_order, min_support=1):
+        """ Conditions next step EMPTY counts on the last history_order joint states rather than only the current one.
+        Contexts are kept in a trie keyed newest state first, a node at depth k holds how often its k states
+        occurred in a row and, per channel, how often the row after them was EMPTY.
+        Lookups walk at most history_order nodes and back off to the longest context seen at least min_support times.
+        Kept up to date by ChannelCaches on every append, eviction and flush """
+        self.number_of_channels = number_of_channels
+        self.history_order = history_order
+        self.min_support = min_support
+        self.clear()
+
+    def clear(self):
+        self.root = _HistoryTrieNode(self.number_of_channels)
+        # (state key, EMPTY mask) of every indexed row, oldest first
+        self.rows = deque()
+
+    def state_key(self, cache_row):
+        return np.asarray(cache_row, dtype=np.int8).tobytes()
+
+    def joint_state_key(self, joint_channel_value_map):
+        """ Returns None if the map does not cover every channel, such partial maps can't be looked up.
+        A joint state vector, int8 with UNKNOWN for unsensed channels, is used as is """
+        if isinstance(joint_channel_value_map, np.ndarray):
+            return joint_channel_value_map.astype(np.int8, copy=False).tobytes()
+        if len(joint_channel_value_map) != self.number_of_channels:
+            return None
+        cache_row = np.empty(self.number_of_channels, dtype=np.int8)
+        for channel, value in joint_channel_value_map.items():
+            if not 0 <= channel < self.number_of_channels:
+                return None
+            cache_row[channel] = value
+        return cache_row.tobytes()
+
+    def add_row(self, cache_row):
+        """ Records cache_row as the newest row, adding the row after transition to every context ending at the
+        previous newest row and counting every context ending at cache_row """
+        empty_mask = np.asarray(cache_row) == EMPTY
+        node = self.root
+        for state_key, _ in self.__newest_rows(self.history_order):
+            node = node.children[state_key]
+            node.next_step_empty_counts += empty_mask
+
+        self.rows.append((self.state_key(cache_row), empty_mask))
+        node = self.root
+        for state_key, _ in self.__newest_rows(self.history_order):
+            child = node.children.get(state_key)
+            if child is None:
+                child = _HistoryTrieNode(self.number_of_channels)
+                node.children[state_key] = child
+            child.count += 1
+            node = child
+
+    def remove_oldest_row(self):
+        """ Forgets the oldest row, i.e every context starting at it and that context's transition """
+        for context_length in range(1, min(self.history_order, len(self.rows)) + 1):
+            path = [self.root]
+            for row in range(context_length - 1, -1, -1):
+                path.append(path[-1].children[self.rows[row][0]])
+            context_node = path[-1]
+            context_node.count -= 1
+            if context_length < len(self.rows):
+                context_node.next_step_empty_counts -= self.rows[context_length][1]
+            if context_node.count == 0:
+                del path[-2].children[self.rows[0][0]]
+        self.rows.popleft()
+
+    def __newest_rows(self, number_of_rows):
+        for row in range(len(self.rows) - 1, max(len(self.rows) - number_of_rows, 0) - 1, -1):
+            yield self.rows[row]
+
+    def next_step_empty_counts(self, joint_channel_value_map):
+        """ Returns (occurrences of the context used, per channel count of EMPTY in the row after it)
+        or None if the joint map is partial.
+        When the joint map is the newest row the context extends back through the history, otherwise it is the map alone """
+        state_key = self.joint_state_key(joint_channel_value_map)
+        if state_key is None:
+            return None
+        node = self.root.children.get(state_key)
+        if node is None:
+            return 0, np.zeros(self.number_of_channels, dtype=np.int64)
+        if self.rows and self.rows[-1][0] == state_key:
+            older_rows = self.__newest_rows(self.history_order)
+            next(older_rows)
+            for older_state_key, _ in older_rows:
+                child = node.children.get(older_state_key)
+                if child is None or child.count < self.min_support:
+                    break
+                node = child
+        return node.count, node.next_step_empty_counts.copy()
+
+
+class TestVariableOrderHistoryIndex(unittest.TestCase):
+    def setUp(self):
+        self.number_of_channels = 2
+        # after [1, 1] the next row is EMPTY on channel 0 only when [0, 1] came before it
+        self.channel_caches = [[0, 1], [1, 1], [0, 2], [1, 0], [1, 1], [2, 0], [0, 1], [1, 1], [0, 2], [1, 0], [1, 1]]
+
+    def create_history_index(self, history_order, min_support=1):
+        history_index = VariableOrderHistoryIndex(self.number_of_channels, history_order, min_support)
+        for cache_row in self.channel_caches:
+            history_index.add_row(cache_row)
+        return history_index
+
+    def test_first_order_matches_transition_counts(self):
+        matching_rows, next_step_empty_counts = self.create_history_index(1).next_step_empty_counts({0: 1, 1: 1})
+        self.assertEqual(matching_rows, 4)
+        self.assertEqual(list(next_step_empty_counts), [2, 1])
+
+    def test_second_order_context(self):
+        matching_rows, next_step_empty_counts = self.create_history_index(2).next_step_empty_counts({0: 1, 1: 0})
+        self.assertEqual(matching_rows, 2)
+        self.assertEqual(list(next_step_empty_counts), [0, 0])
+        # newest context is [1, 0], [1, 1]
+        matching_rows, next_step_empty_counts = self.create_history_index(3).next_step_empty_counts({0: 1, 1: 1})
+        self.assertEqual(matching_rows, 2)
+        self.assertEqual(list(next_step_empty_counts), [0, 1])
+
+    def test_back_off_to_supported_context(self):
+        matching_rows, _ = self.create_history_index(3, min_support=3).next_step_empty_counts({0: 1, 1: 1})
+        self.assertEqual(matching_rows, 4)
+
+    def test_remove_oldest_row_matches_rebuilt_index(self):
+        history_index = self.create_history_index(3)
+        for removed_rows in range(1, len(self.channel_caches)):
+            history_index.remove_oldest_row()
+            rebuilt_history_index = VariableOrderHistoryIndex(self.number_of_channels, 3)
+            for cache_row in self.channel_caches[removed_rows:]:
+                rebuilt_history_index.add_row(cache_row)
+            self.assert_tries_equal(history_index.root, rebuilt_history_index.root)
+
+    def assert_tries_equal(self, node, expected_node):
+        self.assertEqual(node.count, expected_node.count)
+        self.assertEqual(list(node.next_step_empty_counts), list(expected_node.next_step_empty_counts))
+        self.assertEqual(set(node.children), set(expected_node.children))
+        for state_key, child in node.children.items():
+            self.assert_tries_equal(child, expected_node.children[state_key])
@@ -0,0 +1,213 @@
+import numpy as np
+import random
+import unittest
+from transition_index import StateChangeTracker
+
+'''Channel Occupancy Constants'''
+EMPTY = 0
+OCCUPIED = 1
+UNKNOWN = 2
+
+'''Packing Constants'''
+BITS_PER_CHANNEL = 2
+CHANNELS_PER_VALUE_WORD = 32
+CHANNELS_PER_SENSED_WORD = 64
+CHANNEL_VALUE_BITS = np.uint64(3)
+LOW_BIT_OF_EVERY_CHANNEL = np.uint64(0x5555555555555555)
+VALUE_SHIFTS = np.arange(CHANNELS_PER_VALUE_WORD, dtype=np.uint64) * np.uint64(BITS_PER_CHANNEL)
+SENSED_SHIFTS = np.arange(CHANNELS_PER_SENSED_WORD, dtype=np.uint64)
+
+
+def number_of_words(number_of_channels, channels_per_word):
+    return -(-number_of_channels // channels_per_word)
+
+
+def pack_channel_values(cache_rows, number_of_channels):
+    """ Packs (..., channels) EMPTY/OCCUPIED/UNKNOWN values into (..., words) uint64, 2 bits per channel """
+    return _pack(np.asarray(cache_rows, dtype=np.uint64), number_of_channels, CHANNELS_PER_VALUE_WORD, VALUE_SHIFTS)
+
+
+def pack_sensed_mask(cache_rows, number_of_channels):
+    """ Packs which channels of (..., channels) were sensed, i.e not UNKNOWN, into (..., words) uint64, 1 bit per channel """
+    return _pack((np.asarray(cache_rows) != UNKNOWN).astype(np.uint64), number_of_channels, CHANNELS_PER_SENSED_WORD, SENSED_SHIFTS)
+
+
+def _pack(cache_rows, number_of_channels, channels_per_word, shifts):
+    words = number_of_words(number_of_channels, channels_per_word)
+    padding = [(0, 0)] * (cache_rows.ndim - 1) + [(0, words * channels_per_word - number_of_channels)]
+    cache_rows = np.pad(cache_rows, padding).reshape(cache_rows.shape[:-1] + (words, channels_per_word))
+    return np.bitwise_or.reduce(cache_rows << shifts, axis=-1)
+
+
+def unpack_channel_values(packed_rows, number_of_channels):
+    """ Inverse of pack_channel_values, returns (..., channels) int8 """
+    packed_rows = np.asarray(packed_rows, dtype=np.uint64)
+    channel_values = (packed_rows[..., None] >> VALUE_SHIFTS) & CHANNEL_VALUE_BITS
+    channel_values = channel_values.reshape(packed_rows.shape[:-1] + (-1,))
+    return channel_values[..., :number_of_channels].astype(np.int8)
+
+
+class PackedChannelCaches:
+    def __init__(self, number_of_channels, max_size, evict_oldest=False):
+        """ Ring buffer cache storing each row as uint64 words with 2 bits per channel,
+        plus a packed mask of which channels were sensed in that row.
+        Same interface as ChannelCaches including the generation counters and state change tracking,
+        flushes when full unless evict_oldest is set """
+        self.number_of_channels = number_of_channels
+        self.max_size = max_size
+        self.evict_oldest = evict_oldest
+        self.head = 0
+        self.size = 0
+        self.generation = 0
+        self.flush_generation = 0
+        self.state_change_tracker = None
+        self.packed_rows = np.zeros(
+            (max_size, number_of_words(number_of_channels, CHANNELS_PER_VALUE_WORD)), dtype=np.uint64)
+        self.sensed_masks = np.zeros(
+            (max_size, number_of_words(number_of_channels, CHANNELS_PER_SENSED_WORD)), dtype=np.uint64)
+
+    @property
+    def channel_caches(self):
+        """ Unpacked int8 cache rows in chronological order, oldest first """
+        return unpack_channel_values(self.packed_rows[self.__chronological_positions()], self.number_of_channels)
+
+    def __chronological_positions(self):
+        return (self.head + np.arange(self.size)) % self.max_size
+
+    def flush_cache(self):
+        self.head = 0
+        self.size = 0
+        self.generation += 1
+        self.flush_generation = self.generation
+        if self.state_change_tracker is not None:
+            self.state_change_tracker = StateChangeTracker(self.generation)
+
+    def track_state_changes(self):
+        if self.state_change_tracker is None:
+            self.state_change_tracker = StateChangeTracker(self.generation)
+
+    def state_generation(self, joint_state_key):
+        if self.state_change_tracker is None:
+            return None
+        return self.state_change_tracker.state_generation(joint_state_key)
+
+    def __unpacked_row(self, position):
+        return unpack_channel_values(self.packed_rows[position], self.number_of_channels)
+
+    def restore_rows(self, cache_rows):
+        """ Replaces the cache contents with (rows, channels) cache_rows, oldest first, e.g from a checkpoint """
+        assert(len(cache_rows) <= self.max_size)
+        self.flush_cache()
+        self.packed_rows[:len(cache_rows)] = pack_channel_values(cache_rows, self.number_of_channels)
+        self.sensed_masks[:len(cache_rows)] = pack_sensed_mask(cache_rows, self.number_of_channels)
+        self.size = len(cache_rows)
+        self.generation += 1
+
+    def evict_oldest_row(self):
+        if self.state_change_tracker is not None and self.size > 1:
+            self.state_change_tracker.mark_transition(
+                self.__unpacked_row(self.head), self.__unpacked_row((self.head + 1) % self.max_size), self.generation + 1)
+        self.head = (self.head + 1) % self.max_size
+        self.size -= 1
+
+    def cache_shape(self):
+        return (self.size, self.number_of_channels)
+
+    def add_all_current_channel_values_to_cache(self, sensed_channel_values):
+        """ Expects sensed_channel_values as dict {channel : sensed_value}, channels missing from it are cached as UNKNOWN """
+        new_cache_row = np.full(self.number_of_channels, UNKNOWN, dtype=np.int8)
+        for channel, sensed_value in sensed_channel_values.items():
+            new_cache_row[channel] = sensed_value
+        self.add_joint_channel_values_to_cache(new_cache_row)
+
+    def add_joint_channel_values_to_cache(self, joint_channel_values):
+        """ Same as add_all_current_channel_values_to_cache for an int8 (channels,) joint state vector """
+        if self.size == self.max_size:
+            if self.evict_oldest:
+                self.evict_oldest_row()
+            else:
+                self.flush_cache()
+
+        if self.state_change_tracker is not None and self.size > 0:
+            self.state_change_tracker.mark_transition(
+                self.__unpacked_row((self.head + self.size - 1) % self.max_size), joint_channel_values, self.generation + 1)
+        position = (self.head + self.size) % self.max_size
+        self.packed_rows[position] = pack_channel_values(joint_channel_values, self.number_of_channels)
+        self.sensed_masks[position] = pack_sensed_mask(joint_channel_values, self.number_of_channels)
+        self.size += 1
+        self.generation += 1
+
+    def next_step_empty_counts(self, joint_channel_value_map):
+        """ Returns (matching rows, per channel count of EMPTY in the row after a match).
+        Rows are first filtered on the packed sensed mask, then by a masked compare of the value words """
+        if self.size == 0:
+            return 0, np.zeros(self.number_of_channels, dtype=np.int64)
+        if isinstance(joint_channel_value_map, np.ndarray):
+            query_row = joint_channel_value_map
+            query_channels = np.ones(self.number_of_channels, dtype=np.int8)
+        else:
+            query_row = np.full(self.number_of_channels, UNKNOWN, dtype=np.int8)
+            query_channels = np.zeros(self.number_of_channels, dtype=np.int8)
+            for channel, value in joint_channel_value_map.items():
+                query_row[channel] = value
+                query_channels[channel] = 1
+        query_words = pack_channel_values(query_row, self.number_of_channels)
+        query_value_mask = pack_channel_values(
+            query_channels.astype(np.uint64) * CHANNEL_VALUE_BITS, self.number_of_channels)
+        query_sensed_mask = pack_sensed_mask(query_row, self.number_of_channels)
+        query_channel_mask = _pack(query_channels.astype(np.uint64), self.number_of_channels,
+                                   CHANNELS_PER_SENSED_WORD, SENSED_SHIFTS)
+
+        positions = self.__chronological_positions()
+        sensed_matches = np.all(
+            ((self.sensed_masks[positions] ^ query_sensed_mask) & query_channel_mask) == 0, axis=1)
+        candidate_rows = np.flatnonzero(sensed_matches)
+        value_matches = np.all(
+            ((self.packed_rows[positions[candidate_rows]] ^ query_words) & query_value_mask) == 0, axis=1)
+        matching_rows = candidate_rows[value_matches]
+
+        following_rows = matching_rows[matching_rows < self.size - 1] + 1
+        following_words = self.packed_rows[positions[following_rows]]
+        empty_bits = ~(following_words | (following_words >> np.uint64(1))) & LOW_BIT_OF_EVERY_CHANNEL
+        empty_counts = ((empty_bits[..., None] >> VALUE_SHIFTS) & np.uint64(1)).sum(axis=0, dtype=np.int64)
+        return len(matching_rows), empty_counts.reshape(-1)[:self.number_of_channels]
+
+
+class TestPackedChannelCaches(unittest.TestCase):
+    def setUp(self):
+        self.number_of_channels = 37
+        self.max_size = 20
+        self.channel_caches = PackedChannelCaches(self.number_of_channels, self.max_size, evict_oldest=True)
+
+    def test_pack_and_unpack_channel_values(self):
+        cache_rows = np.random.default_rng(1).integers(0, 3, (5, self.number_of_channels)).astype(np.int8)
+        packed_rows = pack_channel_values(cache_rows, self.number_of_channels)
+        self.assertEqual(packed_rows.shape, (5, 2))
+        np.testing.assert_array_equal(unpack_channel_values(packed_rows, self.number_of_channels), cache_rows)
+
+    def test_add_all_current_channel_values_to_cache(self):
+        self.channel_caches.add_all_current_channel_values_to_cache({0: 1, 33: 0})
+        self.assertEqual(self.channel_caches.size, 1)
+        last_cache_row_inserted = self.channel_caches.channel_caches[-1]
+        self.assertEqual(last_cache_row_inserted[0], 1)
+        self.assertEqual(last_cache_row_inserted[33], 0)
+        self.assertEqual(np.count_nonzero(last_cache_row_inserted == UNKNOWN), self.number_of_channels - 2)
+
+    def test_next_step_empty_counts_matches_cache_scan(self):
+        cache_random = random.Random(5)
+        for _ in range(self.max_size + 7):
+            sensed_channels = cache_random.sample(range(self.number_of_channels), 3)
+            self.channel_caches.add_all_current_channel_values_to_cache(
+                {channel: cache_random.randint(0, 1) for channel in sensed_channels})
+        channel_caches = self.channel_caches.channel_caches
+        self.assertEqual(len(channel_caches), self.max_size)
+
+        joint_channel_value_maps = [dict(enumerate(channel_caches[-1])), dict(enumerate(channel_caches[3])),
+                                    {channel: channel_caches[8][channel] for channel in range(0, self.number_of_channels, 5)}]
+        for joint_channel_value_map in joint_channel_value_maps:
+            matching_rows = np.all(channel_caches[:, list(joint_channel_value_map.keys())] ==
+                                   list(joint_channel_value_map.values()), axis=1)
+            expected_empty_counts = np.count_nonzero(channel_caches[1:][matching_rows[:-1]] == EMPTY, axis=0)
+            result_matching_rows, result_empty_counts = self.channel_caches.next_step_empty_counts(joint_channel_value_map)
+            self.assertEqual(result_matching_rows, np.count_nonzero(matching_rows))
+            np.testing.assert_array_equal(result_empty_counts, expected_empty_counts)
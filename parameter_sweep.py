@@ -0,0 +1,142 @@
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from simulation import complete_config, is_valid_config, run_simulation
+
+PROPORTION_METRICS = ["proportion_correct",
+                      "proportion_correct_ignoring_dead_ends", "proportion_random_correct"]
+
+
+def create_sweep_configs(sweep_grid, base_config=None):
+    """ Expects sweep_grid as dict {config key : list of values}, returns every valid combination as a complete config """
+    sweep_keys = sorted(sweep_grid.keys())
+    configs = []
+    for sweep_values in itertools.product(*(sweep_grid[key] for key in sweep_keys)):
+        config = dict(base_config or {})
+        config.update(zip(sweep_keys, sweep_values))
+        if is_valid_config(config):
+            configs.append(complete_config(config))
+    return configs
+
+
+def config_key(config):
+    return json.dumps(config, sort_keys=True)
+
+
+def read_completed_runs(results_path):
+    """ Returns the results file entries, ignoring a partially written last line left by an interrupted sweep """
+    completed_runs = []
+    if not os.path.exists(results_path):
+        return completed_runs
+    with open(results_path) as results_file:
+        for line in results_file:
+            try:
+                completed_runs.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return completed_runs
+
+
+def terminate_partial_last_line(results_path):
+    """ Ends an interrupted write with a newline so the next result starts on its own line """
+    if not os.path.exists(results_path) or os.path.getsize(results_path) == 0:
+        return
+    with open(results_path, "rb+") as results_file:
+        results_file.seek(-1, os.SEEK_END)
+        if results_file.read(1) != b"\n":
+            results_file.write(b"\n")
+
+
+def _run_sweep_task(config_and_seed):
+    config, seed = config_and_seed
+    return config, seed, run_simulation(config, seed)
+
+
+def run_sweep(sweep_grid, seeds, results_path, base_config=None, processes=None):
+    """ Runs every config of the sweep for every seed on a process pool, appending one JSON line per run to results_path.
+    Runs already in results_path are skipped so an interrupted sweep can be resumed. Returns the number of runs made """
+    completed = {(config_key(run["config"]), run["seed"]) for run in read_completed_runs(results_path)}
+    sweep_tasks = [(config, seed) for config in create_sweep_configs(sweep_grid, base_config) for seed in seeds
+                   if (config_key(config), seed) not in completed]
+    if not sweep_tasks:
+        return 0
+
+    terminate_partial_last_line(results_path)
+    with open(results_path, "a") as results_file, ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as executor:
+        futures = [executor.submit(_run_sweep_task, sweep_task) for sweep_task in sweep_tasks]
+        for future in as_completed(futures):
+            config, seed, metrics = future.result()
+            results_file.write(json.dumps({"config": config, "seed": seed, "metrics": metrics}) + "\n")
+            results_file.flush()
+    return len(sweep_tasks)
+
+
+def aggregate_sweep_results(results_path, summary_path=None):
+    """ Averages the proportion metrics of every config over its seeds, optionally writing the summary as JSON """
+    runs_by_config = {}
+    for run in read_completed_runs(results_path):
+        runs_by_config.setdefault(config_key(run["config"]), []).append(run)
+
+    summary = []
+    for runs in runs_by_config.values():
+        config_summary = {"config": runs[0]["config"], "number_of_seeds": len(runs)}
+        for metric in PROPORTION_METRICS:
+            config_summary[metric] = sum(run["metrics"][metric] for run in runs) / len(runs)
+        summary.append(config_summary)
+
+    if summary_path is not None:
+        with open(summary_path, "w") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep CoopController parameters over many seeds")
+    parser.add_argument("sweep_grid", help="JSON file of {config key : list of values}, see simulation.DEFAULT_SIMULATION_CONFIG")
+    parser.add_argument("--seeds", type=int, default=10)
+    parser.add_argument("--results", default="sweep_results.jsonl")
+    parser.add_argument("--summary", default="sweep_summary.json")
+    parser.add_argument("--processes", type=int, default=None)
+    arguments = parser.parse_args()
+
+    with open(arguments.sweep_grid) as sweep_grid_file:
+        sweep_grid = json.load(sweep_grid_file)
+    number_of_runs = run_sweep(sweep_grid, range(arguments.seeds), arguments.results, processes=arguments.processes)
+    summary = aggregate_sweep_results(arguments.results, arguments.summary)
+    print("RUNS MADE: ", number_of_runs)
+    print("CONFIGS SUMMARISED: ", len(summary))
+
+
+class TestParameterSweep(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.results_path = os.path.join(self.temporary_directory.name, "results.jsonl")
+        self.base_config = {"traffic_length": 300, "max_channel_cache_size": 64}
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_create_sweep_configs_skips_invalid_configs(self):
+        configs = create_sweep_configs({"min_channel_cache_size": [16, 24, 32], "number_of_radio_units": [1, 2]},
+                                       self.base_config)
+        self.assertEqual(len(configs), 4)
+
+    def test_run_sweep_resumes(self):
+        sweep_grid = {"min_channel_cache_size": [16, 32]}
+        self.assertEqual(run_sweep(sweep_grid, [0, 1], self.results_path, self.base_config, processes=2), 4)
+        with open(self.results_path, "a") as results_file:
+            results_file.write('{"config": ')
+        self.assertEqual(run_sweep(sweep_grid, [0, 1, 2], self.results_path, self.base_config, processes=2), 2)
+
+        summary = aggregate_sweep_results(self.results_path)
+        self.assertEqual(len(summary), 2)
+        for config_summary in summary:
+            self.assertEqual(config_summary["number_of_seeds"], 3)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import numpy as np
+import unittest
+
+'''Channel owner of a channel no radio unit is sensing'''
+NO_RADIO_UNIT = -1
+
+
+class RadioUnitView:
+    __slots__ = ("radio_pool", "radio_unit_index")
+
+    def __init__(self, radio_pool, radio_unit_index):
+        """ RadioUnit-style view of one radio unit of a RadioPool, setting sensing_channel swaps through the pool
+        so a radio unit already sensing the channel takes this one's old channel """
+        self.radio_pool = radio_pool
+        self.radio_unit_index = radio_unit_index
+
+    @property
+    def sensing_channel(self):
+        return int(self.radio_pool.sensing_channels[self.radio_unit_index])
+
+    @sensing_channel.setter
+    def sensing_channel(self, channel):
+        self.radio_pool.swap_to_channel(self.radio_unit_index, channel)
+
+
+class RadioPool:
+    def __init__(self, number_of_radio_units, number_of_channels):
+        """ Radio units held as a sensing_channels array plus its inverse channel_owners,
+        the radio unit sensing each channel or NO_RADIO_UNIT, so no two radio units sense the same channel.
+        Radio unit i starts on channel i.
+        Indexing and iterating give RadioUnitView objects so the pool can stand in for a list of RadioUnit """
+        assert(number_of_radio_units <= number_of_channels)
+        self.number_of_radio_units = number_of_radio_units
+        self.number_of_channels = number_of_channels
+        self.set_sensing_channels(np.arange(number_of_radio_units))
+        self.radio_unit_views = [RadioUnitView(self, radio_unit_index) for radio_unit_index in range(number_of_radio_units)]
+
+    def __len__(self):
+        return self.number_of_radio_units
+
+    def __getitem__(self, radio_unit_index):
+        return self.radio_unit_views[radio_unit_index]
+
+    def __iter__(self):
+        return iter(self.radio_unit_views)
+
+    def set_sensing_channels(self, sensing_channels):
+        """ Replaces every radio unit's channel and rebuilds channel_owners, sensing_channels must be distinct """
+        self.sensing_channels = np.array(sensing_channels, dtype=np.int64)
+        assert(len(np.unique(self.sensing_channels)) == self.number_of_radio_units)
+        self.channel_owners = np.full(self.number_of_channels, NO_RADIO_UNIT, dtype=np.int64)
+        self.channel_owners[self.sensing_channels] = np.arange(self.number_of_radio_units)
+
+    def owner_of(self, channel):
+        return int(self.channel_owners[channel])
+
+    def advance_all(self):
+        """ Every radio unit moves to its next channel, wrapping to 0 """
+        self.sensing_channels += 1
+        self.sensing_channels %= self.number_of_channels
+        self.channel_owners = np.roll(self.channel_owners, 1)
+
+    def swap_to_channel(self, radio_unit_index, channel):
+        """ Moves radio unit radio_unit_index to channel, a radio unit already sensing channel takes its old channel """
+        current_channel = self.sensing_channels[radio_unit_index]
+        owner = self.channel_owners[channel]
+        if owner != NO_RADIO_UNIT:
+            self.sensing_channels[owner] = current_channel
+        self.channel_owners[current_channel] = owner
+        self.sensing_channels[radio_unit_index] = channel
+        self.channel_owners[channel] = radio_unit_index
+
+    def assign_channels(self, radio_unit_indexes, channels):
+        """ Moves each of radio_unit_indexes to its channel without swapping. The channels must be distinct
+        and not sensed by any radio unit outside radio_unit_indexes """
+        radio_unit_indexes = np.asarray(radio_unit_indexes, dtype=np.int64)
+        channels = np.asarray(channels, dtype=np.int64)
+        assert(len(np.unique(channels)) == len(channels))
+        assert(np.all(np.isin(self.channel_owners[channels], radio_unit_indexes) |
+                      (self.channel_owners[channels] == NO_RADIO_UNIT)))
+        previous_channels = self.sensing_channels[radio_unit_indexes]
+        vacated = self.channel_owners[previous_channels] == radio_unit_indexes
+        self.channel_owners[previous_channels[vacated]] = NO_RADIO_UNIT
+        self.sensing_channels[radio_unit_indexes] = channels
+        self.channel_owners[self.sensing_channels[radio_unit_indexes]] = radio_unit_indexes
+
+
+class TestRadioPool(unittest.TestCase):
+    def setUp(self):
+        self.radio_pool = RadioPool(3, 5)
+
+    def assert_inverse_consistent(self):
+        for radio_unit_index, channel in enumerate(self.radio_pool.sensing_channels):
+            self.assertEqual(self.radio_pool.owner_of(channel), radio_unit_index)
+        self.assertEqual(np.count_nonzero(self.radio_pool.channel_owners != NO_RADIO_UNIT), len(self.radio_pool))
+
+    def test_advance_all(self):
+        for _ in range(3):
+            self.radio_pool.advance_all()
+        self.assertEqual([radio_unit.sensing_channel for radio_unit in self.radio_pool], [3, 4, 0])
+        self.assert_inverse_consistent()
+
+    def test_swap_to_channel(self):
+        self.radio_pool.swap_to_channel(0, 2)
+        self.assertEqual(list(self.radio_pool.sensing_channels), [2, 1, 0])
+        self.radio_pool.swap_to_channel(0, 4)
+        self.assertEqual(list(self.radio_pool.sensing_channels), [4, 1, 0])
+        self.assertEqual(self.radio_pool.owner_of(2), NO_RADIO_UNIT)
+        self.assert_inverse_consistent()
+
+    def test_views_assign_through_pool(self):
+        self.radio_pool[1].sensing_channel = 3
+        self.radio_pool.assign_channels([0, 2], [1, 4])
+        self.assertEqual([radio_unit.sensing_channel for radio_unit in self.radio_pool], [1, 3, 4])
+        self.assert_inverse_consistent()
+
+    def test_views_swap_onto_sensed_channels(self):
+        for radio_unit in self.radio_pool:
+            radio_unit.sensing_channel = 4
+        self.assertEqual([radio_unit.sensing_channel for radio_unit in self.radio_pool], [1, 2, 4])
+        self.assert_inverse_consistent()
+        self.radio_pool.advance_all()
+        self.assertEqual([radio_unit.sensing_channel for radio_unit in self.radio_pool], [2, 3, 0])
+        self.assert_inverse_consistent()
+
+    def test_assign_channels_keeps_channels_distinct(self):
+        with self.assertRaises(AssertionError):
+            self.radio_pool.assign_channels([0, 1], [3, 3])
+        with self.assertRaises(AssertionError):
+            self.radio_pool.assign_channels([0], [2])
+        self.radio_pool.assign_channels([0, 2], [2, 0])
+        self.assertEqual(list(self.radio_pool.sensing_channels), [2, 1, 0])
+        self.assert_inverse_consistent()
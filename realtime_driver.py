@@ -0,0 +1,307 @@
+import asyncio
+import numpy as np
+import socket
+import struct
+import time
+import unittest
+from abc import ABC, abstractmethod
+from coop_controller import CoopController
+from traffic_sources import InMemoryTrafficSource
+
+'''Sensing report datagram: slot, radio unit index, channel, sensed value'''
+REPORT_FORMAT = struct.Struct("<qiib")
+
+
+class SensingReportSource(ABC):
+    """ Where RealTimeDriver gets (slot, radio_unit_index, channel, sensed_value) reports from """
+
+    async def open(self):
+        pass
+
+    def start_slot(self, slot, radio_units):
+        """ Called by the driver at the start of every slot, stand-in sources use it to emit that slot's reports """
+        pass
+
+    @abstractmethod
+    async def get_report(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class InProcessSensingReportSource(SensingReportSource):
+    def __init__(self, traffic_source):
+        """ Stand-in radio units sensing a TrafficSource, slot n reads time step n, reports go through an asyncio queue """
+        self.traffic_source = traffic_source
+        self.reports = asyncio.Queue()
+
+    def start_slot(self, slot, radio_units):
+        current_traffic = self.traffic_source.get_traffic_at(slot)
+        for radio_unit_index, radio_unit in enumerate(radio_units):
+            self.reports.put_nowait((slot, radio_unit_index, radio_unit.sensing_channel,
+                                     int(current_traffic[radio_unit.sensing_channel])))
+
+    async def get_report(self):
+        return await self.reports.get()
+
+
+class _SensingReportProtocol(asyncio.DatagramProtocol):
+    def __init__(self, reports):
+        self.reports = reports
+
+    def datagram_received(self, data, address):
+        if len(data) == REPORT_FORMAT.size:
+            self.reports.put_nowait(REPORT_FORMAT.unpack(data))
+
+
+class UdpSensingReportSource(SensingReportSource):
+    def __init__(self, host="127.0.0.1", port=0):
+        """ Receives REPORT_FORMAT datagrams on (host, port), port 0 picks a free port, see address once opened """
+        self.host = host
+        self.port = port
+        self.reports = asyncio.Queue()
+        self.transport = None
+        self.address = None
+
+    async def open(self):
+        self.transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _SensingReportProtocol(self.reports), local_addr=(self.host, self.port))
+        self.address = self.transport.get_extra_info("sockname")
+
+    async def get_report(self):
+        return await self.reports.get()
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+
+class UdpLoopbackSensingReportSource(UdpSensingReportSource):
+    def __init__(self, traffic_source, port=0):
+        """ Stand-in radio units sensing a TrafficSource that send their reports to this source over loopback UDP """
+        super().__init__("127.0.0.1", port)
+        self.traffic_source = traffic_source
+        self.sender = None
+
+    async def open(self):
+        await super().open()
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sender.setblocking(False)
+
+    def start_slot(self, slot, radio_units):
+        current_traffic = self.traffic_source.get_traffic_at(slot)
+        for radio_unit_index, radio_unit in enumerate(radio_units):
+            self.sender.sendto(REPORT_FORMAT.pack(slot, radio_unit_index, radio_unit.sensing_channel,
+                                                  int(current_traffic[radio_unit.sensing_channel])), self.address)
+
+    def close(self):
+        super().close()
+        if self.sender is not None:
+            self.sender.close()
+            self.sender = None
+
+
+class EventLoopClock:
+    """ The running asyncio event loop's monotonic clock, RealTimeDriver's default time source """
+
+    def time(self):
+        return asyncio.get_running_loop().time()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    async def wait_for(self, awaitable, timeout):
+        return await asyncio.wait_for(awaitable, timeout)
+
+
+class ManualClock:
+    def __init__(self, start=0.0, wait_limit=5.0):
+        """ Time source that only moves when slept on or advanced, for deterministic runs of RealTimeDriver.
+        wait_for never times out while time stands still, only the real wait_limit seconds guard against a lost report """
+        self.now = start
+        self.wait_limit = wait_limit
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    async def sleep(self, seconds):
+        self.now += max(0, seconds)
+        await asyncio.sleep(0)
+
+    async def wait_for(self, awaitable, timeout):
+        if timeout <= 0:
+            awaitable.close()
+            raise asyncio.TimeoutError()
+        return await asyncio.wait_for(awaitable, self.wait_limit)
+
+
+class RealTimeDriver:
+    def __init__(self, coop_controller, report_source, slot_duration, decision_deadline=None, clock=None):
+        """ Drives coop_controller on a fixed slot clock of slot_duration seconds.
+        Each slot waits for one report per radio unit, then caches and switches,
+        all within decision_deadline seconds of the slot start, slot_duration by default.
+        Slots are timed from the start of the run, so after an overrun the slots whose start has passed are dropped
+        rather than shifting the clock. clock is the time source, an EventLoopClock by default, see ManualClock """
+        self.coop_controller = coop_controller
+        self.report_source = report_source
+        self.slot_duration = slot_duration
+        self.decision_deadline = slot_duration if decision_deadline is None else decision_deadline
+        self.decision_latencies = np.empty(0)
+        self.clock = EventLoopClock() if clock is None else clock
+
+    def reset_statistics(self, number_of_slots):
+        self.decision_latencies = np.full(number_of_slots, np.nan)
+        self.deadline_misses = 0
+        self.missed_slots = 0
+        self.incomplete_slots = 0
+        self.stale_reports = 0
+
+    async def run(self, number_of_slots):
+        """ Runs number_of_slots slots and returns statistics() """
+        self.reset_statistics(number_of_slots)
+        await self.report_source.open()
+        try:
+            start = self.clock.time()
+            slot = 0
+            while slot < number_of_slots:
+                current_slot = int((self.clock.time() - start) // self.slot_duration)
+                if current_slot > slot:
+                    self.missed_slots += min(current_slot, number_of_slots) - slot
+                    slot = current_slot
+                    continue
+                slot_start = start + slot * self.slot_duration
+                await self.clock.sleep(max(0, slot_start - self.clock.time()))
+
+                self.report_source.start_slot(slot, self.coop_controller.radio_units)
+                sensed_channel_values = await self.__collect_reports(slot, slot_start + self.decision_deadline)
+                if sensed_channel_values is None:
+                    self.incomplete_slots += 1
+                else:
+                    self.coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+                    self.coop_controller.trigger_radio_unit_switching(sensed_channel_values)
+                    decision_latency = self.clock.time() - slot_start
+                    self.decision_latencies[slot] = decision_latency
+                    if decision_latency > self.decision_deadline:
+                        self.deadline_misses += 1
+                slot += 1
+        finally:
+            self.report_source.close()
+        return self.statistics()
+
+    async def __collect_reports(self, slot, deadline):
+        """ {channel : sensed_value} once every radio unit has reported for slot, None if the deadline passes first """
+        sensed_channel_values = {}
+        reported_radio_units = set()
+        while len(reported_radio_units) < self.coop_controller.number_of_radio_units:
+            try:
+                report_slot, radio_unit_index, channel, sensed_value = await self.clock.wait_for(
+                    self.report_source.get_report(), deadline - self.clock.time())
+            except asyncio.TimeoutError:
+                return None
+            if report_slot != slot:
+                self.stale_reports += 1
+                continue
+            sensed_channel_values[channel] = sensed_value
+            reported_radio_units.add(radio_unit_index)
+        return sensed_channel_values
+
+    def statistics(self):
+        decision_latencies = self.decision_latencies[~np.isnan(self.decision_latencies)]
+        statistics = {"slots_decided": len(decision_latencies), "deadline_misses": self.deadline_misses,
+                      "missed_slots": self.missed_slots, "incomplete_slots": self.incomplete_slots,
+                      "stale_reports": self.stale_reports}
+        if len(decision_latencies) != 0:
+            statistics["decision_latency_p50_s"] = float(np.percentile(decision_latencies, 50))
+            statistics["decision_latency_p99_s"] = float(np.percentile(decision_latencies, 99))
+            statistics["decision_latency_max_s"] = float(decision_latencies.max())
+        return statistics
+
+
+class TestRealTimeDriver(unittest.TestCase):
+    class SlowCoopController(CoopController):
+        def __init__(self, slow_decision, delay, clock, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.slow_decision = slow_decision
+            self.delay = delay
+            self.clock = clock
+            self.decisions = 0
+
+        def trigger_radio_unit_switching(self, current_sensed_values):
+            self.decisions += 1
+            if self.decisions == self.slow_decision:
+                self.clock.advance(self.delay)
+            return super().trigger_radio_unit_switching(current_sensed_values)
+
+    def setUp(self):
+        traffic_random = np.random.default_rng(3)
+        self.traffic = traffic_random.integers(0, 2, (6, 40), dtype=np.int8)
+        self.number_of_slots = 20
+        # a power of two so slot starts are exact in floating point
+        self.slot_duration = 1 / 32
+
+    def create_coop_controller(self):
+        return CoopController(2, 6, 42, 7, switch_options={"random_seed": 0})
+
+    def assert_matches_synchronous_run(self, coop_controller):
+        synchronous_coop_controller = self.create_coop_controller()
+        for time_step in range(self.number_of_slots):
+            sensed_channel_values = synchronous_coop_controller.get_current_sensed_channel_values_from_radio_units(
+                self.traffic[:, time_step])
+            synchronous_coop_controller.add_all_current_channel_values_to_cache_including_unknowns(sensed_channel_values)
+            synchronous_coop_controller.trigger_radio_unit_switching(sensed_channel_values)
+        np.testing.assert_array_equal(coop_controller.channel_caches.channel_caches,
+                                      synchronous_coop_controller.channel_caches.channel_caches)
+
+    def test_in_process_source_matches_synchronous_run(self):
+        coop_controller = self.create_coop_controller()
+        driver = RealTimeDriver(coop_controller, InProcessSensingReportSource(InMemoryTrafficSource(self.traffic)),
+                                slot_duration=self.slot_duration, clock=ManualClock())
+        statistics = asyncio.run(driver.run(self.number_of_slots))
+        self.assertEqual(statistics["slots_decided"], self.number_of_slots)
+        self.assertEqual(statistics["decision_latency_max_s"], 0)
+        self.assert_matches_synchronous_run(coop_controller)
+
+    def test_udp_loopback_source(self):
+        coop_controller = self.create_coop_controller()
+        driver = RealTimeDriver(coop_controller, UdpLoopbackSensingReportSource(InMemoryTrafficSource(self.traffic)),
+                                slot_duration=self.slot_duration, clock=ManualClock())
+        statistics = asyncio.run(driver.run(self.number_of_slots))
+        self.assertEqual(statistics["slots_decided"], self.number_of_slots)
+        self.assert_matches_synchronous_run(coop_controller)
+
+    def test_overrun_keeps_slot_clock(self):
+        clock = ManualClock()
+        coop_controller = self.SlowCoopController(5, 5 * self.slot_duration / 2, clock, 2, 6, 42, 7)
+        driver = RealTimeDriver(coop_controller, InProcessSensingReportSource(InMemoryTrafficSource(self.traffic)),
+                                slot_duration=self.slot_duration, clock=clock)
+        statistics = asyncio.run(driver.run(10))
+        # slot 4 decides 2.5 slots after its start, slot 5 has started and ended by then and is dropped
+        self.assertEqual(statistics["deadline_misses"], 1)
+        self.assertEqual(statistics["missed_slots"], 1)
+        self.assertEqual(statistics["slots_decided"], 9)
+        self.assertEqual(statistics["decision_latency_max_s"], 5 * self.slot_duration / 2)
+
+    def test_incomplete_slot_when_reports_never_arrive(self):
+        driver = RealTimeDriver(self.create_coop_controller(), UdpSensingReportSource(),
+                                slot_duration=self.slot_duration, clock=ManualClock(wait_limit=0.05))
+        statistics = asyncio.run(driver.run(1))
+        self.assertEqual(statistics["incomplete_slots"], 1)
+        self.assertEqual(statistics["slots_decided"], 0)
+
+    def test_event_loop_clock_accounts_for_every_slot(self):
+        driver = RealTimeDriver(self.create_coop_controller(),
+                                InProcessSensingReportSource(InMemoryTrafficSource(self.traffic)), slot_duration=0.01)
+        statistics = asyncio.run(driver.run(5))
+        self.assertEqual(statistics["slots_decided"] + statistics["incomplete_slots"] + statistics["missed_slots"], 5)
+
+    def test_incomplete_report_source_fails_on_construction(self):
+        class IncompleteSensingReportSource(SensingReportSource):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteSensingReportSource()
@@ -0,0 +1,203 @@
+import numpy as np
+import unittest
+
+'''Channel Occupancy Constants'''
+EMPTY = 0
+OCCUPIED = 1
+UNKNOWN = 2
+
+'''Ticks of random baseline channels drawn per generator call, fixed so chunked and whole draws give the same channels'''
+RANDOM_BASELINE_CHUNK_LENGTH = 1 << 16
+
+
+def switching_metrics(total_smart_switches, correct_count, incorrect_count, random_score, number_of_timesteps):
+    return {
+        "total_smart_switches": total_smart_switches,
+        "correct_count": correct_count,
+        "incorrect_count": incorrect_count,
+        "random_score": random_score,
+        "proportion_correct": correct_count / total_smart_switches if total_smart_switches != 0 else 0,
+        "proportion_correct_ignoring_dead_ends":
+            correct_count / (correct_count + incorrect_count) if correct_count + incorrect_count != 0 else 0,
+        "proportion_random_correct": random_score / total_smart_switches if total_smart_switches != 0 else 0,
+        "number_of_timesteps": number_of_timesteps,
+    }
+
+
+def random_baseline_channel_chunks(number_of_channels, number_of_timesteps, seed=None):
+    """ Yields the channel a random policy would pick at each tick, RANDOM_BASELINE_CHUNK_LENGTH ticks at a time """
+    random_generator = np.random.default_rng(seed)
+    for start in range(0, number_of_timesteps, RANDOM_BASELINE_CHUNK_LENGTH):
+        yield random_generator.integers(
+            0, number_of_channels, min(RANDOM_BASELINE_CHUNK_LENGTH, number_of_timesteps - start), dtype=np.int32)
+
+
+def random_baseline_channels(number_of_channels, number_of_timesteps, seed=None):
+    """ The channel a random policy would pick at each tick, shared by RunningScore, DecisionLog and evaluate_decision_log """
+    return np.concatenate([np.empty(0, dtype=np.int32)] + list(
+        random_baseline_channel_chunks(number_of_channels, number_of_timesteps, seed)))
+
+
+def score_decisions(chosen_values, empty_channel_counts, random_channel_values, number_of_channels, number_of_timesteps):
+    """ Scores the ticks after smart switches, given per scored tick the value of the chosen channel,
+    how many channels were EMPTY and the value of the random baseline's channel.
+    A chosen EMPTY channel is correct, a chosen OCCUPIED channel while another was EMPTY is incorrect.
+    Adds the expected random baseline and the oracle, which is correct whenever any channel is EMPTY """
+    chosen_values = np.asarray(chosen_values)
+    empty_channel_counts = np.asarray(empty_channel_counts)
+    return decision_metrics(len(chosen_values), int(np.count_nonzero(chosen_values == EMPTY)),
+                            int(np.count_nonzero((chosen_values == OCCUPIED) & (empty_channel_counts > 0))),
+                            int(np.count_nonzero(np.asarray(random_channel_values) == EMPTY)),
+                            int(empty_channel_counts.sum()), int(np.count_nonzero(empty_channel_counts)),
+                            number_of_channels, number_of_timesteps)
+
+
+def decision_metrics(total_smart_switches, correct_count, incorrect_count, random_score, empty_channel_total, oracle_count, number_of_channels, number_of_timesteps):
+    """ switching_metrics plus the expected random baseline, from the EMPTY channels summed over the scored ticks,
+    and the oracle, from the scored ticks with any EMPTY channel """
+    metrics = switching_metrics(total_smart_switches, correct_count, incorrect_count, random_score, number_of_timesteps)
+    expected_random_score = empty_channel_total / number_of_channels
+    metrics["expected_random_score"] = expected_random_score
+    metrics["proportion_expected_random_correct"] = \
+        expected_random_score / total_smart_switches if total_smart_switches != 0 else 0
+    metrics["oracle_count"] = oracle_count
+    metrics["proportion_oracle_correct"] = oracle_count / total_smart_switches if total_smart_switches != 0 else 0
+    return metrics
+
+
+def evaluate_decision_log(traffic_data, decision_ticks, chosen_channels, seed=None):
+    """ Scores a decision log against the full (channels, traffic_length) traffic as whole array operations.
+    decision_ticks are the ticks after smart switches, chosen_channels the monitored radio unit's channel at each.
+    seed drives the sampled random baseline, matching a DecisionLog with the same seed """
+    traffic_data = np.asarray(traffic_data)
+    number_of_channels, number_of_timesteps = traffic_data.shape
+    decision_ticks = np.asarray(decision_ticks, dtype=np.int64)
+    random_channels = random_baseline_channels(number_of_channels, number_of_timesteps, seed)[decision_ticks]
+    empty_channel_counts = np.count_nonzero(traffic_data == EMPTY, axis=0)
+    return score_decisions(traffic_data[np.asarray(chosen_channels), decision_ticks],
+                           empty_channel_counts[decision_ticks],
+                           traffic_data[random_channels, decision_ticks],
+                           number_of_channels, number_of_timesteps)
+
+
+class RunningScore:
+    def __init__(self, number_of_channels, number_of_timesteps, seed=None):
+        """ Scores a live run in constant memory with running counters, giving the metrics of a DecisionLog with the same seed.
+        The random baseline's channels are drawn a chunk at a time as the scored ticks, recorded in increasing order, reach them """
+        self.number_of_channels = number_of_channels
+        self.number_of_timesteps = number_of_timesteps
+        self.random_channel_chunks = random_baseline_channel_chunks(number_of_channels, number_of_timesteps, seed)
+        self.random_channels = np.empty(0, dtype=np.int32)
+        self.random_channels_start = 0
+        self.total_smart_switches = 0
+        self.correct_count = 0
+        self.incorrect_count = 0
+        self.random_score = 0
+        self.empty_channel_total = 0
+        self.oracle_count = 0
+
+    def record(self, tick, chosen_channel, current_traffic):
+        current_traffic = np.asarray(current_traffic)
+        while tick >= self.random_channels_start + len(self.random_channels):
+            self.random_channels_start += len(self.random_channels)
+            self.random_channels = next(self.random_channel_chunks)
+        empty_channels = int(np.count_nonzero(current_traffic == EMPTY))
+        chosen_value = current_traffic[chosen_channel]
+        self.total_smart_switches += 1
+        if chosen_value == EMPTY:
+            self.correct_count += 1
+        elif chosen_value == OCCUPIED and empty_channels > 0:
+            self.incorrect_count += 1
+        if current_traffic[self.random_channels[tick - self.random_channels_start]] == EMPTY:
+            self.random_score += 1
+        self.empty_channel_total += empty_channels
+        if empty_channels > 0:
+            self.oracle_count += 1
+
+    def score(self):
+        return decision_metrics(self.total_smart_switches, self.correct_count, self.incorrect_count, self.random_score,
+                                self.empty_channel_total, self.oracle_count, self.number_of_channels, self.number_of_timesteps)
+
+
+class DecisionLog:
+    def __init__(self, number_of_channels, number_of_timesteps, seed=None):
+        """ Preallocated log of the scored ticks of a live run, for replaying them offline when the full traffic isn't kept.
+        Alongside the tick and chosen channel it keeps what score_decisions needs from that tick's traffic,
+        about 22 bytes per tick, use RunningScore when only the metrics are needed """
+        self.number_of_channels = number_of_channels
+        self.number_of_timesteps = number_of_timesteps
+        self.random_channels = random_baseline_channels(number_of_channels, number_of_timesteps, seed)
+        self.decision_ticks = np.zeros(number_of_timesteps, dtype=np.int64)
+        self.chosen_channels = np.zeros(number_of_timesteps, dtype=np.int32)
+        self.chosen_values = np.zeros(number_of_timesteps, dtype=np.int8)
+        self.empty_channel_counts = np.zeros(number_of_timesteps, dtype=np.int32)
+        self.random_channel_values = np.zeros(number_of_timesteps, dtype=np.int8)
+        self.size = 0
+
+    def record(self, tick, chosen_channel, current_traffic):
+        current_traffic = np.asarray(current_traffic)
+        decision = self.size
+        self.decision_ticks[decision] = tick
+        self.chosen_channels[decision] = chosen_channel
+        self.chosen_values[decision] = current_traffic[chosen_channel]
+        self.empty_channel_counts[decision] = np.count_nonzero(current_traffic == EMPTY)
+        self.random_channel_values[decision] = current_traffic[self.random_channels[tick]]
+        self.size += 1
+
+    def score(self):
+        return score_decisions(self.chosen_values[:self.size], self.empty_channel_counts[:self.size],
+                               self.random_channel_values[:self.size], self.number_of_channels, self.number_of_timesteps)
+
+
+class TestReplayEvaluator(unittest.TestCase):
+    def setUp(self):
+        traffic_random = np.random.default_rng(4)
+        self.traffic = (traffic_random.random((5, 300)) < 0.8).astype(np.int8)
+        self.decision_ticks = np.sort(traffic_random.choice(300, 120, replace=False))
+        self.chosen_channels = traffic_random.integers(0, 5, 120)
+
+    def test_evaluate_decision_log_matches_loop_scoring(self):
+        metrics = evaluate_decision_log(self.traffic, self.decision_ticks, self.chosen_channels, seed=1)
+        random_channels = random_baseline_channels(5, 300, seed=1)
+        correct_count = incorrect_count = random_score = oracle_count = 0
+        for tick, chosen_channel in zip(self.decision_ticks, self.chosen_channels):
+            current_traffic = list(self.traffic[:, tick])
+            if current_traffic[chosen_channel] == 0:
+                correct_count += 1
+            elif 0 in current_traffic:
+                incorrect_count += 1
+            if current_traffic[random_channels[tick]] == 0:
+                random_score += 1
+            if 0 in current_traffic:
+                oracle_count += 1
+        self.assertEqual((metrics["correct_count"], metrics["incorrect_count"], metrics["random_score"],
+                          metrics["oracle_count"]), (correct_count, incorrect_count, random_score, oracle_count))
+        self.assertAlmostEqual(metrics["expected_random_score"],
+                               np.count_nonzero(self.traffic[:, self.decision_ticks] == 0) / 5)
+
+    def test_decision_log_matches_evaluate_decision_log(self):
+        decision_log = DecisionLog(5, 300, seed=2)
+        for tick, chosen_channel in zip(self.decision_ticks, self.chosen_channels):
+            decision_log.record(tick, chosen_channel, self.traffic[:, tick])
+        self.assertEqual(decision_log.score(),
+                         evaluate_decision_log(self.traffic, self.decision_ticks, self.chosen_channels, seed=2))
+
+    def test_running_score_matches_decision_log(self):
+        decision_log = DecisionLog(5, 300, seed=2)
+        running_score = RunningScore(5, 300, seed=2)
+        for tick, chosen_channel in zip(self.decision_ticks, self.chosen_channels):
+            decision_log.record(tick, chosen_channel, self.traffic[:, tick])
+            running_score.record(tick, chosen_channel, self.traffic[:, tick])
+        self.assertEqual(running_score.score(), decision_log.score())
+
+    def test_random_baseline_chunks_match_whole_draw(self):
+        number_of_timesteps = 2 * RANDOM_BASELINE_CHUNK_LENGTH + 5
+        random_channels = random_baseline_channels(7, number_of_timesteps, seed=3)
+        self.assertEqual(len(random_channels), number_of_timesteps)
+        running_score = RunningScore(7, number_of_timesteps, seed=3)
+        traffic = np.ones(7, dtype=np.int8)
+        for tick in (0, RANDOM_BASELINE_CHUNK_LENGTH + 1, number_of_timesteps - 1):
+            traffic[random_channels[tick]] = EMPTY
+            running_score.record(tick, 0, traffic)
+            traffic[random_channels[tick]] = OCCUPIED
+        self.assertEqual(running_score.score()["random_score"], 3)
@@ -0,0 +1,147 @@
+import numpy as np
+import unittest
+from air_traffic_data import AirTrafficData
+from replay_evaluator import RunningScore
+from simulation import complete_config, create_config_coop_controller, create_config_traffic, create_config_traffic_source, number_of_channels_in_config, run_simulation
+from switch_controller import SwitchController
+
+'''Config keys every policy must share with the primary, they size and fill the one shared cache'''
+SHARED_CACHE_KEYS = ["number_of_zero_biased_channels", "number_of_one_biased_channels", "max_channel_cache_size", "cache_options"]
+
+
+class SharedCacheStatistics:
+    def __init__(self, channel_caches):
+        """ Next step EMPTY count lookups into the one cache all policies share.
+        Each answer is memoized by joint state, and by whether it may fall back to a row scan, until the cache next changes,
+        so policies sensing the same joint state in a tick share one lookup """
+        self.shared_channel_caches = channel_caches
+        self.row_scanner = SwitchController()
+        self.memo = {}
+        self.memo_generation = None
+        self.shared_lookups = 0
+        self.computed_lookups = 0
+
+    def next_step_empty_counts(self, joint_channel_value_map, scan_rows):
+        if not isinstance(joint_channel_value_map, np.ndarray):
+            return self.__compute_next_step_empty_counts(joint_channel_value_map, scan_rows)
+        if self.memo_generation != self.shared_channel_caches.generation:
+            self.memo.clear()
+            self.memo_generation = self.shared_channel_caches.generation
+        memo_key = (scan_rows, joint_channel_value_map.tobytes())
+        if memo_key in self.memo:
+            self.shared_lookups += 1
+            next_step_counts = self.memo[memo_key]
+        else:
+            next_step_counts = self.memo[memo_key] = self.__compute_next_step_empty_counts(joint_channel_value_map, scan_rows)
+        if next_step_counts is None:
+            return None
+        denominator, numerators = next_step_counts
+        return denominator, numerators.copy()
+
+    def __compute_next_step_empty_counts(self, joint_channel_value_map, scan_rows):
+        self.computed_lookups += 1
+        next_step_counts = self.shared_channel_caches.next_step_empty_counts(joint_channel_value_map)
+        if next_step_counts is None and scan_rows:
+            next_step_counts = self.row_scanner.count_next_step_empty_values(
+                joint_channel_value_map, self.shared_channel_caches.channel_caches,
+                self.shared_channel_caches.number_of_channels)
+        return next_step_counts
+
+
+class PolicyCacheStatistics:
+    def __init__(self, shared_cache_statistics, scan_rows):
+        """ Stands in for the shared ChannelCaches in one policy's CoopController, reading everything but
+        next_step_empty_counts through to it. Joint state vector lookups go through shared_cache_statistics,
+        falling back with scan_rows to a row scan. Without scan_rows the cache's own answer is kept, None included,
+        e.g for the anytime search to sample rows itself """
+        self.shared_cache_statistics = shared_cache_statistics
+        self.scan_rows = scan_rows
+
+    def __getattr__(self, name):
+        return getattr(self.shared_cache_statistics.shared_channel_caches, name)
+
+    def next_step_empty_counts(self, joint_channel_value_map):
+        return self.shared_cache_statistics.next_step_empty_counts(joint_channel_value_map, self.scan_rows)
+
+
+class ShadowEvaluation:
+    def __init__(self, config, policies, seed, number_of_timesteps):
+        """ Drives one CoopController per policy from a single pass over the traffic.
+        policies are config overrides, e.g {"random_switch_step": 1} or {"min_channel_cache_size": 64},
+        the first is the primary policy. Every policy keeps its own radio units, SwitchController and RunningScore,
+        but only the primary's sensed values are cached and all policies look their statistics up in that one cache.
+        The primary's metrics are those of run_simulation, a shadow policy's are measured against the primary's cache,
+        not the one its own sensing would have filled, so they differ from its run_simulation once its radio units do """
+        self.policy_configs = [complete_config(dict(config, **policy)) for policy in policies]
+        primary_config = self.policy_configs[0]
+        for policy_config in self.policy_configs:
+            assert(all(policy_config[key] == primary_config[key] for key in SHARED_CACHE_KEYS))
+        self.coop_controllers = [create_config_coop_controller(policy_config, seed) for policy_config in self.policy_configs]
+        self.cache_statistics = SharedCacheStatistics(self.coop_controllers[0].channel_caches)
+        for coop_controller in self.coop_controllers:
+            switch_controller = coop_controller.switch_controller
+            scan_rows = switch_controller.anytime_row_budget is None and switch_controller.anytime_time_budget is None
+            coop_controller.channel_caches = PolicyCacheStatistics(self.cache_statistics, scan_rows)
+        self.running_scores = [RunningScore(number_of_channels_in_config(primary_config), number_of_timesteps, seed)
+                               for _ in self.policy_configs]
+        self.smart_switched = [False] * len(self.policy_configs)
+
+    def step(self, tick, current_traffic):
+        joint_channel_values = [coop_controller.sense_joint_channel_values(current_traffic)
+                                for coop_controller in self.coop_controllers]
+        self.coop_controllers[0].add_all_current_channel_values_to_cache_including_unknowns(joint_channel_values[0])
+        for policy_index, coop_controller in enumerate(self.coop_controllers):
+            if self.smart_switched[policy_index]:
+                self.running_scores[policy_index].record(
+                    tick, coop_controller.radio_units[coop_controller.monitored_radio_unit].sensing_channel, current_traffic)
+            self.smart_switched[policy_index] = coop_controller.trigger_radio_unit_switching(joint_channel_values[policy_index])
+
+    def metrics(self):
+        """ One metrics dict per policy, in policies order """
+        return [running_score.score() for running_score in self.running_scores]
+
+    def lookup_statistics(self):
+        return {"computed_lookups": self.cache_statistics.computed_lookups,
+                "shared_lookups": self.cache_statistics.shared_lookups}
+
+
+def run_shadow_simulation(config, policies, seed, channel_traffic_data=None):
+    """ Runs every policy over one pass of config's traffic, see ShadowEvaluation, and returns their metrics dicts """
+    config = complete_config(config)
+    if channel_traffic_data is None:
+        channel_traffic_data = AirTrafficData(traffic_source=create_config_traffic_source(config, seed))
+    shadow_evaluation = ShadowEvaluation(config, policies, seed, channel_traffic_data.number_of_timesteps)
+    while channel_traffic_data.time_step < channel_traffic_data.number_of_timesteps:
+        tick = channel_traffic_data.time_step
+        shadow_evaluation.step(tick, channel_traffic_data.get_current_traffic())
+    return shadow_evaluation.metrics()
+
+
+class TestShadowEvaluation(unittest.TestCase):
+    def setUp(self):
+        self.config = {"traffic_length": 600, "max_channel_cache_size": 64, "min_channel_cache_size": 16}
+        self.traffic = create_config_traffic(self.config, seed=2)
+
+    def test_primary_policy_matches_run_simulation(self):
+        policies = [{}, {"random_switch_step": 1}, {"min_channel_cache_size": 32}, {"switch_options": {"anytime_row_budget": 8}}]
+        for cache_options in [{}, {"ring_buffer": True, "transition_index": True}, {"packed": True}]:
+            config = dict(self.config, cache_options=cache_options)
+            metrics = run_shadow_simulation(config, policies, 2, channel_traffic_data=AirTrafficData(self.traffic))
+            self.assertEqual(metrics[0], run_simulation(config, 2, channel_traffic_data=AirTrafficData(self.traffic)))
+            self.assertEqual(len(metrics), len(policies))
+
+    def test_identical_policies_share_lookups(self):
+        # vectorized so each decision is one lookup and the shadow's decisions are all answered from the memo
+        shadow_evaluation = ShadowEvaluation(dict(self.config, switch_options={"vectorized": True}), [{}, {}], 2, 600)
+        for tick in range(600):
+            shadow_evaluation.step(tick, self.traffic[:, tick])
+        primary_metrics, shadow_metrics = shadow_evaluation.metrics()
+        self.assertEqual(shadow_metrics, primary_metrics)
+        lookup_statistics = shadow_evaluation.lookup_statistics()
+        self.assertTrue(lookup_statistics["computed_lookups"] > 0)
+        self.assertEqual(lookup_statistics["shared_lookups"], lookup_statistics["computed_lookups"])
+
+    def test_policies_must_share_cache(self):
+        for policy in [{"max_channel_cache_size": 128}, {"number_of_one_biased_channels": 7}, {"cache_options": {"packed": True}}]:
+            with self.assertRaises(AssertionError):
+                ShadowEvaluation(self.config, [{}, policy], 2, 600)
@@ -0,0 +1,126 @@
+import numpy as np
+import os
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from air_traffic_data import AirTrafficData
+from simulation import create_config_traffic, number_of_channels_in_config, complete_config, run_simulation
+from traffic_sources import TrafficSource
+
+RESULT_METRICS = ["total_smart_switches", "correct_count", "incorrect_count", "random_score",
+                  "proportion_correct", "proportion_correct_ignoring_dead_ends", "proportion_random_correct",
+                  "number_of_timesteps", "expected_random_score", "proportion_expected_random_correct",
+                  "oracle_count", "proportion_oracle_correct"]
+
+
+class SharedMemoryTrafficSource(TrafficSource):
+    def __init__(self, shared_memory_name, number_of_channels, number_of_timesteps):
+        """ Attaches to a time major (traffic_length, channels) int8 scenario written by SharedScenario.
+        The traffic is a read only view of the shared block, nothing is copied. close() detaches """
+        self.shared_memory = shared_memory.SharedMemory(name=shared_memory_name)
+        self.number_of_channels = number_of_channels
+        self.number_of_timesteps = number_of_timesteps
+        self.traffic_data = np.ndarray((number_of_timesteps, number_of_channels), dtype=np.int8,
+                                       buffer=self.shared_memory.buf)
+        self.traffic_data.flags.writeable = False
+
+    def get_traffic_at(self, time_step):
+        return self.traffic_data[time_step]
+
+    def close(self):
+        del self.traffic_data
+        self.shared_memory.close()
+
+
+class SharedScenario:
+    def __init__(self, traffic_data, number_of_runs):
+        """ Owns one (channels, traffic_length) scenario copied once, time major, into shared memory
+        and a float64 (number_of_runs, len(RESULT_METRICS)) result array that workers write their metrics into.
+        Blocks are unlinked by close(), also used as a context manager """
+        traffic_data = np.asarray(traffic_data)
+        self.number_of_channels = len(traffic_data)
+        self.number_of_timesteps = len(traffic_data[0])
+        self.number_of_runs = number_of_runs
+        self.traffic_memory = shared_memory.SharedMemory(
+            create=True, size=max(1, self.number_of_channels * self.number_of_timesteps))
+        self.result_memory = shared_memory.SharedMemory(
+            create=True, size=max(1, number_of_runs * len(RESULT_METRICS) * np.dtype(np.float64).itemsize))
+        traffic = np.ndarray((self.number_of_timesteps, self.number_of_channels), dtype=np.int8,
+                             buffer=self.traffic_memory.buf)
+        traffic[:] = traffic_data.T
+        del traffic
+        self.results = np.ndarray((number_of_runs, len(RESULT_METRICS)), dtype=np.float64,
+                                  buffer=self.result_memory.buf)
+        self.results[:] = np.nan
+
+    def worker_arguments(self):
+        """ The picklable names and shapes a worker needs to attach """
+        return (self.traffic_memory.name, self.number_of_channels, self.number_of_timesteps,
+                self.result_memory.name, self.number_of_runs)
+
+    def result_metrics(self, run_index):
+        return dict(zip(RESULT_METRICS, self.results[run_index].tolist()))
+
+    def close(self):
+        del self.results
+        for block in (self.traffic_memory, self.result_memory):
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _run_shared_simulation_task(task):
+    """ Worker side: attaches to the scenario and result blocks, runs one config and writes its metrics row """
+    (traffic_name, number_of_channels, number_of_timesteps, result_name, number_of_runs), run_index, config, seed = task
+    traffic_source = SharedMemoryTrafficSource(traffic_name, number_of_channels, number_of_timesteps)
+    result_memory = shared_memory.SharedMemory(name=result_name)
+    try:
+        metrics = run_simulation(config, seed, channel_traffic_data=AirTrafficData(traffic_source=traffic_source))
+        results = np.ndarray((number_of_runs, len(RESULT_METRICS)), dtype=np.float64, buffer=result_memory.buf)
+        results[run_index] = [metrics[metric] for metric in RESULT_METRICS]
+        del results
+    finally:
+        traffic_source.close()
+        result_memory.close()
+    return run_index
+
+
+def run_shared_simulations(traffic_data, configs_and_seeds, processes=None):
+    """ Runs every (config, seed) against the one (channels, traffic_length) scenario on a process pool.
+    Workers attach to the scenario in shared memory rather than receiving a copy each.
+    Returns the metrics dicts in configs_and_seeds order """
+    configs_and_seeds = list(configs_and_seeds)
+    with SharedScenario(traffic_data, len(configs_and_seeds)) as shared_scenario:
+        for config, _ in configs_and_seeds:
+            assert(number_of_channels_in_config(complete_config(config)) == shared_scenario.number_of_channels)
+        worker_arguments = shared_scenario.worker_arguments()
+        tasks = [(worker_arguments, run_index, config, seed)
+                 for run_index, (config, seed) in enumerate(configs_and_seeds)]
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as executor:
+            list(executor.map(_run_shared_simulation_task, tasks))
+        return [shared_scenario.result_metrics(run_index) for run_index in range(len(configs_and_seeds))]
+
+
+class TestSharedMemorySimulation(unittest.TestCase):
+    def setUp(self):
+        self.config = {"traffic_length": 400, "max_channel_cache_size": 64, "min_channel_cache_size": 16}
+        self.traffic = create_config_traffic(self.config, seed=5)
+
+    def test_shared_memory_traffic_source_is_read_only(self):
+        with SharedScenario(self.traffic, 1) as shared_scenario:
+            traffic_source = SharedMemoryTrafficSource(*shared_scenario.worker_arguments()[:3])
+            self.assertEqual(list(traffic_source.get_traffic_at(7)), list(self.traffic[:, 7]))
+            with self.assertRaises(ValueError):
+                traffic_source.traffic_data[0, 0] = 1
+            traffic_source.close()
+
+    def test_run_shared_simulations_matches_run_simulation(self):
+        configs_and_seeds = [(self.config, 0), (dict(self.config, min_channel_cache_size=32), 1)]
+        shared_metrics = run_shared_simulations(self.traffic, configs_and_seeds, processes=2)
+        for (config, seed), metrics in zip(configs_and_seeds, shared_metrics):
+            self.assertEqual(metrics, run_simulation(config, seed, channel_traffic_data=AirTrafficData(self.traffic)))
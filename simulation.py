@@ -0,0 +1,184 @@
+import numpy as np
+import unittest
+from air_traffic_data import AirTrafficData
+from coop_controller import CoopController
+from replay_evaluator import DecisionLog, RunningScore, evaluate_decision_log
+from traffic_generator import create_channel_traffics_array_where_half_the_channels_change_bias_at_random_intervals, create_channel_traffics_array_with_changing_biases_at_fixed_intervals, create_channel_traffics_array_with_fixed_biases, markov_modulated_traffic_chunks, occupancy_probability, regime_correlated_traffic_chunks
+from traffic_sources import ChunkedTrafficSource, InMemoryTrafficSource
+
+DEFAULT_SIMULATION_CONFIG = {
+    "number_of_radio_units": 2,
+    "number_of_zero_biased_channels": 4,
+    "number_of_one_biased_channels": 4,
+    "max_channel_cache_size": 1024,
+    "min_channel_cache_size": 32,
+    "random_switch_step": 10,
+    "bias_zero": 0.1,
+    "bias_one": 0.9,
+    "scenario": "changing_biases_at_fixed_intervals",
+    "switch_traffic_bias_interval": 10,
+    "traffic_length": 10000,
+    "mean_burst_length": 20,
+    "number_of_regimes": 2,
+    "regime_switch_probability": 0.01,
+    "traffic_chunk_length": 65536,
+    "cache_options": {},
+    "switch_options": {},
+}
+
+STREAMED_SCENARIOS = ["markov_modulated", "regime_correlated"]
+
+
+def complete_config(config):
+    """ Fills any keys missing from config with DEFAULT_SIMULATION_CONFIG values """
+    full_config = dict(DEFAULT_SIMULATION_CONFIG)
+    full_config.update(config)
+    return full_config
+
+
+def number_of_channels_in_config(config):
+    return config["number_of_zero_biased_channels"] + config["number_of_one_biased_channels"]
+
+
+def is_valid_config(config):
+    """ Checks the CoopController constraints for a config """
+    config = complete_config(config)
+    number_of_channels = number_of_channels_in_config(config)
+    return (config["number_of_radio_units"] <= number_of_channels
+            and config["max_channel_cache_size"] % number_of_channels == 0
+            and config["max_channel_cache_size"] % config["min_channel_cache_size"] == 0)
+
+
+def create_config_traffic(config, seed):
+    """ Returns the int8 (channels, traffic_length) scenario described by config """
+    config = complete_config(config)
+    traffic_arguments = (config["bias_zero"], config["bias_one"],
+                         config["number_of_zero_biased_channels"], config["number_of_one_biased_channels"])
+    if config["scenario"] == "fixed_biases":
+        return create_channel_traffics_array_with_fixed_biases(
+            *traffic_arguments, traffic_length=config["traffic_length"], seed=seed)
+    if config["scenario"] == "changing_biases_at_fixed_intervals":
+        return create_channel_traffics_array_with_changing_biases_at_fixed_intervals(
+            *traffic_arguments, switch_traffic_bias_interval=config["switch_traffic_bias_interval"],
+            traffic_length=config["traffic_length"], seed=seed)
+    if config["scenario"] == "half_the_channels_change_bias_at_random_intervals":
+        return create_channel_traffics_array_where_half_the_channels_change_bias_at_random_intervals(
+            *traffic_arguments, traffic_length=config["traffic_length"], seed=seed)
+    if config["scenario"] in STREAMED_SCENARIOS:
+        return np.concatenate(list(create_config_traffic_chunks(config, seed))).T
+    raise ValueError("Unknown scenario %s" % config["scenario"])
+
+
+def create_config_traffic_chunks(config, seed):
+    """ Yields the time major int8 chunks of the streamed scenarios.
+    markov_modulated channels are bursty ON/OFF with their bias' occupancy and OCCUPIED bursts of mean_burst_length.
+    regime_correlated channels share a hidden regime, each regime rotates which channels are zero and one biased """
+    config = complete_config(config)
+    occupied_probabilities = np.array(
+        [occupancy_probability(config["bias_zero"], 0.5)] * config["number_of_zero_biased_channels"] +
+        [occupancy_probability(config["bias_one"], 0.5)] * config["number_of_one_biased_channels"])
+    if config["scenario"] == "markov_modulated":
+        occupied_to_empty_probabilities = np.full(len(occupied_probabilities), 1 / config["mean_burst_length"])
+        empty_to_occupied_probabilities = np.minimum(
+            occupied_to_empty_probabilities * occupied_probabilities / (1 - occupied_probabilities), 1)
+        return markov_modulated_traffic_chunks(
+            occupied_to_empty_probabilities, empty_to_occupied_probabilities, config["traffic_length"],
+            chunk_length=config["traffic_chunk_length"], seed=seed)
+    if config["scenario"] == "regime_correlated":
+        number_of_channels = len(occupied_probabilities)
+        regime_occupancy_probabilities = [np.roll(occupied_probabilities, regime * number_of_channels // config["number_of_regimes"])
+                                          for regime in range(config["number_of_regimes"])]
+        return regime_correlated_traffic_chunks(
+            regime_occupancy_probabilities, config["regime_switch_probability"], config["traffic_length"],
+            chunk_length=config["traffic_chunk_length"], seed=seed)
+    raise ValueError("Scenario %s is not streamed" % config["scenario"])
+
+
+def create_config_traffic_source(config, seed):
+    """ Streamed scenarios come as a ChunkedTrafficSource so the whole trace is never in memory """
+    config = complete_config(config)
+    if config["scenario"] in STREAMED_SCENARIOS:
+        return ChunkedTrafficSource(create_config_traffic_chunks(config, seed),
+                                    number_of_channels_in_config(config), config["traffic_length"])
+    return InMemoryTrafficSource(create_config_traffic(config, seed))
+
+
+def create_config_coop_controller(config, seed, trace_recorder=None):
+    config = complete_config(config)
+    switch_options = {"random_switch_step": config["random_switch_step"], "random_seed": seed}
+    switch_options.update(config["switch_options"])
+    return CoopController(number_of_radio_units=config["number_of_radio_units"],
+                          number_of_channels=number_of_channels_in_config(config),
+                          max_channel_cache_size=config["max_channel_cache_size"],
+                          min_channel_cache_size=config["min_channel_cache_size"],
+                          cache_options=config["cache_options"],
+                          switch_options=switch_options,
+                          trace_recorder=trace_recorder)
+
+
+def run_simulation(config, seed, channel_traffic_data=None, on_tick=None, trace_recorder=None, decision_log=None):
+    """ Runs one simulation of config and returns its metrics dict.
+    seed drives the generated traffic, random smart switches and the random baseline.
+    channel_traffic_data replaces the generated traffic, on_tick(coop_layer, current_traffic) is called every tick
+    and trace_recorder is handed to the CoopController.
+    The tick after every smart switch is scored with a constant memory RunningScore,
+    and also recorded in decision_log if given, e.g to replay the run offline with evaluate_decision_log """
+    config = complete_config(config)
+    if channel_traffic_data is None:
+        channel_traffic_data = AirTrafficData(traffic_source=create_config_traffic_source(config, seed))
+    coop_layer = create_config_coop_controller(config, seed, trace_recorder)
+    running_score = RunningScore(coop_layer.number_of_channels, channel_traffic_data.number_of_timesteps, seed)
+
+    smart_switched = False
+    while channel_traffic_data.time_step < channel_traffic_data.number_of_timesteps:
+        tick = channel_traffic_data.time_step
+        current_traffic = channel_traffic_data.get_current_traffic()
+
+        joint_channel_values = coop_layer.sense_joint_channel_values(current_traffic)
+        coop_layer.add_all_current_channel_values_to_cache_including_unknowns(joint_channel_values)
+
+        if smart_switched:
+            # the channel the monitored radio unit smart switched to is scored against this tick's traffic
+            chosen_channel = coop_layer.radio_units[coop_layer.monitored_radio_unit].sensing_channel
+            running_score.record(tick, chosen_channel, current_traffic)
+            if decision_log is not None:
+                decision_log.record(tick, chosen_channel, current_traffic)
+
+        if on_tick is not None:
+            on_tick(coop_layer, current_traffic)
+
+        smart_switched = coop_layer.trigger_radio_unit_switching(joint_channel_values)
+
+    return running_score.score()
+
+
+class TestRunSimulation(unittest.TestCase):
+    def setUp(self):
+        self.config = {"traffic_length": 600, "max_channel_cache_size": 64, "min_channel_cache_size": 16}
+
+    def test_run_simulation_is_reproducible(self):
+        metrics = run_simulation(self.config, seed=3)
+        self.assertEqual(metrics, run_simulation(self.config, seed=3))
+        self.assertEqual(metrics["number_of_timesteps"], 600)
+        self.assertTrue(metrics["total_smart_switches"] > 0)
+        self.assertTrue(0 <= metrics["proportion_correct"] <= 1)
+
+    def test_is_valid_config(self):
+        self.assertTrue(is_valid_config(self.config))
+        self.assertFalse(is_valid_config({"max_channel_cache_size": 100}))
+        self.assertFalse(is_valid_config({"number_of_radio_units": 9}))
+
+    def test_decision_log_replays_to_same_metrics(self):
+        traffic = create_config_traffic(self.config, seed=4)
+        decision_log = DecisionLog(number_of_channels_in_config(complete_config(self.config)), 600, seed=4)
+        metrics = run_simulation(self.config, 4, channel_traffic_data=AirTrafficData(traffic), decision_log=decision_log)
+        self.assertEqual(metrics, evaluate_decision_log(
+            traffic, decision_log.decision_ticks[:decision_log.size], decision_log.chosen_channels[:decision_log.size], seed=4))
+
+    def test_streamed_scenarios_match_materialized_traffic(self):
+        for scenario in STREAMED_SCENARIOS:
+            config = dict(self.config, scenario=scenario, traffic_chunk_length=128)
+            traffic = create_config_traffic(config, seed=6)
+            self.assertEqual(traffic.shape, (8, 600))
+            self.assertEqual(run_simulation(config, 6),
+                             run_simulation(config, 6, channel_traffic_data=AirTrafficData(traffic)))
@@ -1,6 +1,14 @@
+import numpy as np
 import random
+import time
 import unittest
+from collections import OrderedDict
+from channel_caches import ChannelCaches
+from packed_channel_caches import PackedChannelCaches
+from radio_pool import RadioPool
 from radio_unit import RadioUnit
+from controller_instrumentation import RANDOM_SWITCHES, SMART_SWITCHES, ZERO_MATCH_LOOKUPS
+from transition_index import JointStateTransitionIndex
 
 '''Channel Occupancy Constants'''
 EMPTY = 0
@@ -8,45 +16,328 @@ OCCUPIED = 1
 UNKNOWN = 2
 
 
+def cache_rows(channel_caches):
+    """ The (rows, channels) rows of channel_caches, which is either the rows or a cache object such as ChannelCaches.
+    Callers resolve it only once they have to scan, reading a packed or wrapped ring buffer cache's rows copies them """
+    return channel_caches.channel_caches if hasattr(channel_caches, "channel_caches") else channel_caches
+
+
+class RowSampler:
+    def __init__(self, random_generator, number_of_rows):
+        """ Draws row indexes uniformly at random without replacement, a batch at a time, with no up front pass over the rows.
+        Until half the rows are visited a batch is drawn with integers and rejected against a visited mask,
+        then the unvisited rest is permuted once and handed out in order """
+        self.random_generator = random_generator
+        self.number_of_rows = number_of_rows
+        self.visited = np.zeros(number_of_rows, dtype=bool)
+        self.number_of_visited = 0
+        self.remaining_rows = None
+
+    def sample(self, batch_length):
+        batch_length = min(batch_length, self.number_of_rows - self.number_of_visited)
+        if self.remaining_rows is None and 2 * (self.number_of_visited + batch_length) > self.number_of_rows:
+            self.remaining_rows = self.random_generator.permutation(np.flatnonzero(~self.visited))
+        if self.remaining_rows is not None:
+            start = self.number_of_visited - (self.number_of_rows - len(self.remaining_rows))
+            batch_rows = self.remaining_rows[start:start + batch_length]
+        else:
+            batch_rows = np.empty(0, dtype=np.int64)
+            while len(batch_rows) < batch_length:
+                # at most half the rows are visited, so twice the missing rows plus slack are drawn to fill most batches once
+                candidate_rows = self.random_generator.integers(0, self.number_of_rows, 2 * (batch_length - len(batch_rows)) + 16)
+                candidate_rows = candidate_rows[~self.visited[candidate_rows]]
+                _, first_draws = np.unique(candidate_rows, return_index=True)
+                candidate_rows = candidate_rows[np.sort(first_draws)][:batch_length - len(batch_rows)]
+                self.visited[candidate_rows] = True
+                batch_rows = np.concatenate((batch_rows, candidate_rows))
+        self.visited[batch_rows] = True
+        self.number_of_visited += len(batch_rows)
+        return batch_rows
+
+
 class SwitchController:
-    def __init__(self):
+    def __init__(self, vectorized=False, random_switch_step=10, random_seed=None, trace_recorder=None, instrumentation=None, cooperative_assignment=False, decision_memo_size=0, decision_memo_max_staleness=0, anytime_row_budget=None, anytime_time_budget=None, anytime_initial_sample=64, anytime_max_batch=4096, anytime_clock=time.perf_counter):
+        """ vectorized computes next step EMPTY frequencies for all channels in one NumPy reduction,
+        instead of one calculate_conditional_probability call per UNKNOWN channel, joint state vectors always do.
+        cooperative_assignment makes CoopController reassign every radio unit each smart tick, see cooperative_assign_channels.
+        decision_memo_size > 0 keeps an LRU memo of find_best_channel_to_switch_to answers keyed by the sensed pattern,
+        an answer is reused while the cache has not been flushed and either the cache reports no change to the answer's
+        joint state since, see StateChangeTracker, which keeps reused answers exact, or it has had at most
+        decision_memo_max_staleness appends, which makes them approximate.
+        anytime_row_budget and anytime_time_budget, in cache rows and seconds, switch cache scans to the anytime search
+        of find_best_channel_to_switch_to_anytime, the rows it examined are left in last_rows_examined.
+        Its batches start at anytime_initial_sample rows and double up to anytime_max_batch,
+        and anytime_clock, seconds as a float, measures its time budget.
+        random_seed gives random smart switches their own random.Random, otherwise the global random module is used.
+        trace_recorder, if given, is told about random smart switches
+        and instrumentation, if given, counts smart, random and zero match lookups """
         self.number_of_smart_switches = 0
-        self.random_switch_step = 10
+        self.random_switch_step = random_switch_step
+        self.vectorized = vectorized
+        self.cooperative_assignment = cooperative_assignment
+        self.random_generator = random.Random(random_seed) if random_seed is not None else random
+        self.trace_recorder = trace_recorder
+        self.instrumentation = instrumentation
+        self.last_matching_rows = None
+        self.decision_memo = OrderedDict() if decision_memo_size > 0 else None
+        self.decision_memo_size = decision_memo_size
+        self.decision_memo_max_staleness = decision_memo_max_staleness
+        self.decision_memo_hits = 0
+        self.decision_memo_misses = 0
+        self.decision_memo_stale = 0
+        self.anytime_row_budget = anytime_row_budget
+        self.anytime_time_budget = anytime_time_budget
+        self.anytime_initial_sample = anytime_initial_sample
+        self.anytime_max_batch = anytime_max_batch
+        self.anytime_clock = anytime_clock
+        self.sample_generator = np.random.default_rng(random_seed)
+        self.last_rows_examined = None
+        # per channel, the cooperative assignment round it was last sensed in, -1 if never
+        self.channel_last_sensed = None
+        self.assignment_round = 0
 
-    def smart_switch_channel_for_radio_unit(self, all_radio_units, active_radio_index, joint_channel_value_map, channel_caches, number_of_channels):
+    def smart_switch_channel_for_radio_unit(self, all_radio_units, active_radio_index, joint_channel_value_map, channel_caches, number_of_channels, cache_statistics=None):
         """Given all radio units, find its best channel to switch to, i.e most likely to be empty and switch.
         This channel could already be owned by a passive radio unit, 
-        in this case the active and passive radio units swap sensing channels."""
+        in this case the active and passive radio units swap sensing channels, an O(1) swap when all_radio_units is a RadioPool.
+        cache_statistics is optional, any object with next_step_empty_counts(joint_channel_value_map), e.g ChannelCaches.
+        channel_caches is the cache rows or the cache object itself, see cache_rows"""
         active_radio_unit = all_radio_units[active_radio_index]
         current_sensed_channel = active_radio_unit.sensing_channel
         
         best_channel = current_sensed_channel
         if self.number_of_smart_switches % self.random_switch_step == 0:
-            print("RANDOM SMART SWITCH", self.number_of_smart_switches)
-            best_channel = random.randint(0, number_of_channels - 1)
+            if self.trace_recorder is not None:
+                self.trace_recorder.mark_random_switch()
+            if self.instrumentation is not None:
+                self.instrumentation.count(RANDOM_SWITCHES)
+            best_channel = self.random_generator.randint(0, number_of_channels - 1)
         else:
             best_channel = self.find_best_channel_to_switch_to(
-                current_sensed_channel, joint_channel_value_map, channel_caches, number_of_channels)
+                current_sensed_channel, joint_channel_value_map, channel_caches, number_of_channels, cache_statistics)
+            if self.instrumentation is not None:
+                self.instrumentation.count(SMART_SWITCHES)
+                if self.last_matching_rows == 0:
+                    self.instrumentation.count(ZERO_MATCH_LOOKUPS)
 
         # best_channel = self.find_best_channel_to_switch_to(
         #     current_sensed_channel, joint_channel_value_map, channel_caches, number_of_channels)
 
+        if isinstance(all_radio_units, RadioPool):
+            all_radio_units.swap_to_channel(active_radio_index, best_channel)
+            return
         for radio_unit in all_radio_units:
             if radio_unit.sensing_channel == best_channel:
                 radio_unit.sensing_channel = current_sensed_channel
                 break
         active_radio_unit.sensing_channel = best_channel
 
-    def find_best_channel_to_switch_to(self, current_sensed_channel, joint_channel_value_map, channel_caches, number_of_channels):
+    def cooperative_assign_channels(self, all_radio_units, active_radio_index, joint_channel_value_map, channel_caches, number_of_channels, cache_statistics=None, active_channel=None):
+        """Assigns every radio unit from one vectorized pass over all channel probabilities.
+        The active radio unit takes active_channel if given, otherwise a random channel on a random switch step,
+        otherwise the same channel find_best_channel_to_switch_to would choose.
+        Passive radio units take the UNKNOWN channels whose next step is least predictable, highest p(1 - p),
+        falling back to sensed channels when there are too few. Passive units already on a chosen channel stay there.
+        When no cache row matches the joint map every UNKNOWN channel gets the prior p = 0.5. Ties go to the channels
+        sensed the fewest assignment rounds ago, so passive coverage rotates instead of sticking to low channel numbers"""
+        conditional_probabilities = self.calculate_conditional_probabilities(
+            joint_channel_value_map, channel_caches, number_of_channels, cache_statistics)
+        if active_channel is None:
+            current_sensed_channel = all_radio_units[active_radio_index].sensing_channel
+            if self.number_of_smart_switches % self.random_switch_step == 0:
+                if self.trace_recorder is not None:
+                    self.trace_recorder.mark_random_switch()
+                if self.instrumentation is not None:
+                    self.instrumentation.count(RANDOM_SWITCHES)
+                active_channel = self.random_generator.randint(0, number_of_channels - 1)
+            else:
+                active_channel = self.select_best_channel(
+                    current_sensed_channel, joint_channel_value_map, conditional_probabilities)
+                if self.instrumentation is not None:
+                    self.instrumentation.count(SMART_SWITCHES)
+                    if self.last_matching_rows == 0:
+                        self.instrumentation.count(ZERO_MATCH_LOOKUPS)
+
+        joint_channel_values = self.joint_channel_values_array(joint_channel_value_map, number_of_channels)
+        if self.channel_last_sensed is None or len(self.channel_last_sensed) != number_of_channels:
+            self.channel_last_sensed = np.full(number_of_channels, -1, dtype=np.int64)
+        self.assignment_round += 1
+        self.channel_last_sensed[joint_channel_values != UNKNOWN] = self.assignment_round
+        if self.last_matching_rows == 0:
+            information_scores = np.full(number_of_channels, 0.25)
+        else:
+            information_scores = conditional_probabilities * (1 - conditional_probabilities)
+        information_scores[joint_channel_values != UNKNOWN] = -1
+        information_scores[active_channel] = -np.inf
+        number_of_passive_radio_units = len(all_radio_units) - 1
+        passive_channels = np.lexsort((self.channel_last_sensed, -information_scores))[:number_of_passive_radio_units]
+
+        passive_radio_unit_indexes = [radio_unit_index for radio_unit_index in range(len(all_radio_units))
+                                      if radio_unit_index != active_radio_index]
+        current_passive_channels = np.array([all_radio_units[radio_unit_index].sensing_channel
+                                             for radio_unit_index in passive_radio_unit_indexes], dtype=np.int64)
+        staying_radio_units = np.isin(current_passive_channels, passive_channels)
+        free_passive_channels = passive_channels[~np.isin(passive_channels, current_passive_channels[staying_radio_units])]
+        current_passive_channels[~staying_radio_units] = free_passive_channels
+
+        if isinstance(all_radio_units, RadioPool):
+            all_radio_units.assign_channels(passive_radio_unit_indexes + [active_radio_index],
+                                            np.append(current_passive_channels, active_channel))
+            return
+        passive_radio_units = [all_radio_units[radio_unit_index] for radio_unit_index in passive_radio_unit_indexes]
+        for radio_unit, channel in zip(passive_radio_units, current_passive_channels.tolist()):
+            radio_unit.sensing_channel = channel
+        all_radio_units[active_radio_index].sensing_channel = active_channel
+
+    def find_best_channel_to_switch_to(self, current_sensed_channel, joint_channel_value_map, channel_caches, number_of_channels, cache_statistics=None):
         """ For each channel in the joint_channel_value_map that is unknown at (t),
         calculate the conditonal probability that the channel is empty at the next time step,
-        choose the channel with the highest probability"""
+        choose the channel with the highest probability.
+        Leaves the number of cache rows matching the joint map in last_matching_rows, None if no lookup was needed.
+        Answers come from the decision memo when it is enabled and cache_statistics has generation counters,
+        last_matching_rows then is the count when the answer was computed"""
+        if self.decision_memo is None or not hasattr(cache_statistics, "generation"):
+            return self.__search_best_channel_to_switch_to(
+                current_sensed_channel, joint_channel_value_map, channel_caches, number_of_channels, cache_statistics)
+
+        if isinstance(joint_channel_value_map, np.ndarray):
+            sensed_pattern = joint_channel_value_map.tobytes()
+        else:
+            sensed_pattern = frozenset(
+                (channel, value) for channel, value in joint_channel_value_map.items() if value != UNKNOWN)
+        memo_key = (sensed_pattern, current_sensed_channel)
+        memo_entry = self.decision_memo.get(memo_key)
+        if memo_entry is not None:
+            generation, best_channel, matching_rows = memo_entry
+            if generation >= cache_statistics.flush_generation and (
+                    cache_statistics.generation - generation <= self.decision_memo_max_staleness
+                    or self.__joint_state_unchanged_since(generation, joint_channel_value_map, number_of_channels,
+                                                          cache_statistics)):
+                self.decision_memo_hits += 1
+                self.decision_memo.move_to_end(memo_key)
+                self.last_matching_rows = matching_rows
+                return best_channel
+            self.decision_memo_stale += 1
+        else:
+            self.decision_memo_misses += 1
+
+        if hasattr(cache_statistics, "track_state_changes"):
+            cache_statistics.track_state_changes()
+        best_channel = self.__search_best_channel_to_switch_to(
+            current_sensed_channel, joint_channel_value_map, channel_caches, number_of_channels, cache_statistics)
+        self.decision_memo[memo_key] = (cache_statistics.generation, best_channel, self.last_matching_rows)
+        self.decision_memo.move_to_end(memo_key)
+        if len(self.decision_memo) > self.decision_memo_size:
+            self.decision_memo.popitem(last=False)
+        return best_channel
+
+    def searches_joint_states_directly(self):
+        """ Whether a smart switch is a plain lookup, see find_best_channel_for_joint_state,
+        i.e no cooperative assignment, decision memo or anytime search """
+        return (not self.cooperative_assignment and self.decision_memo is None
+                and self.anytime_row_budget is None and self.anytime_time_budget is None)
+
+    def find_best_channel_for_joint_state(self, current_sensed_channel, joint_channel_values, channel_caches):
+        """ Same choice as find_best_channel_to_switch_to for an int8 joint state vector and a ChannelCaches
+        when searches_joint_states_directly. An EMPTY channel needs no lookup and leaves last_matching_rows None,
+        otherwise the counts come from the cache's statistics or its scan_next_step_empty_counts """
+        self.last_matching_rows = None
+        empty_channels = np.flatnonzero(joint_channel_values == EMPTY)
+        if len(empty_channels) != 0:
+            return int(empty_channels[0])
+        next_step_counts = channel_caches.next_step_empty_counts(joint_channel_values)
+        if next_step_counts is None:
+            next_step_counts = channel_caches.scan_next_step_empty_counts(joint_channel_values)
+        denominator, numerators = next_step_counts
+        self.last_matching_rows = denominator
+        if denominator == 0:
+            return current_sensed_channel
+        unknown_channel_probabilities = np.where(joint_channel_values == UNKNOWN, numerators / denominator, 0)
+        best_channel = int(np.argmax(unknown_channel_probabilities))
+        if unknown_channel_probabilities[best_channel] > 0:
+            return best_channel
+        return current_sensed_channel
+
+    def __joint_state_unchanged_since(self, generation, joint_channel_value_map, number_of_channels, cache_statistics):
+        if not hasattr(cache_statistics, "state_generation") or len(joint_channel_value_map) != number_of_channels:
+            return False
+        joint_channel_values = self.joint_channel_values_array(joint_channel_value_map, number_of_channels)
+        state_generation = cache_statistics.state_generation(joint_channel_values.astype(np.int8, copy=False).tobytes())
+        return state_generation is not None and state_generation <= generation
+
+    def decision_memo_statistics(self):
+        lookups = self.decision_memo_hits + self.decision_memo_misses + self.decision_memo_stale
+        return {"hits": self.decision_memo_hits, "misses": self.decision_memo_misses, "stale": self.decision_memo_stale,
+                "hit_rate": self.decision_memo_hits / lookups if lookups != 0 else 0,
+                "entries": len(self.decision_memo) if self.decision_memo is not None else 0}
+
+    def find_best_channel_to_switch_to_anytime(self, current_sensed_channel, joint_channel_value_map, channel_caches, number_of_channels, cache_statistics=None, row_budget=None, time_budget=None):
+        """ Anytime version of find_best_channel_to_switch_to, returns (best channel, cache rows examined).
+        When cache_statistics can't answer, next step EMPTY probabilities are estimated from cache rows taken in a random
+        order without replacement, in batches that double from anytime_initial_sample up to anytime_max_batch,
+        until row_budget rows have been examined or time_budget seconds have passed, checked between batches.
+        Near the deadline a batch shrinks to the rows the remaining time fits at the rate so far.
+        Once every row is examined the choice is the exact one. last_matching_rows is the number of sampled rows matching the joint map """
+        self.last_matching_rows = None
+        joint_channel_values = self.joint_channel_values_array(joint_channel_value_map, number_of_channels)
+        if np.any(joint_channel_values == EMPTY):
+            return self.select_best_channel(current_sensed_channel, joint_channel_values, np.zeros(number_of_channels)), 0
+        if cache_statistics is not None:
+            next_step_counts = cache_statistics.next_step_empty_counts(joint_channel_value_map)
+            if next_step_counts is not None:
+                denominator, numerators = next_step_counts
+                self.last_matching_rows = denominator
+                conditional_probabilities = numerators / denominator if denominator != 0 else np.zeros(number_of_channels)
+                return self.select_best_channel(current_sensed_channel, joint_channel_values, conditional_probabilities), 0
+
+        search_start = self.anytime_clock()
+        deadline = search_start + time_budget if time_budget is not None else None
+        channel_caches = np.asarray(cache_rows(channel_caches))
+        number_of_rows = len(channel_caches)
+        row_limit = number_of_rows if row_budget is None else min(row_budget, number_of_rows)
+        row_sampler = RowSampler(self.sample_generator, number_of_rows)
+        denominator = 0
+        numerators = np.zeros(number_of_channels, dtype=np.int64)
+        rows_examined = 0
+        batch_size = min(self.anytime_initial_sample, self.anytime_max_batch)
+        while rows_examined < row_limit:
+            batch_length = min(batch_size, row_limit - rows_examined)
+            if deadline is not None and rows_examined > 0:
+                now = self.anytime_clock()
+                if now >= deadline:
+                    break
+                batch_length = min(batch_length, max(1, int((deadline - now) * rows_examined / (now - search_start))))
+            batch_rows = row_sampler.sample(batch_length)
+            matching_rows = batch_rows[np.all(channel_caches[batch_rows] == joint_channel_values, axis=1)]
+            denominator += len(matching_rows)
+            next_rows = matching_rows[matching_rows != number_of_rows - 1] + 1
+            numerators += np.count_nonzero(channel_caches[next_rows] == EMPTY, axis=0)
+            rows_examined += batch_length
+            batch_size = min(batch_size * 2, self.anytime_max_batch)
+
+        self.last_matching_rows = denominator
+        conditional_probabilities = numerators / denominator if denominator != 0 else np.zeros(number_of_channels)
+        return self.select_best_channel(current_sensed_channel, joint_channel_values, conditional_probabilities), rows_examined
+
+    def __search_best_channel_to_switch_to(self, current_sensed_channel, joint_channel_value_map, channel_caches, number_of_channels, cache_statistics):
+        self.last_matching_rows = None
+        if self.anytime_row_budget is not None or self.anytime_time_budget is not None:
+            best_channel, self.last_rows_examined = self.find_best_channel_to_switch_to_anytime(
+                current_sensed_channel, joint_channel_value_map, channel_caches, number_of_channels, cache_statistics,
+                self.anytime_row_budget, self.anytime_time_budget)
+            return best_channel
+        # a joint state vector is never walked channel by channel, the vectorized search makes the same choice
+        if self.vectorized or isinstance(joint_channel_value_map, np.ndarray):
+            conditional_probabilities = self.calculate_conditional_probabilities(
+                joint_channel_value_map, channel_caches, number_of_channels, cache_statistics)
+            return self.select_best_channel(current_sensed_channel, joint_channel_value_map, conditional_probabilities)
+
         max_conditional_probability = 0
         channel_to_switch_to = current_sensed_channel
         for channel in range(number_of_channels):
             if joint_channel_value_map[channel] == UNKNOWN:
                 conditional_probability = self.calculate_conditional_probability(
-                    channel, joint_channel_value_map, channel_caches)
+                    channel, joint_channel_value_map, channel_caches, cache_statistics)
                 if conditional_probability > max_conditional_probability:
                     max_conditional_probability = conditional_probability
                     channel_to_switch_to = channel
@@ -55,8 +346,25 @@ class SwitchController:
                 break
         return channel_to_switch_to
 
+    def select_best_channel(self, current_sensed_channel, joint_channel_value_map, conditional_probabilities):
+        """ Same choice as the find_best_channel_to_switch_to loop, an EMPTY channel wins immediately,
+        otherwise the first UNKNOWN channel with the highest non zero probability, otherwise stay """
+        joint_channel_values = self.joint_channel_values_array(joint_channel_value_map, len(conditional_probabilities))
+        empty_channels = np.flatnonzero(joint_channel_values == EMPTY)
+        if len(empty_channels) != 0:
+            return int(empty_channels[0])
+        unknown_channel_probabilities = np.where(
+            joint_channel_values == UNKNOWN, conditional_probabilities, 0)
+        best_channel = int(np.argmax(unknown_channel_probabilities))
+        if unknown_channel_probabilities[best_channel] > 0:
+            return best_channel
+        return current_sensed_channel
+
     def immediate_switch_channel_for_all_radio_units(self, radio_units, number_of_channels):
         """Increments all radio unit sensing channel numbers by 1 """
+        if isinstance(radio_units, RadioPool):
+            radio_units.advance_all()
+            return
         for radio_unit in radio_units:
             next_channel = radio_unit.sensing_channel + 1
             if next_channel == number_of_channels:
@@ -64,9 +372,18 @@ class SwitchController:
             else:
                 radio_unit.sensing_channel = next_channel
 
-    def calculate_conditional_probability(self, channel_to_check, joint_channel_value_map, channel_caches):
+    def calculate_conditional_probability(self, channel_to_check, joint_channel_value_map, channel_caches, cache_statistics=None):
         """ Calculates the conditional probability that channel_to_check at (t+1) is EMPTY, 
-        given the joint channel_value_map for (t)"""
+        given the joint channel_value_map for (t).
+        Looks the counts up in cache_statistics when it can answer, otherwise scans channel_caches"""
+        if cache_statistics is not None:
+            next_step_counts = cache_statistics.next_step_empty_counts(joint_channel_value_map)
+            if next_step_counts is not None:
+                denominator, numerators = next_step_counts
+                self.last_matching_rows = denominator
+                return numerators[channel_to_check] / denominator if denominator != 0 else 0
+
+        channel_caches = cache_rows(channel_caches)
         numerator = 0
         denominator = 0
         last_channel_cache_index = len(channel_caches) - 1
@@ -79,21 +396,61 @@ class SwitchController:
                     next_cache_row = channel_caches[i+1]
                     if next_cache_row[channel_to_check] == EMPTY:
                         numerator += 1
+        self.last_matching_rows = denominator
         return numerator / denominator if denominator != 0 else 0
 
+    def calculate_conditional_probabilities(self, joint_channel_value_map, channel_caches, number_of_channels, cache_statistics=None):
+        """ Conditional probability that each channel at (t+1) is EMPTY given the joint channel_value_map for (t),
+        returned as an array indexed by channel """
+        next_step_counts = None
+        if cache_statistics is not None:
+            next_step_counts = cache_statistics.next_step_empty_counts(joint_channel_value_map)
+        if next_step_counts is None:
+            next_step_counts = self.count_next_step_empty_values(
+                joint_channel_value_map, channel_caches, number_of_channels)
+        denominator, numerators = next_step_counts
+        self.last_matching_rows = denominator
+        if denominator == 0:
+            return np.zeros(number_of_channels)
+        return numerators / denominator
+
+    def count_next_step_empty_values(self, joint_channel_value_map, channel_caches, number_of_channels):
+        """ Computes the matching row mask once, returns (matching rows, per channel count of EMPTY in the row after a match) """
+        channel_caches = np.asarray(cache_rows(channel_caches))
+        if len(channel_caches) == 0:
+            return 0, np.zeros(number_of_channels, dtype=np.int64)
+        if isinstance(joint_channel_value_map, np.ndarray):
+            matching_rows = np.all(channel_caches == joint_channel_value_map, axis=1)
+            numerators = np.count_nonzero(channel_caches[1:][matching_rows[:-1]] == EMPTY, axis=0)
+            return int(np.count_nonzero(matching_rows)), numerators
+        channels = np.fromiter(joint_channel_value_map.keys(), dtype=np.intp, count=len(joint_channel_value_map))
+        values = np.fromiter(joint_channel_value_map.values(), dtype=channel_caches.dtype, count=len(joint_channel_value_map))
+        matching_rows = np.all(channel_caches[:, channels] == values, axis=1)
+        numerators = np.count_nonzero(channel_caches[1:][matching_rows[:-1]] == EMPTY, axis=0)
+        return int(np.count_nonzero(matching_rows)), numerators
+
     def joint_channel_values_count(self, channel_caches, joint_channel_value_map):
         """ Iterates over each cache row, 
         checks if all channel values from channel_value_map are in the row
         if all are present -> increment count by 1"""
         count = 0
-        for cache_row in channel_caches:
+        for cache_row in cache_rows(channel_caches):
             count_row = self.__check_all_channel_values_in_cache_row(
                 cache_row, joint_channel_value_map)
             if count_row:
                 count += 1
         return count
 
+    def joint_channel_values_array(self, joint_channel_value_map, number_of_channels):
+        """ The joint channel values as an int8 array indexed by channel, joint state vectors are returned as is """
+        if isinstance(joint_channel_value_map, np.ndarray):
+            return joint_channel_value_map
+        return np.fromiter((joint_channel_value_map[channel] for channel in range(number_of_channels)),
+                           dtype=np.int8, count=number_of_channels)
+
     def __check_all_channel_values_in_cache_row(self, cache_row, joint_channel_value_map):
+        if isinstance(joint_channel_value_map, np.ndarray):
+            return bool(np.array_equal(cache_row, joint_channel_value_map))
         result = True
         for channel in joint_channel_value_map.keys():
             if cache_row[channel] != joint_channel_value_map[channel]:
@@ -169,3 +526,225 @@ class TestCalculationFunctions(unittest.TestCase):
         # we know from how the radios were created, that 1 was previously owned by radio unit 1
         # therefore need to check if this now owns channel 0
         self.assertEqual(all_radio_units[1].sensing_channel, 0)
+
+    def test_calculate_conditional_probability_with_transition_index(self):
+        channel_caches = [[1, 0, 1], [0, 0, 1], [1, 0, 1], [0, 1, 0], [1, 0, 1], [1, 0, 1]]
+        transition_index = JointStateTransitionIndex(number_of_channels=3)
+        for cache_row in channel_caches:
+            transition_index.add_row(cache_row)
+        channel_value_map = {0: 1, 1: 0, 2: 1}
+        for channel in range(3):
+            expected = self.switch_controller.calculate_conditional_probability(
+                channel_to_check=channel, joint_channel_value_map=channel_value_map, channel_caches=channel_caches)
+            result = self.switch_controller.calculate_conditional_probability(
+                channel_to_check=channel, joint_channel_value_map=channel_value_map, channel_caches=channel_caches,
+                cache_statistics=transition_index)
+            self.assertEqual(result, expected)
+
+
+class TestVectorizedCalculationFunctions(unittest.TestCase):
+    def setUp(self):
+        self.switch_controller = SwitchController()
+        self.vectorized_switch_controller = SwitchController(vectorized=True)
+        self.channel_caches = [[1, 0, 1, 0], [0, 0, 1, 0], [0, 1, 0, 1], [1, 0, 1, 1]]
+
+    def test_calculate_conditional_probabilities_matches_scan(self):
+        channel_value_map = {1: 0, 2: 1}
+        result = self.vectorized_switch_controller.calculate_conditional_probabilities(
+            channel_value_map, self.channel_caches, number_of_channels=4)
+        for channel in range(4):
+            expected = self.switch_controller.calculate_conditional_probability(
+                channel, channel_value_map, self.channel_caches)
+            self.assertEqual(result[channel], expected)
+
+    def test_find_best_channel_for_switch_when_empty_available_in_passive(self):
+        channel_value_map = {0: 2, 1: 0, 2: 1, 3: 2}
+        result = self.vectorized_switch_controller.find_best_channel_to_switch_to(
+            0, channel_value_map, self.channel_caches, 4)
+        self.assertEqual(result, 1)
+
+    def test_find_best_channel_for_switch_when_no_empty_available_in_passive(self):
+        channel_value_map = {0: 2, 1: 1, 2: 1, 3: 2}
+        result = self.vectorized_switch_controller.find_best_channel_to_switch_to(
+            0, channel_value_map, self.channel_caches, 4)
+        self.assertEqual(result, 0)
+
+    def test_find_best_channel_matches_scan_on_random_caches(self):
+        cache_random = random.Random(3)
+        number_of_channels = 5
+        for _ in range(50):
+            channel_caches = np.array([[cache_random.choice([EMPTY, OCCUPIED, UNKNOWN]) for _ in range(number_of_channels)]
+                                       for _ in range(40)])
+            channel_value_map = dict(enumerate(channel_caches[cache_random.randrange(40)]))
+            expected = self.switch_controller.find_best_channel_to_switch_to(
+                0, channel_value_map, channel_caches, number_of_channels)
+            result = self.vectorized_switch_controller.find_best_channel_to_switch_to(
+                0, channel_value_map, channel_caches, number_of_channels)
+            self.assertEqual(result, expected)
+
+
+class TestAnytimeSearch(unittest.TestCase):
+    def setUp(self):
+        self.switch_controller = SwitchController(vectorized=True)
+        cache_random = np.random.default_rng(4)
+        self.number_of_channels = 5
+        self.channel_caches = cache_random.choice([OCCUPIED, UNKNOWN, EMPTY], (400, self.number_of_channels), p=[0.45, 0.45, 0.1])
+        self.channel_caches[::7, :2] = [OCCUPIED, UNKNOWN]
+        self.channel_value_map = {0: OCCUPIED, 1: UNKNOWN, 2: UNKNOWN, 3: UNKNOWN, 4: UNKNOWN}
+
+    def test_unbounded_anytime_search_matches_exact(self):
+        anytime_switch_controller = SwitchController(random_seed=0, anytime_initial_sample=16)
+        for cache_row in self.channel_caches[::13]:
+            channel_value_map = dict(enumerate(np.where(cache_row == EMPTY, OCCUPIED, cache_row)))
+            expected = self.switch_controller.find_best_channel_to_switch_to(
+                0, channel_value_map, self.channel_caches, self.number_of_channels)
+            result, rows_examined = anytime_switch_controller.find_best_channel_to_switch_to_anytime(
+                0, channel_value_map, self.channel_caches, self.number_of_channels)
+            self.assertEqual(result, expected)
+            self.assertEqual(rows_examined, len(self.channel_caches))
+            self.assertEqual(anytime_switch_controller.last_matching_rows, self.switch_controller.last_matching_rows)
+
+    def test_row_budget_bounds_rows_examined(self):
+        anytime_switch_controller = SwitchController(random_seed=0, anytime_row_budget=100, anytime_initial_sample=16)
+        anytime_switch_controller.find_best_channel_to_switch_to(
+            0, self.channel_value_map, self.channel_caches, self.number_of_channels)
+        self.assertEqual(anytime_switch_controller.last_rows_examined, 100)
+        self.assertTrue(0 < anytime_switch_controller.last_matching_rows < 100)
+
+    def test_time_budget_examines_at_least_one_batch(self):
+        _, rows_examined = SwitchController(random_seed=0, anytime_initial_sample=16).find_best_channel_to_switch_to_anytime(
+            0, self.channel_value_map, self.channel_caches, self.number_of_channels, time_budget=0)
+        self.assertEqual(rows_examined, 16)
+
+    def test_batches_capped_at_max_batch(self):
+        _, rows_examined = SwitchController(random_seed=0, anytime_max_batch=8).find_best_channel_to_switch_to_anytime(
+            0, self.channel_value_map, self.channel_caches, self.number_of_channels, time_budget=0)
+        self.assertEqual(rows_examined, 8)
+
+    def test_time_budget_sizes_batches_to_remaining_time(self):
+        # every clock reading is a quarter of the budget later, so the rate so far fits 128, 192 and 128 more rows
+        clock_readings = iter(np.arange(0, 2, 0.25))
+        anytime_switch_controller = SwitchController(random_seed=0, anytime_clock=lambda: next(clock_readings))
+        _, rows_examined = anytime_switch_controller.find_best_channel_to_switch_to_anytime(
+            0, self.channel_value_map, np.tile(self.channel_caches, (655, 1)), self.number_of_channels, time_budget=1)
+        self.assertEqual(rows_examined, 64 + 128 + 192 + 128)
+
+    def test_row_sampler_draws_every_row_once(self):
+        row_sampler = RowSampler(np.random.default_rng(0), 10000)
+        batches = [row_sampler.sample(batch_length) for batch_length in (64, 128, 4096, 4096, 4096)]
+        self.assertEqual([len(batch_rows) for batch_rows in batches], [64, 128, 4096, 4096, 1616])
+        np.testing.assert_array_equal(np.sort(np.concatenate(batches)), np.arange(10000))
+        self.assertEqual(len(row_sampler.sample(64)), 0)
+        # a sample is spread over the rows, not a run or an arithmetic progression of them
+        first_rows = np.sort(batches[0])
+        self.assertTrue(first_rows[0] < 1000 and first_rows[-1] > 9000)
+        self.assertTrue(len(np.unique(np.diff(first_rows))) > 10)
+
+    def test_empty_channel_needs_no_rows(self):
+        channel_value_map = {**self.channel_value_map, 3: EMPTY}
+        self.assertEqual(SwitchController().find_best_channel_to_switch_to_anytime(
+            0, channel_value_map, self.channel_caches, self.number_of_channels), (3, 0))
+
+
+class TestCooperativeAssignment(unittest.TestCase):
+    def setUp(self):
+        self.switch_controller = SwitchController(cooperative_assignment=True)
+        self.switch_controller.number_of_smart_switches = 1
+        self.number_of_channels = 6
+        self.all_radio_units = [RadioUnit(0), RadioUnit(1), RadioUnit(2)]
+        # after a row matching {0: 1, 1: 1, 2: 1}: channel 3 always EMPTY, channel 4 half the time, channel 5 never
+        self.channel_caches = [[1, 1, 1, 2, 2, 2], [2, 2, 2, 0, 0, 1],
+                               [1, 1, 1, 2, 2, 2], [2, 2, 2, 0, 1, 1],
+                               [1, 1, 1, 2, 2, 2]]
+
+    def test_cooperative_assign_channels(self):
+        channel_value_map = {0: 1, 1: 1, 2: 1, 3: 2, 4: 2, 5: 2}
+        self.switch_controller.cooperative_assign_channels(
+            self.all_radio_units, 0, channel_value_map, self.channel_caches, self.number_of_channels)
+        sensing_channels = [radio_unit.sensing_channel for radio_unit in self.all_radio_units]
+        self.assertEqual(sensing_channels[0], 3)
+        self.assertIn(4, sensing_channels[1:])
+        self.assertEqual(len(set(sensing_channels)), 3)
+
+    def test_cooperative_assign_channels_keeps_active_channel(self):
+        channel_value_map = {0: 0, 1: 1, 2: 1, 3: 2, 4: 2, 5: 2}
+        self.switch_controller.cooperative_assign_channels(
+            self.all_radio_units, 0, channel_value_map, self.channel_caches, self.number_of_channels, active_channel=0)
+        sensing_channels = [radio_unit.sensing_channel for radio_unit in self.all_radio_units]
+        self.assertEqual(sensing_channels[0], 0)
+        self.assertEqual(sorted(sensing_channels[1:]), [3, 4])
+
+    def test_cooperative_assign_channels_radio_pool(self):
+        radio_pool = RadioPool(3, self.number_of_channels)
+        channel_value_map = {0: 1, 1: 1, 2: 1, 3: 2, 4: 2, 5: 2}
+        for all_radio_units in (self.all_radio_units, radio_pool):
+            self.switch_controller.cooperative_assign_channels(
+                all_radio_units, 0, channel_value_map, self.channel_caches, self.number_of_channels)
+        self.assertEqual([radio_unit.sensing_channel for radio_unit in radio_pool],
+                         [radio_unit.sensing_channel for radio_unit in self.all_radio_units])
+        self.assertEqual([radio_pool.owner_of(channel) for channel in radio_pool.sensing_channels], [0, 1, 2])
+
+
+    def test_cooperative_assign_channels_spreads_without_matches(self):
+        number_of_channels = 24
+        all_radio_units = [RadioUnit(radio_unit_index) for radio_unit_index in range(4)]
+        # no cache row matches any joint map, every probability is 0
+        channel_caches = [[OCCUPIED] * number_of_channels] * 4
+        sensed_channels = set()
+        for _ in range(8):
+            channel_value_map = {channel: UNKNOWN for channel in range(number_of_channels)}
+            channel_value_map.update({radio_unit.sensing_channel: EMPTY for radio_unit in all_radio_units})
+            self.switch_controller.cooperative_assign_channels(
+                all_radio_units, 0, channel_value_map, channel_caches, number_of_channels, active_channel=0)
+            sensed_channels.update(radio_unit.sensing_channel for radio_unit in all_radio_units[1:])
+        self.assertEqual(len(sensed_channels), number_of_channels - 1)
+
+
+class TestDecisionMemo(unittest.TestCase):
+    def setUp(self):
+        self.switch_controller = SwitchController(decision_memo_size=2, decision_memo_max_staleness=1)
+        self.channel_caches = ChannelCaches(number_of_channels=4, max_size=8)
+        for sensed_channel_values in [{0: 1, 1: 1}, {2: 0, 3: 1}, {0: 1, 1: 1}, {2: 0, 3: 1}]:
+            self.channel_caches.add_all_current_channel_values_to_cache(sensed_channel_values)
+        self.channel_value_map = {0: 1, 1: 1, 2: 2, 3: 2}
+
+    def find_best_channel(self, channel_value_map):
+        return self.switch_controller.find_best_channel_to_switch_to(
+            0, channel_value_map, self.channel_caches.channel_caches, 4, self.channel_caches)
+
+    def test_decision_memo_hits_until_stale(self):
+        self.assertEqual(self.find_best_channel(self.channel_value_map), 2)
+        self.assertEqual(self.find_best_channel(self.channel_value_map), 2)
+        self.channel_caches.add_all_current_channel_values_to_cache({0: 1, 1: 1})
+        self.assertEqual(self.find_best_channel(self.channel_value_map), 2)
+        # EMPTY on channels UNKNOWN in the memoized state after it changes that state's answer
+        self.channel_caches.add_all_current_channel_values_to_cache({2: 0, 3: 0})
+        self.channel_caches.add_all_current_channel_values_to_cache({0: 0, 1: 1})
+        self.find_best_channel(self.channel_value_map)
+        self.assertEqual(self.switch_controller.decision_memo_statistics(),
+                         {"hits": 2, "misses": 1, "stale": 1, "hit_rate": 0.5, "entries": 1})
+
+    def test_decision_memo_hits_while_joint_state_unchanged(self):
+        cache_rows = self.channel_caches.channel_caches.copy()
+        for channel_caches in (self.channel_caches, PackedChannelCaches(4, 8)):
+            switch_controller = SwitchController(decision_memo_size=2)
+            channel_caches.restore_rows(cache_rows)
+            self.assertEqual(switch_controller.find_best_channel_to_switch_to(
+                0, self.channel_value_map, channel_caches, 4, channel_caches), 2)
+            # none of the appends adds an EMPTY after the memoized state on a channel it has UNKNOWN
+            for sensed_channel_values in [{0: 1, 1: 1}, {0: 0, 1: 1}, {0: 1, 1: 1}, {2: 1, 3: 1}]:
+                channel_caches.add_all_current_channel_values_to_cache(sensed_channel_values)
+            self.assertEqual(switch_controller.find_best_channel_to_switch_to(
+                0, self.channel_value_map, channel_caches, 4, channel_caches), 2)
+            self.assertEqual(switch_controller.decision_memo_hits, 1)
+
+    def test_decision_memo_invalidated_by_flush(self):
+        self.find_best_channel(self.channel_value_map)
+        self.channel_caches.flush_cache()
+        self.assertEqual(self.find_best_channel(self.channel_value_map), 0)
+        self.assertEqual(self.switch_controller.decision_memo_stale, 1)
+
+    def test_decision_memo_is_bounded(self):
+        for sensed_value in range(3):
+            self.find_best_channel({0: sensed_value, 1: 1, 2: 2, 3: 2})
+        self.assertEqual(self.switch_controller.decision_memo_statistics()["entries"], 2)
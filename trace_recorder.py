@@ -0,0 +1,150 @@
+import numpy as np
+import os
+import tempfile
+import unittest
+
+'''Trace Verbosity Levels'''
+TRACE_OFF = 0
+TRACE_DECISIONS = 1
+TRACE_FULL = 2
+
+'''Decision Types'''
+IMMEDIATE_SWITCH = 0
+SMART_STAY = 1
+SMART_SWITCH = 2
+RANDOM_SMART_SWITCH = 3
+
+
+def trace_record_dtype(number_of_radio_units, verbosity):
+    """ Layout of one binary trace record, TRACE_FULL adds every radio unit's sensing channel """
+    fields = [("tick", np.int64), ("decision_type", np.int8), ("chosen_channel", np.int32), ("cache_size", np.int32)]
+    if verbosity >= TRACE_FULL:
+        fields.append(("sensing_channels", np.int32, (number_of_radio_units,)))
+    return np.dtype(fields)
+
+
+def read_binary_trace(path, number_of_radio_units, verbosity=TRACE_DECISIONS):
+    return np.fromfile(path, dtype=trace_record_dtype(number_of_radio_units, verbosity))
+
+
+class TraceRecorder:
+    def __init__(self, path, number_of_radio_units, verbosity=TRACE_DECISIONS, sampling_interval=1, buffer_size=65536, binary=False):
+        """ Records one row per sampled tick into preallocated column arrays, written to path in bulk when full.
+        TRACE_DECISIONS keeps tick, decision type, chosen channel and cache size, TRACE_FULL adds all sensing channels.
+        Only every sampling_interval-th tick is kept. Rows are written as CSV, or as packed records when binary """
+        self.path = path
+        self.number_of_radio_units = number_of_radio_units
+        self.verbosity = verbosity
+        self.sampling_interval = sampling_interval
+        self.buffer_size = buffer_size
+        self.binary = binary
+        self.tick = 0
+        self.buffered_rows = 0
+        self.random_switch_marked = False
+
+        self.ticks = np.zeros(buffer_size, dtype=np.int64)
+        self.decision_types = np.zeros(buffer_size, dtype=np.int8)
+        self.chosen_channels = np.zeros(buffer_size, dtype=np.int32)
+        self.cache_sizes = np.zeros(buffer_size, dtype=np.int32)
+        if verbosity >= TRACE_FULL:
+            self.sensing_channels = np.zeros((buffer_size, number_of_radio_units), dtype=np.int32)
+
+        self.trace_file = open(path, "wb" if binary else "w")
+        if not binary:
+            self.trace_file.write(",".join(self.__csv_columns()) + "\n")
+
+    def __csv_columns(self):
+        columns = ["tick", "decision_type", "chosen_channel", "cache_size"]
+        if self.verbosity >= TRACE_FULL:
+            columns += ["sensing_channel_%d" % radio_unit for radio_unit in range(self.number_of_radio_units)]
+        return columns
+
+    def mark_random_switch(self):
+        """ Called by SwitchController, the current tick's smart switch is recorded as RANDOM_SMART_SWITCH """
+        self.random_switch_marked = True
+
+    def record_tick(self, decision_type, radio_units, monitored_radio_unit, cache_size):
+        """ Called by CoopController once per tick after switching """
+        if decision_type == SMART_SWITCH and self.random_switch_marked:
+            decision_type = RANDOM_SMART_SWITCH
+        self.random_switch_marked = False
+        tick = self.tick
+        self.tick += 1
+        if self.verbosity == TRACE_OFF or tick % self.sampling_interval != 0:
+            return
+
+        row = self.buffered_rows
+        self.ticks[row] = tick
+        self.decision_types[row] = decision_type
+        self.chosen_channels[row] = radio_units[monitored_radio_unit].sensing_channel
+        self.cache_sizes[row] = cache_size
+        if self.verbosity >= TRACE_FULL:
+            for radio_unit_index, radio_unit in enumerate(radio_units):
+                self.sensing_channels[row, radio_unit_index] = radio_unit.sensing_channel
+        self.buffered_rows += 1
+        if self.buffered_rows == self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        rows = self.buffered_rows
+        if rows == 0:
+            return
+        if self.binary:
+            records = np.empty(rows, dtype=trace_record_dtype(self.number_of_radio_units, self.verbosity))
+            records["tick"] = self.ticks[:rows]
+            records["decision_type"] = self.decision_types[:rows]
+            records["chosen_channel"] = self.chosen_channels[:rows]
+            records["cache_size"] = self.cache_sizes[:rows]
+            if self.verbosity >= TRACE_FULL:
+                records["sensing_channels"] = self.sensing_channels[:rows]
+            records.tofile(self.trace_file)
+        else:
+            columns = [self.ticks[:rows], self.decision_types[:rows], self.chosen_channels[:rows], self.cache_sizes[:rows]]
+            if self.verbosity >= TRACE_FULL:
+                columns += list(self.sensing_channels[:rows].T)
+            np.savetxt(self.trace_file, np.column_stack(columns), fmt="%d", delimiter=",")
+        self.buffered_rows = 0
+
+    def close(self):
+        self.flush()
+        self.trace_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TestTraceRecorder(unittest.TestCase):
+    class RadioUnitStub:
+        def __init__(self, sensing_channel):
+            self.sensing_channel = sensing_channel
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.radio_units = [self.RadioUnitStub(3), self.RadioUnitStub(5)]
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_csv_trace_with_sampling(self):
+        path = os.path.join(self.temporary_directory.name, "trace.csv")
+        with TraceRecorder(path, 2, verbosity=TRACE_FULL, sampling_interval=2, buffer_size=3) as trace_recorder:
+            for tick in range(10):
+                trace_recorder.record_tick(SMART_SWITCH, self.radio_units, 0, tick)
+        trace = np.loadtxt(path, delimiter=",", skiprows=1, dtype=np.int64)
+        self.assertEqual(list(trace[:, 0]), [0, 2, 4, 6, 8])
+        self.assertEqual(list(trace[1]), [2, SMART_SWITCH, 3, 2, 3, 5])
+
+    def test_binary_trace_marks_random_switch(self):
+        path = os.path.join(self.temporary_directory.name, "trace.bin")
+        with TraceRecorder(path, 2, binary=True, buffer_size=2) as trace_recorder:
+            trace_recorder.record_tick(IMMEDIATE_SWITCH, self.radio_units, 1, 1)
+            trace_recorder.mark_random_switch()
+            trace_recorder.record_tick(SMART_SWITCH, self.radio_units, 0, 2)
+            trace_recorder.record_tick(SMART_SWITCH, self.radio_units, 0, 3)
+        trace = read_binary_trace(path, 2)
+        self.assertEqual(list(trace["decision_type"]), [IMMEDIATE_SWITCH, RANDOM_SMART_SWITCH, SMART_SWITCH])
+        self.assertEqual(list(trace["chosen_channel"]), [5, 3, 3])
+        self.assertEqual(list(trace["cache_size"]), [1, 2, 3])
@@ -1,6 +1,14 @@
+import math
 import random
+import numpy as np
+import unittest
+
+'''Channel Occupancy Constants'''
+EMPTY = 0
+OCCUPIED = 1
 
 TRAFFIC_LENGTH = 10000
+GENERATION_CHUNK_LENGTH = 1 << 20
 
 def create_random_channel_traffic(traffic_length):
     traffic = []
@@ -76,3 +84,247 @@ def create_set_of_channel_traffics_where_half_the_channels_change_bias_at_random
 
     channels_with_traffic = beginning_biased_zero_traffic + beginning_biased_one_traffic
     return channels_with_traffic
+
+
+def occupancy_probability(mean, std_dev):
+    """ Probability that random.gauss(mean, std_dev) >= 0.5, i.e that create_channel_traffic emits a 1 """
+    return 0.5 * math.erfc((0.5 - mean) / (std_dev * math.sqrt(2)))
+
+
+def create_channel_traffic_array(random_generator, channel_means, traffic_length, std_dev=0.5, flip_means=None, flip_mask=None):
+    """ Vectorized create_channel_traffic for several channels at once, returns int8 array (channels, traffic_length).
+    Samples are drawn as Bernoulli(occupancy_probability(mean)) which has the same distribution as thresholding a gauss.
+    Where flip_mask (channels, traffic_length) is set, the channel's flip_means entry is used instead of channel_means """
+    channel_means = np.asarray(channel_means, dtype=np.float64)
+    probabilities = np.array([occupancy_probability(mean, std_dev) for mean in channel_means], dtype=np.float32)
+    if flip_means is not None:
+        flip_probabilities = np.array([occupancy_probability(mean, std_dev) for mean in flip_means], dtype=np.float32)
+    traffic = np.empty((len(channel_means), traffic_length), dtype=np.int8)
+    for start in range(0, traffic_length, GENERATION_CHUNK_LENGTH):
+        end = min(start + GENERATION_CHUNK_LENGTH, traffic_length)
+        chunk_probabilities = probabilities[:, None]
+        if flip_mask is not None:
+            chunk_probabilities = np.where(flip_mask[:, start:end], flip_probabilities[:, None], chunk_probabilities)
+        uniform_samples = random_generator.random((len(channel_means), end - start), dtype=np.float32)
+        traffic[:, start:end] = uniform_samples < chunk_probabilities
+    return traffic
+
+
+def create_channel_traffics_array_with_fixed_biases(bias_zero, bias_one, number_of_biased_zero_channels, number_of_biased_one_channels, traffic_length=TRAFFIC_LENGTH, seed=None):
+    """ Vectorized create_set_of_channel_traffics_with_fixed_biases, seed is an int or numpy.random.Generator """
+    random_generator = np.random.default_rng(seed)
+    channel_means = [bias_zero] * number_of_biased_zero_channels + [bias_one] * number_of_biased_one_channels
+    return create_channel_traffic_array(random_generator, channel_means, traffic_length)
+
+
+def create_channel_traffics_array_with_changing_biases_at_fixed_intervals(bias_zero, bias_one, number_of_biased_zero_channels, number_of_biased_one_channels, switch_traffic_bias_interval, traffic_length=TRAFFIC_LENGTH, seed=None):
+    """ Vectorized create_set_of_channel_traffics_with_changing_biases_at_fixed_intervals.
+    Every channel starts on the opposite bias and alternates every switch_traffic_bias_interval steps.
+    Unlike the list version, intervals are exactly switch_traffic_bias_interval long and the traffic keeps traffic_length """
+    random_generator = np.random.default_rng(seed)
+    channel_means = [bias_zero] * number_of_biased_zero_channels + [bias_one] * number_of_biased_one_channels
+    flip_means = [bias_one] * number_of_biased_zero_channels + [bias_zero] * number_of_biased_one_channels
+    flipped_steps = (np.arange(traffic_length) // switch_traffic_bias_interval) % 2 == 0
+    flip_mask = np.broadcast_to(flipped_steps, (len(channel_means), traffic_length))
+    return create_channel_traffic_array(random_generator, channel_means, traffic_length, flip_means=flip_means, flip_mask=flip_mask)
+
+
+def create_channel_traffics_array_where_half_the_channels_change_bias_at_random_intervals(bias_zero, bias_one, number_of_biased_zero_channels, number_of_biased_one_channels, traffic_length=TRAFFIC_LENGTH, seed=None):
+    """ Vectorized create_set_of_channel_traffics_where_half_the_channels_change_bias_at_random_intervals.
+    At every step a zero biased channel starts, with probability 1/2, an interval of random length in [0, traffic_length/4]
+    that is regenerated with bias_one if it ends inside the traffic. Interval coverage is found with a difference array """
+    random_generator = np.random.default_rng(seed)
+    number_of_channels = number_of_biased_zero_channels + number_of_biased_one_channels
+    channel_means = [bias_zero] * number_of_biased_zero_channels + [bias_one] * number_of_biased_one_channels
+    flip_mask = np.zeros((number_of_channels, traffic_length), dtype=bool)
+    steps = np.arange(traffic_length)
+    for channel in range(number_of_biased_zero_channels):
+        interval_started = random_generator.integers(0, 2, traffic_length) == 1
+        interval_lengths = random_generator.integers(0, int(traffic_length/4) + 1, traffic_length)
+        interval_ends = steps + interval_lengths
+        valid_intervals = interval_started & (interval_ends < traffic_length) & (interval_lengths > 0)
+        interval_boundaries = np.bincount(steps[valid_intervals], minlength=traffic_length + 1) - \
+            np.bincount(interval_ends[valid_intervals], minlength=traffic_length + 1)
+        flip_mask[channel] = np.cumsum(interval_boundaries[:traffic_length]) > 0
+    flip_means = [bias_one] * number_of_channels
+    return create_channel_traffic_array(random_generator, channel_means, traffic_length, flip_means=flip_means, flip_mask=flip_mask)
+
+
+def _fill_markov_runs(random_generator, states, state, remaining_run, leave_probabilities):
+    """ Fills states with a Markov chain that stays in a state for geometric(leave_probabilities[state]) steps,
+    then moves to a uniformly chosen other state. It starts with remaining_run steps of state left.
+    Whole runs are drawn at once and expanded with np.repeat. Returns the final (state, remaining_run) to continue from.
+    A single state has no other state to move to and is never left """
+    number_of_states = len(leave_probabilities)
+    length = len(states)
+    if number_of_states == 1:
+        states[:] = state
+        return state, remaining_run
+    position = min(remaining_run, length)
+    states[:position] = state
+    remaining_run -= position
+    while position < length:
+        number_of_runs = int((length - position) * float(np.mean(leave_probabilities))) * 2 + 16
+        run_states = (state + np.cumsum(random_generator.integers(1, number_of_states, number_of_runs))) % number_of_states
+        run_lengths = random_generator.geometric(leave_probabilities[run_states])
+        run_ends = np.cumsum(run_lengths)
+        used_runs = min(int(np.searchsorted(run_ends, length - position)) + 1, number_of_runs)
+        filled = min(int(run_ends[used_runs - 1]), length - position)
+        run_lengths = run_lengths[:used_runs]
+        run_lengths[-1] -= run_ends[used_runs - 1] - filled
+        states[position:position + filled] = np.repeat(run_states[:used_runs], run_lengths)
+        position += filled
+        state = run_states[used_runs - 1]
+        remaining_run = int(run_ends[used_runs - 1]) - filled
+    return state, remaining_run
+
+
+def markov_modulated_traffic_chunks(occupied_to_empty_probabilities, empty_to_occupied_probabilities, traffic_length, chunk_length=GENERATION_CHUNK_LENGTH, seed=None):
+    """ Bursty ON/OFF traffic, each channel is a two state Markov chain that leaves OCCUPIED with
+    occupied_to_empty_probabilities[channel] per step and EMPTY with empty_to_occupied_probabilities[channel].
+    Channels start from their stationary distribution.
+    Yields int8 time major (chunk_length, channels) chunks, the last one shorter, e.g for ChunkedTrafficSource """
+    random_generator = np.random.default_rng(seed)
+    occupied_to_empty_probabilities = np.asarray(occupied_to_empty_probabilities, dtype=np.float64)
+    empty_to_occupied_probabilities = np.asarray(empty_to_occupied_probabilities, dtype=np.float64)
+    number_of_channels = len(occupied_to_empty_probabilities)
+    leave_probabilities = np.stack([empty_to_occupied_probabilities, occupied_to_empty_probabilities], axis=1)
+    occupied_probabilities = empty_to_occupied_probabilities / (empty_to_occupied_probabilities + occupied_to_empty_probabilities)
+    channel_states = (random_generator.random(number_of_channels) < occupied_probabilities).astype(np.int64)
+    remaining_runs = random_generator.geometric(leave_probabilities[np.arange(number_of_channels), channel_states])
+
+    for start in range(0, traffic_length, chunk_length):
+        chunk = np.empty((number_of_channels, min(chunk_length, traffic_length - start)), dtype=np.int8)
+        for channel in range(number_of_channels):
+            channel_states[channel], remaining_runs[channel] = _fill_markov_runs(
+                random_generator, chunk[channel], channel_states[channel], remaining_runs[channel],
+                leave_probabilities[channel])
+        yield np.ascontiguousarray(chunk.T)
+
+
+def regime_correlated_traffic_chunks(regime_occupancy_probabilities, regime_switch_probability, traffic_length, chunk_length=GENERATION_CHUNK_LENGTH, seed=None):
+    """ Cross channel correlated traffic, one hidden regime shared by every channel leaves its regime with
+    regime_switch_probability per step for a uniformly chosen other regime.
+    Given the regime each channel is OCCUPIED independently with regime_occupancy_probabilities[regime, channel].
+    Yields int8 time major (chunk_length, channels) chunks, the last one shorter, e.g for ChunkedTrafficSource """
+    random_generator = np.random.default_rng(seed)
+    regime_occupancy_probabilities = np.asarray(regime_occupancy_probabilities, dtype=np.float32)
+    number_of_regimes, number_of_channels = regime_occupancy_probabilities.shape
+    leave_probabilities = np.full(number_of_regimes, regime_switch_probability)
+    regime = int(random_generator.integers(0, number_of_regimes))
+    remaining_run = int(random_generator.geometric(regime_switch_probability))
+
+    for start in range(0, traffic_length, chunk_length):
+        regimes = np.empty(min(chunk_length, traffic_length - start), dtype=np.int64)
+        regime, remaining_run = _fill_markov_runs(random_generator, regimes, regime, remaining_run, leave_probabilities)
+        uniform_samples = random_generator.random((len(regimes), number_of_channels), dtype=np.float32)
+        yield (uniform_samples < regime_occupancy_probabilities[regimes]).astype(np.int8)
+
+
+class TestTrafficArrayBuilders(unittest.TestCase):
+    def setUp(self):
+        # biases far outside [0, 1] make the traffic deterministic, zero biased channels all 0 and one biased all 1
+        self.deterministic_biases = (-10, 10)
+
+    def test_dtype_shape_and_seed(self):
+        builders = [lambda seed: create_channel_traffics_array_with_fixed_biases(0.1, 0.9, 3, 2, 500, seed=seed),
+                    lambda seed: create_channel_traffics_array_with_changing_biases_at_fixed_intervals(
+                        0.1, 0.9, 3, 2, 10, 500, seed=seed),
+                    lambda seed: create_channel_traffics_array_where_half_the_channels_change_bias_at_random_intervals(
+                        0.1, 0.9, 3, 2, 500, seed=seed)]
+        for builder in builders:
+            traffic = builder(1)
+            self.assertEqual(traffic.dtype, np.int8)
+            self.assertEqual(traffic.shape, (5, 500))
+            np.testing.assert_array_equal(traffic, builder(1))
+            self.assertFalse(np.array_equal(traffic, builder(2)))
+
+    def test_occupancy_matches_occupancy_probability(self):
+        random.seed(0)
+        self.assertAlmostEqual(np.mean(create_channel_traffic(20000, 0.1, 0.5)), occupancy_probability(0.1, 0.5), delta=0.015)
+        traffic = create_channel_traffics_array_with_fixed_biases(0.1, 0.9, 2, 2, 20000, seed=0)
+        for channel, bias in enumerate([0.1, 0.1, 0.9, 0.9]):
+            self.assertAlmostEqual(traffic[channel].mean(), occupancy_probability(bias, 0.5), delta=0.015)
+
+    def test_fixed_intervals_flip_pattern_matches_list_version(self):
+        random.seed(0)
+        list_traffic = np.array(create_set_of_channel_traffics_with_changing_biases_at_fixed_intervals(
+            *self.deterministic_biases, 2, 1, 5, 60))
+        traffic = create_channel_traffics_array_with_changing_biases_at_fixed_intervals(
+            *self.deterministic_biases, 2, 1, 5, 60, seed=0)
+        # the list version loses a step per interval, the array version keeps traffic_length
+        np.testing.assert_array_equal(traffic[:, :list_traffic.shape[1]], list_traffic)
+        np.testing.assert_array_equal(traffic[0, :20], [1] * 5 + [0] * 5 + [1] * 5 + [0] * 5)
+
+    def test_random_interval_coverage_matches_list_version(self):
+        for seed in range(3):
+            random.seed(seed)
+            list_traffic = np.array(create_set_of_channel_traffics_where_half_the_channels_change_bias_at_random_intervals(
+                *self.deterministic_biases, 2, 1, 1000))
+            traffic = create_channel_traffics_array_where_half_the_channels_change_bias_at_random_intervals(
+                *self.deterministic_biases, 2, 1, 1000, seed=seed)
+            self.assertTrue(np.all(traffic[2] == 1))
+            self.assertAlmostEqual(traffic[:2].mean(), list_traffic[:2].mean(), delta=0.02)
+
+
+class TestStreamedTrafficGenerators(unittest.TestCase):
+    def concatenated_chunks(self, traffic_chunks):
+        return np.concatenate(list(traffic_chunks))
+
+    def run_lengths(self, channel_traffic, value):
+        # lengths of the runs of value that start and end inside channel_traffic
+        boundaries = np.flatnonzero(np.diff(channel_traffic)) + 1
+        runs = np.split(channel_traffic, boundaries)[1:-1]
+        return [len(run) for run in runs if run[0] == value]
+
+    def test_seed_reproducibility(self):
+        generators = [lambda seed: markov_modulated_traffic_chunks([0.1, 0.3], [0.05, 0.2], 500, chunk_length=64, seed=seed),
+                      lambda seed: regime_correlated_traffic_chunks([[0.1, 0.9], [0.9, 0.1]], 0.05, 500, chunk_length=64, seed=seed)]
+        for generator in generators:
+            traffic = self.concatenated_chunks(generator(1))
+            self.assertEqual(traffic.dtype, np.int8)
+            self.assertEqual(traffic.shape, (500, 2))
+            np.testing.assert_array_equal(traffic, self.concatenated_chunks(generator(1)))
+            self.assertFalse(np.array_equal(traffic, self.concatenated_chunks(generator(2))))
+
+    def test_chains_continue_across_chunk_boundaries(self):
+        # leaving every step alternates the states, so any restart at an odd length chunk boundary would show
+        traffic = self.concatenated_chunks(markov_modulated_traffic_chunks([1, 1], [1, 1], 100, chunk_length=7, seed=0))
+        self.assertEqual([len(chunk) for chunk in markov_modulated_traffic_chunks([1], [1], 100, chunk_length=7)],
+                         [7] * 14 + [2])
+        self.assertTrue(np.all(np.diff(traffic, axis=0) != 0))
+        traffic = self.concatenated_chunks(regime_correlated_traffic_chunks([[0, 0], [1, 1]], 1, 100, chunk_length=7, seed=0))
+        self.assertTrue(np.all(np.diff(traffic, axis=0) != 0))
+        # runs of remaining_run steps carry over, chunk lengths don't change the burst lengths
+        for chunk_length in (5, 10000):
+            traffic = self.concatenated_chunks(markov_modulated_traffic_chunks(
+                [0.1], [0.1], 100000, chunk_length=chunk_length, seed=chunk_length))
+            self.assertAlmostEqual(np.mean(self.run_lengths(traffic[:, 0], OCCUPIED)), 10, delta=0.5)
+
+    def test_markov_modulated_occupancy_and_burst_lengths(self):
+        occupied_to_empty_probabilities, empty_to_occupied_probabilities = [0.1, 0.5], [0.05, 0.5]
+        traffic = self.concatenated_chunks(markov_modulated_traffic_chunks(
+            occupied_to_empty_probabilities, empty_to_occupied_probabilities, 200000, seed=3))
+        for channel, (occupied_to_empty, empty_to_occupied) in enumerate(
+                zip(occupied_to_empty_probabilities, empty_to_occupied_probabilities)):
+            self.assertAlmostEqual(traffic[:, channel].mean(), empty_to_occupied / (empty_to_occupied + occupied_to_empty),
+                                   delta=0.02)
+            self.assertAlmostEqual(np.mean(self.run_lengths(traffic[:, channel], OCCUPIED)), 1 / occupied_to_empty,
+                                   delta=0.05 / occupied_to_empty)
+            self.assertAlmostEqual(np.mean(self.run_lengths(traffic[:, channel], EMPTY)), 1 / empty_to_occupied,
+                                   delta=0.05 / empty_to_occupied)
+
+    def test_regime_correlated_occupancy_per_regime(self):
+        # the last channel is OCCUPIED exactly in regime 1 and so reveals the hidden regime
+        regime_occupancy_probabilities = [[0.2, 0.7, 0], [0.9, 0.1, 1]]
+        traffic = self.concatenated_chunks(regime_correlated_traffic_chunks(regime_occupancy_probabilities, 0.01, 100000, seed=4))
+        regimes = traffic[:, 2]
+        self.assertAlmostEqual(regimes.mean(), 0.5, delta=0.1)
+        self.assertAlmostEqual(np.mean(self.run_lengths(regimes, OCCUPIED)), 100, delta=15)
+        for regime, occupancy_probabilities in enumerate(regime_occupancy_probabilities):
+            np.testing.assert_allclose(traffic[regimes == regime, :2].mean(axis=0), occupancy_probabilities[:2], atol=0.02)
+
+    def test_single_regime(self):
+        traffic = self.concatenated_chunks(regime_correlated_traffic_chunks([[0.3, 1]], 0.01, 5000, chunk_length=64, seed=5))
+        self.assertTrue(np.all(traffic[:, 1] == 1))
+        self.assertAlmostEqual(traffic[:, 0].mean(), 0.3, delta=0.03)
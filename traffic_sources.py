@@ -0,0 +1,125 @@
+import numpy as np
+import os
+import tempfile
+import unittest
+from abc import ABC, abstractmethod
+
+
+class TrafficSource(ABC):
+    """ Time major traffic that AirTrafficData pulls from one step at a time.
+    Implementations set number_of_channels and number_of_timesteps and return the (channels,) row for a step """
+    number_of_channels = 0
+    number_of_timesteps = 0
+
+    @abstractmethod
+    def get_traffic_at(self, time_step):
+        pass
+
+
+class InMemoryTrafficSource(TrafficSource):
+    def __init__(self, traffic_data):
+        """ Traffic data expected in shape of (channels, traffic_length), stored transposed and contiguous """
+        self.number_of_channels = len(traffic_data)
+        self.number_of_timesteps = len(traffic_data[0])
+        self.traffic_data = np.ascontiguousarray(np.asarray(traffic_data).T)
+
+    def get_traffic_at(self, time_step):
+        return self.traffic_data[time_step]
+
+
+class MemoryMappedTrafficSource(TrafficSource):
+    def __init__(self, path, number_of_channels=None, dtype=np.int8):
+        """ Reads a time major (traffic_length, channels) trace from disk through a read only memory map.
+        .npy files carry their own shape, raw files need number_of_channels """
+        if path.endswith(".npy"):
+            self.traffic_data = np.load(path, mmap_mode="r")
+        else:
+            assert(number_of_channels is not None)
+            self.traffic_data = np.memmap(path, dtype=dtype, mode="r").reshape(-1, number_of_channels)
+        self.number_of_timesteps, self.number_of_channels = self.traffic_data.shape
+
+    def get_traffic_at(self, time_step):
+        return self.traffic_data[time_step]
+
+
+class ChunkedTrafficSource(TrafficSource):
+    def __init__(self, traffic_chunks, number_of_channels, number_of_timesteps):
+        """ Consumes an iterable of time major (chunk_length, channels) arrays, only the current chunk is held.
+        Steps must be read in increasing order """
+        self.traffic_chunks = iter(traffic_chunks)
+        self.number_of_channels = number_of_channels
+        self.number_of_timesteps = number_of_timesteps
+        self.current_chunk = np.empty((0, number_of_channels), dtype=np.int8)
+        self.current_chunk_start = 0
+
+    def get_traffic_at(self, time_step):
+        if time_step < self.current_chunk_start:
+            raise ValueError("ChunkedTrafficSource can't go back to step %d" % time_step)
+        while time_step >= self.current_chunk_start + len(self.current_chunk):
+            self.current_chunk_start += len(self.current_chunk)
+            try:
+                self.current_chunk = next(self.traffic_chunks)
+            except StopIteration:
+                raise IndexError("No traffic for step %d" % time_step)
+        return self.current_chunk[time_step - self.current_chunk_start]
+
+
+def write_time_major_traffic(traffic_data, path, chunk_length=1 << 20):
+    """ Writes (channels, traffic_length) traffic as a time major int8 .npy file, or raw int8 for any other extension,
+    chunk by chunk so the transposed copy is never fully in memory """
+    traffic_data = np.asarray(traffic_data)
+    number_of_channels = len(traffic_data)
+    number_of_timesteps = len(traffic_data[0])
+    if path.endswith(".npy"):
+        traffic_file = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.int8, shape=(number_of_timesteps, number_of_channels))
+    else:
+        traffic_file = np.memmap(path, dtype=np.int8, mode="w+", shape=(number_of_timesteps, number_of_channels))
+    for start in range(0, number_of_timesteps, chunk_length):
+        end = min(start + chunk_length, number_of_timesteps)
+        traffic_file[start:end] = traffic_data[:, start:end].T
+    traffic_file.flush()
+    del traffic_file
+
+
+class TestTrafficSources(unittest.TestCase):
+    def setUp(self):
+        self.traffic = np.array([[1, 0, 0, 1, 0], [0, 0, 1, 1, 1], [1, 1, 0, 0, 0]], dtype=np.int8)
+        self.temporary_directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def assert_source_matches_traffic(self, traffic_source):
+        self.assertEqual(traffic_source.number_of_channels, 3)
+        self.assertEqual(traffic_source.number_of_timesteps, 5)
+        for time_step in range(5):
+            self.assertEqual(list(traffic_source.get_traffic_at(time_step)), list(self.traffic[:, time_step]))
+
+    def test_in_memory_traffic_source(self):
+        self.assert_source_matches_traffic(InMemoryTrafficSource(self.traffic.tolist()))
+
+    def test_memory_mapped_npy_traffic_source(self):
+        path = os.path.join(self.temporary_directory.name, "traffic.npy")
+        write_time_major_traffic(self.traffic, path, chunk_length=2)
+        self.assert_source_matches_traffic(MemoryMappedTrafficSource(path))
+
+    def test_memory_mapped_raw_traffic_source(self):
+        path = os.path.join(self.temporary_directory.name, "traffic.bin")
+        write_time_major_traffic(self.traffic, path, chunk_length=2)
+        self.assert_source_matches_traffic(MemoryMappedTrafficSource(path, number_of_channels=3))
+
+    def test_chunked_traffic_source(self):
+        traffic_chunks = (self.traffic.T[start:start + 2] for start in range(0, 5, 2))
+        traffic_source = ChunkedTrafficSource(traffic_chunks, number_of_channels=3, number_of_timesteps=5)
+        self.assert_source_matches_traffic(traffic_source)
+        with self.assertRaises(ValueError):
+            traffic_source.get_traffic_at(0)
+
+    def test_incomplete_source_fails_on_construction(self):
+        class IncompleteTrafficSource(TrafficSource):
+            number_of_channels = 3
+            number_of_timesteps = 5
+
+        with self.assertRaises(TypeError):
+            IncompleteTrafficSource()
@@ -0,0 +1,196 @@
+import numpy as np
+import unittest
+
+'''Channel Occupancy Constants'''
+EMPTY = 0
+OCCUPIED = 1
+UNKNOWN = 2
+
+
+class JointStateTransitionIndex:
+    def __init__(self, number_of_channels):
+        """ Maps each full joint channel state (sensed values plus UNKNOWN) seen in the cache
+        to the number of rows holding it and, per channel, how often the following row was EMPTY.
+        Kept up to date by ChannelCaches on every append, eviction and flush """
+        self.number_of_channels = number_of_channels
+        self.clear()
+
+    def clear(self):
+        self.state_counts = {}
+        self.next_step_empty_counts_by_state = {}
+        self.latest_state_key = None
+
+    def state_key(self, cache_row):
+        return np.asarray(cache_row, dtype=np.int8).tobytes()
+
+    def joint_state_key(self, joint_channel_value_map):
+        """ Returns None if the map does not cover every channel, such partial maps can't be looked up.
+        A joint state vector, int8 with UNKNOWN for unsensed channels, is used as is """
+        if isinstance(joint_channel_value_map, np.ndarray):
+            return joint_channel_value_map.astype(np.int8, copy=False).tobytes()
+        if len(joint_channel_value_map) != self.number_of_channels:
+            return None
+        cache_row = np.empty(self.number_of_channels, dtype=np.int8)
+        for channel, value in joint_channel_value_map.items():
+            if not 0 <= channel < self.number_of_channels:
+                return None
+            cache_row[channel] = value
+        return cache_row.tobytes()
+
+    def add_row(self, cache_row):
+        """ Records cache_row as the newest row, and the transition from the previous newest row into it """
+        new_state_key = self.state_key(cache_row)
+        if self.latest_state_key is not None:
+            self.__add_transition(self.latest_state_key, cache_row, 1)
+        self.state_counts[new_state_key] = self.state_counts.get(new_state_key, 0) + 1
+        self.latest_state_key = new_state_key
+
+    def add_rows(self, cache_rows):
+        """ add_row for every (rows, channels) cache row in order, grouping the rows by state with one dict pass
+        and summing every state's next step EMPTY counts with one cumulative sum, e.g to rebuild the index of restored rows """
+        cache_rows = np.ascontiguousarray(cache_rows, dtype=np.int8)
+        number_of_rows = len(cache_rows)
+        if number_of_rows == 0:
+            return
+        if self.latest_state_key is not None:
+            self.__add_transition(self.latest_state_key, cache_rows[0], 1)
+        rows_bytes = cache_rows.tobytes()
+        row_length = self.number_of_channels
+        state_keys = {}
+        state_indexes = np.fromiter(
+            (state_keys.setdefault(rows_bytes[start:start + row_length], len(state_keys))
+             for start in range(0, number_of_rows * row_length, row_length)), dtype=np.int64, count=number_of_rows)
+        state_counts = np.bincount(state_indexes, minlength=len(state_keys))
+        # sort the transitions by their from state, and sum each state's run of next rows as a cumulative sum difference
+        transition_order = np.argsort(state_indexes[:-1], kind="stable")
+        transition_states, group_starts = np.unique(state_indexes[:-1][transition_order], return_index=True)
+        next_step_empty = (cache_rows[1:][transition_order] == EMPTY).astype(np.int64)
+        if len(transition_states) == number_of_rows - 1:
+            next_step_empty_counts = next_step_empty
+        else:
+            cumulative_empty_counts = np.zeros((number_of_rows, row_length), dtype=np.int64)
+            np.cumsum(next_step_empty, axis=0, out=cumulative_empty_counts[1:])
+            group_ends = np.append(group_starts[1:], number_of_rows - 1)
+            next_step_empty_counts = cumulative_empty_counts[group_ends] - cumulative_empty_counts[group_starts]
+        state_key_list = list(state_keys)
+        transition_state_keys = map(state_key_list.__getitem__, transition_states.tolist())
+        if not self.state_counts:
+            self.state_counts = dict(zip(state_key_list, state_counts.tolist()))
+            self.next_step_empty_counts_by_state = dict(zip(transition_state_keys, next_step_empty_counts))
+        else:
+            for state_key, state_count in zip(state_key_list, state_counts.tolist()):
+                self.state_counts[state_key] = self.state_counts.get(state_key, 0) + state_count
+            for state_key, state_next_step_empty_counts in zip(transition_state_keys, next_step_empty_counts):
+                existing_counts = self.next_step_empty_counts_by_state.get(state_key)
+                if existing_counts is None:
+                    self.next_step_empty_counts_by_state[state_key] = state_next_step_empty_counts
+                else:
+                    existing_counts += state_next_step_empty_counts
+        self.latest_state_key = state_key_list[state_indexes[-1]]
+
+    def remove_oldest_row(self, oldest_cache_row, next_cache_row):
+        """ Forgets the oldest row, next_cache_row is the row after it or None if it was the only row """
+        oldest_state_key = self.state_key(oldest_cache_row)
+        if next_cache_row is not None:
+            self.__add_transition(oldest_state_key, next_cache_row, -1)
+        else:
+            self.latest_state_key = None
+        remaining_rows = self.state_counts[oldest_state_key] - 1
+        if remaining_rows == 0:
+            del self.state_counts[oldest_state_key]
+            # the only row has no transition out of it
+            self.next_step_empty_counts_by_state.pop(oldest_state_key, None)
+        else:
+            self.state_counts[oldest_state_key] = remaining_rows
+
+    def __add_transition(self, state_key, next_cache_row, step):
+        next_step_empty_counts = self.next_step_empty_counts_by_state.get(state_key)
+        if next_step_empty_counts is None:
+            next_step_empty_counts = np.zeros(self.number_of_channels, dtype=np.int64)
+            self.next_step_empty_counts_by_state[state_key] = next_step_empty_counts
+        next_step_empty_counts += step * (np.asarray(next_cache_row) == EMPTY)
+
+    def next_step_empty_counts(self, joint_channel_value_map):
+        """ Returns (number of cache rows matching the joint map, per channel count of EMPTY in the row after a match)
+        or None if the joint map is partial """
+        state_key = self.joint_state_key(joint_channel_value_map)
+        if state_key is None:
+            return None
+        matching_rows = self.state_counts.get(state_key, 0)
+        if matching_rows == 0:
+            return 0, np.zeros(self.number_of_channels, dtype=np.int64)
+        next_step_empty_counts = self.next_step_empty_counts_by_state.get(state_key)
+        if next_step_empty_counts is None:
+            next_step_empty_counts = np.zeros(self.number_of_channels, dtype=np.int64)
+        return matching_rows, next_step_empty_counts
+
+
+class StateChangeTracker:
+    def __init__(self, start_generation):
+        """ Remembers, per full joint state, the cache generation at which a transition out of it was added or removed
+        whose next row is EMPTY on a channel the state has UNKNOWN, the only changes that can alter the channel
+        find_best_channel_to_switch_to picks for that state. Appending a row only raises its own state's match count,
+        which scales every probability alike and leaves the choice unchanged.
+        States not marked since tracking started count as changed at start_generation """
+        self.start_generation = start_generation
+        self.state_generations = {}
+
+    def mark_transition(self, cache_row, next_cache_row, generation):
+        cache_row = np.asarray(cache_row, dtype=np.int8)
+        if np.any((np.asarray(next_cache_row) == EMPTY) & (cache_row == UNKNOWN)):
+            self.state_generations[cache_row.tobytes()] = generation
+
+    def state_generation(self, state_key):
+        return self.state_generations.get(state_key, self.start_generation)
+
+
+class TestJointStateTransitionIndex(unittest.TestCase):
+    def setUp(self):
+        self.number_of_channels = 3
+        self.transition_index = JointStateTransitionIndex(self.number_of_channels)
+        self.channel_caches = [[1, 0, 1], [0, 0, 1], [0, 1, 0], [1, 0, 1]]
+        for cache_row in self.channel_caches:
+            self.transition_index.add_row(cache_row)
+
+    def test_next_step_empty_counts(self):
+        matching_rows, next_step_empty_counts = self.transition_index.next_step_empty_counts({0: 1, 1: 0, 2: 1})
+        # [1, 0, 1] is matched twice, only the first has a next row [0, 0, 1]
+        self.assertEqual(matching_rows, 2)
+        self.assertEqual(list(next_step_empty_counts), [1, 1, 0])
+
+    def test_next_step_empty_counts_partial_map(self):
+        self.assertIsNone(self.transition_index.next_step_empty_counts({1: 0, 2: 1}))
+
+    def test_next_step_empty_counts_no_match(self):
+        matching_rows, next_step_empty_counts = self.transition_index.next_step_empty_counts({0: 2, 1: 2, 2: 2})
+        self.assertEqual(matching_rows, 0)
+        self.assertEqual(list(next_step_empty_counts), [0, 0, 0])
+
+    def test_remove_oldest_row(self):
+        self.transition_index.remove_oldest_row(self.channel_caches[0], self.channel_caches[1])
+        matching_rows, next_step_empty_counts = self.transition_index.next_step_empty_counts({0: 1, 1: 0, 2: 1})
+        self.assertEqual(matching_rows, 1)
+        self.assertEqual(list(next_step_empty_counts), [0, 0, 0])
+
+    def test_add_rows_matches_add_row(self):
+        rows = np.random.default_rng(0).integers(0, 3, (200, self.number_of_channels), dtype=np.int8)
+        for cache_row in rows:
+            self.transition_index.add_row(cache_row)
+        bulk_transition_index = JointStateTransitionIndex(self.number_of_channels)
+        bulk_transition_index.add_rows(np.array(self.channel_caches, dtype=np.int8))
+        bulk_transition_index.add_rows(rows[:0])
+        bulk_transition_index.add_rows(rows)
+        self.assertEqual(bulk_transition_index.state_counts, self.transition_index.state_counts)
+        self.assertEqual(bulk_transition_index.latest_state_key, self.transition_index.latest_state_key)
+        self.assertEqual(bulk_transition_index.next_step_empty_counts_by_state.keys(),
+                         self.transition_index.next_step_empty_counts_by_state.keys())
+        for state_key, counts in self.transition_index.next_step_empty_counts_by_state.items():
+            self.assertEqual(list(bulk_transition_index.next_step_empty_counts_by_state[state_key]), list(counts))
+
+    def test_remove_only_row(self):
+        transition_index = JointStateTransitionIndex(self.number_of_channels)
+        transition_index.add_row([1, 0, 1])
+        transition_index.remove_oldest_row([1, 0, 1], None)
+        self.assertEqual(transition_index.next_step_empty_counts({0: 1, 1: 0, 2: 1})[0], 0)
+        transition_index.add_row([0, 0, 1])
+        self.assertEqual(transition_index.next_step_empty_counts({0: 0, 1: 0, 2: 1})[0], 1)